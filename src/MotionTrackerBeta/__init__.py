@@ -13,4 +13,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from MotionTrackerBeta.main import MotionTracker
\ No newline at end of file
+
+def __getattr__(name):
+    # the GUI is imported on first use, headless scripts don't need PyQt5
+    if name == "MotionTracker":
+        from MotionTrackerBeta.main import MotionTracker
+
+        return MotionTracker
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,336 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import sys
+import os
+import argparse
+import json
+import multiprocessing
+import numpy as np
+import pandas as pd
+import cv2
+
+# Ensure local source code is used instead of installed package
+_src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _src_dir not in sys.path:
+    sys.path.insert(0, _src_dir)
+
+from MotionTrackerBeta.functions.tracking import SectionTracker
+from MotionTrackerBeta.functions.processing import differentiate_all
+from MotionTrackerBeta.classes.cache import DiffCache, ParamStore
+from MotionTrackerBeta.classes.reader import IndexedCapture, KeyframeIndex
+from MotionTrackerBeta.classes.classes import Motion, Rotation
+
+
+def load_jobs(filename):
+    """
+    Reads the jobs from a JSON or YAML file
+
+    :param filename: (str) path of the job file
+    :return: list of job dictionaries
+    """
+    with open(filename, "r") as file:
+        if filename.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("PyYAML is not installed.\nInstall it via pip install pyyaml!")
+            jobs = yaml.safe_load(file)
+        else:
+            jobs = json.load(file)
+
+    # a single job, a list of jobs or a {"jobs": [...]} document
+    if isinstance(jobs, dict):
+        jobs = jobs.get("jobs", [jobs])
+
+    # relative paths are relative to the job file
+    base = os.path.dirname(os.path.abspath(filename))
+    for job in jobs:
+        for key in ("video", "output"):
+            if job.get(key) is not None:
+                job[key] = os.path.join(base, os.path.expanduser(job[key]))
+    return jobs
+
+
+def job_objects(job):
+    """Creates the Motion objects of the job, a 50x50 rectangle is centered on the point if no rectangle is given"""
+    objects = []
+    for i, obj in enumerate(job["objects"]):
+        name = obj.get("name", f"P{i + 1}")
+        point = tuple(obj["point"])
+        if obj.get("rectangle") is None:
+            rectangle = (point[0] - 25, point[1] - 25, 50, 50)
+        else:
+            rectangle = tuple(obj["rectangle"])  # (x, y, w, h)
+        objects.append(Motion(name, point, rectangle, rectangle_visible="rectangle" in obj))
+    return objects
+
+
+def job_parameters(job):
+    """Differentiation parameters of the job in the format of PostProcessSettings.collectParameters, None if not requested"""
+    post = job.get("postprocess")
+    if post is None:
+        return None
+    if post.get("optimize", False):
+        return (True, post["algorithm"], float(post["cutoff"]))
+    if post.get("params") is None:
+        return (False, post["algorithm"], None)
+    return (False, post["algorithm"], list(post["params"]), dict(post.get("options", {})))
+
+
+def run_job(job, workers=1, processes=1, chunks=1, cache=None, param_store=None):
+    """
+    Tracks the objects of the job and differentiates their paths
+
+    :param job: (dict) job description, see load_jobs
+    :param workers: (int) number of threads updating the trackers
+    :param processes: (int) number of processes the objects and the differentiation are shared between
+    :param chunks: (int) number of time chunks tracked in parallel
+    :param cache: (DiffCache) previously calculated differentiation results
+    :param param_store: (ParamStore) previously optimized parameters
+    :return: ret : returns True if the job was successful
+    :return: result : (DataFrame) results of the job, error message on failure
+    """
+    camera = IndexedCapture(job["video"], KeyframeIndex.open(job["video"]))
+    if not camera.isOpened():
+        return False, f"Unable to open video: {job['video']}"
+
+    try:
+        num_of_frames = int(camera.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = job.get("fps") or camera.get(cv2.CAP_PROP_FPS)
+        start, stop = job.get("section", (1, num_of_frames))
+        roi_rect = tuple(job["roi"]) if job.get("roi") is not None else None
+        size = job.get("size", False)
+        objects = job_objects(job)
+
+        # tracking, same code as the GUI
+        last = [None]
+
+        def progress(value):
+            if value // 10 != last[0]:
+                last[0] = value // 10
+                print(f"  tracking {value}%", flush=True)
+
+        engine = SectionTracker(
+            camera,
+            start,
+            stop,
+            job.get("tracker", "CSRT"),
+            size,
+            roi_rect,
+            workers=workers,
+            processes=processes,
+            filename=job["video"],
+            chunks=chunks,
+            downscale=job.get("downscale", 1),
+            stride=job.get("stride", 1),
+            stride_threshold=job.get("stride_threshold", 5.0),
+            progress=progress,
+        )
+        ret, paths = engine.track([(M.point, M.rectangle) for M in objects])
+    finally:
+        camera.release()
+
+    if not ret:
+        return False, paths
+    for M, (rectangle_path, point_path, size_change) in zip(objects, paths):
+        M.rectangle_path = rectangle_path
+        M.point_path = point_path
+        M.size_change = size_change
+
+    # columns of the output
+    timestamp = np.arange(int(stop - start) + 1) / fps
+    columns = {"Time (s)": timestamp}
+    unit = job.get("unit", "pix")
+    mm_per_pix = job.get("mm_per_pix")
+    if unit not in ("pix", "mm", "m"):
+        return False, f"Unknown unit: {unit}"
+    if unit != "pix" and mm_per_pix is None:
+        return False, "mm_per_pix is required for the conversion to " + unit
+
+    def convert(data):
+        """Converts the pixel data to the unit of the job"""
+        if unit == "mm":
+            return data * mm_per_pix
+        elif unit == "m":
+            return data * mm_per_pix / 1000
+        return data
+
+    # rotations between pairs of objects
+    rotations = []
+    for P1_name, P2_name in job.get("rotations", []):
+        P1 = next((M for M in objects if M.name == P1_name), None)
+        P2 = next((M for M in objects if M.name == P2_name), None)
+        if P1 is None or P2 is None:
+            return False, f"Unknown object in rotation: {P1_name} - {P2_name}"
+        R = Rotation(P1, P2)
+        R.calculate()
+        rotations.append(R)
+
+    parameters = job_parameters(job)
+    if parameters is None:
+        # raw paths only
+        for M in objects:
+            columns[f"{M.name} - X ({unit})"] = convert(M.point_path.array[:, 0])
+            columns[f"{M.name} - Y ({unit})"] = convert(-M.point_path.array[:, 1])
+        for R in rotations:
+            columns[f"{R} rotation (rad)"] = R.rotation
+    else:
+        series = []
+        for M in objects:
+            series.append(M.point_path.array[:, 0])
+            series.append(M.point_path.array[:, 1])
+        for R in rotations:
+            series.append(R.rotation)
+
+        ret, results = differentiate_all(
+            series, 1 / fps, parameters, processes, cache, param_store
+        )
+        if not ret:
+            return False, results
+
+        # the Y axis points upwards, as in the GUI export
+        names = ("position", "velocity", "acceleration")
+        units = (unit, unit + "/s", unit + "/s^2")
+        for i, M in enumerate(objects):
+            for k in range(3):
+                columns[f"{M.name} - X {names[k]} ({units[k]})"] = convert(results[2 * i][k])
+                columns[f"{M.name} - Y {names[k]} ({units[k]})"] = convert(-results[2 * i + 1][k])
+        names = ("rotation", "angular velocity", "angular acceleration")
+        units = ("rad", "rad/s", "rad/s^2")
+        for j, R in enumerate(rotations):
+            for k in range(3):
+                columns[f"{R} {names[k]} ({units[k]})"] = results[2 * len(objects) + j][k]
+
+    # size change
+    if size:
+        for M in objects:
+            columns[f"{M.name} size change"] = np.asarray(M.size_change)
+
+    return True, pd.DataFrame(columns)
+
+
+def job_output(job):
+    """Path of the result file of the job"""
+    return job.get("output") or os.path.splitext(job["video"])[0] + "_results.csv"
+
+
+def MotionTrackerBatch(argv=None):
+    """Headless entry point, runs the jobs of the job files and writes the results to CSV files"""
+    parser = argparse.ArgumentParser(
+        prog="motiontracker-batch",
+        description="Tracks objects in videos and differentiates their paths without the graphical user interface.",
+    )
+    parser.add_argument("jobs", nargs="+", help="JSON or YAML job files")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="threads updating the trackers"
+    )
+    parser.add_argument(
+        "--processes", type=int, default=1, help="processes the objects and the differentiation are shared between"
+    )
+    parser.add_argument("--chunks", type=int, default=1, help="time chunks tracked in parallel")
+    parser.add_argument("--cache", help="directory of the persistent differentiation cache")
+    parser.add_argument("--params", help="JSON file of the optimized differentiation parameters")
+    parser.add_argument(
+        "--queue", help="SQLite file of a resumable queue, the jobs run in parallel worker processes"
+    )
+    parser.add_argument(
+        "--cpus", type=int, default=None, help="cores the queued jobs may use at once (default: all)"
+    )
+    parser.add_argument(
+        "--memory", type=float, default=None, help="memory the queued jobs may use at once in MB (default: half of the RAM)"
+    )
+    parser.add_argument("--retry-failed", action="store_true", help="run the failed jobs of the queue again")
+    args = parser.parse_args(argv)
+
+    if args.queue:
+        return run_queue(args)
+
+    cache = DiffCache(directory=args.cache) if args.cache else None
+    param_store = ParamStore(args.params) if args.params else None
+
+    failed = 0
+    for filename in args.jobs:
+        try:
+            jobs = load_jobs(filename)
+        except Exception as e:
+            print(f"Unable to read job file {filename}!\n{e}", file=sys.stderr)
+            failed += 1
+            continue
+
+        for job in jobs:
+            print(f"Processing {job.get('video')}...", flush=True)
+            try:
+                ret, result = run_job(
+                    job, args.workers, args.processes, args.chunks, cache, param_store
+                )
+            except Exception as e:
+                ret, result = False, str(e)
+            if not ret:
+                print(f"  failed: {result}", file=sys.stderr)
+                failed += 1
+                continue
+
+            output = job_output(job)
+            result.to_csv(output, index=False)
+            print(f"  saved {output}", flush=True)
+
+    if param_store is not None:
+        param_store.save()
+    return 1 if failed else 0
+
+
+def run_queue(args):
+    """Adds the jobs to the persistent queue and runs every unfinished job of it"""
+    from MotionTrackerBeta.scheduler import JobQueue, Scheduler
+
+    queue = JobQueue(args.queue)
+    failed = 0
+    for filename in args.jobs:
+        try:
+            jobs = load_jobs(filename)
+        except Exception as e:
+            print(f"Unable to read job file {filename}!\n{e}", file=sys.stderr)
+            failed += 1
+            continue
+        for job in jobs:
+            queue.add(job)
+    if args.retry_failed:
+        queue.retry_failed()
+
+    scheduler = Scheduler(
+        queue,
+        cpus=args.cpus,
+        memory=args.memory,
+        workers=args.workers,
+        processes=args.processes,
+        chunks=args.chunks,
+        cache_dir=args.cache,
+        params_file=args.params,
+        message=lambda text: print(text, flush=True),
+    )
+    failed += scheduler.run()
+    print(", ".join(f"{count} {status}" for status, count in queue.counts().items()), flush=True)
+    queue.close()
+    return 1 if failed else 0
+
+
+# run the batch processing
+if __name__ == "__main__":
+    # required by the worker processes in the frozen executable
+    multiprocessing.freeze_support()
+    sys.exit(MotionTrackerBatch())
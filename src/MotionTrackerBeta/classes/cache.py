@@ -0,0 +1,216 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from MotionTrackerBeta.classes.reader import replacing
+
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=30.0, stale=60.0):
+    """
+    Lock shared between processes: the lock file is created exclusively and removed on exit
+
+    :param timeout: (float) seconds to wait for the lock, OSError is raised after it
+    :param stale: (float) age in seconds of a lock file left by a killed process
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale:
+                    os.remove(path)
+                    continue
+            except OSError:
+                # removed by its owner in the meantime
+                continue
+            if time.time() > deadline:
+                raise OSError(f"Unable to lock {path}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def series_fingerprint(p):
+    """Hash of the content of the series"""
+    p = np.ascontiguousarray(p, dtype=float)
+    h = hashlib.sha1(p.tobytes())
+    h.update(repr(p.shape).encode())
+    return h.hexdigest()
+
+
+def series_key(p, dt, parameters):
+    """Content address of a differentiation: hash of the series, the time step and the parameters"""
+    p = np.ascontiguousarray(p, dtype=float)
+    h = hashlib.sha1(p.tobytes())
+    h.update(repr((p.shape, float(dt), parameters)).encode())
+    return h.hexdigest()
+
+
+class DiffCache:
+    """LRU cache of the (smoothed, velocity, acceleration) results of the differentiation, optionally persisted to a directory"""
+
+    def __init__(self, max_size=256, directory=None):
+        """Initialization, max_size is the memory limit in MB"""
+        self.max_size = max_size * 1024 * 1024
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def filename(self, key):
+        """Path of the persisted result"""
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """Returns the cached result or None, loads it from the directory if it is not in memory"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        if self.directory is None or not os.path.exists(self.filename(key)):
+            return None
+        try:
+            with np.load(self.filename(key)) as data:
+                result = (data["ps"], data["v"], data["a"])
+        except Exception as e:
+            logger.warning("Unable to load the cached result %s: %s", key, e)
+            return None
+        self.store(key, result)
+        return result
+
+    def put(self, key, result):
+        """Stores the result, writes it to the directory if one is set"""
+        ps, v, a = (np.asarray(r) for r in result)
+        self.store(key, (ps, v, a))
+        if self.directory is not None:
+            try:
+                # a killed or parallel job never leaves a partial file
+                with replacing(self.filename(key), "wb") as file:
+                    np.savez(file, ps=ps, v=v, a=a)
+            except OSError as e:
+                logger.warning("Unable to save the cached result %s: %s", key, e)
+
+    def store(self, key, result):
+        """Adds the result to the memory, evicts the least recently used ones above the limit"""
+        with self.lock:
+            if key in self.entries:
+                self.size -= sum(r.nbytes for r in self.entries.pop(key))
+            self.entries[key] = result
+            self.size += sum(r.nbytes for r in result)
+            while self.size > self.max_size and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= sum(r.nbytes for r in evicted)
+
+    def clear(self):
+        """Removes the results from the memory, the persisted ones are kept"""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class ParamStore:
+    """Parameters found by the optimization based differentiation, keyed by (algorithm, series fingerprint, dt, gamma), optionally saved to a JSON file"""
+
+    def __init__(self, filename=None):
+        """Initialization, loads the previously saved parameters from the file if it exists"""
+        self.filename = filename
+        self.entries = {}
+        self.lock = threading.Lock()
+        if filename is not None and os.path.exists(filename):
+            try:
+                with open(filename, "r") as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError) as e:
+                logger.warning("Unable to load the parameters from %s: %s", filename, e)
+
+    @staticmethod
+    def key(algorithm, fingerprint, dt, gamma):
+        """Key of the entry"""
+        return f"{algorithm}|{fingerprint}|{float(dt)!r}|{float(gamma)!r}"
+
+    def get(self, algorithm, fingerprint, dt, gamma):
+        """Returns the parameters found for the same series or None"""
+        with self.lock:
+            entry = self.entries.get(self.key(algorithm, fingerprint, dt, gamma))
+        return None if entry is None else entry["params"]
+
+    def nearest(self, algorithm, dt, gamma):
+        """Returns the latest parameters found with the same settings for any series, None if there is no such entry"""
+        with self.lock:
+            for entry in reversed(list(self.entries.values())):
+                if (
+                    entry["algorithm"] == algorithm
+                    and entry["dt"] == float(dt)
+                    and entry["gamma"] == float(gamma)
+                ):
+                    return entry["params"]
+        return None
+
+    def put(self, algorithm, fingerprint, dt, gamma, params):
+        """Stores the parameters of the stages, the entry becomes the latest one"""
+        key = self.key(algorithm, fingerprint, dt, gamma)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = {
+                "algorithm": algorithm,
+                "dt": float(dt),
+                "gamma": float(gamma),
+                "params": params,
+            }
+
+    def save(self, filename=None):
+        """Writes the parameters to the JSON file"""
+        filename = self.filename if filename is None else filename
+        if filename is None:
+            return
+        # the other processes merge their entries one at a time
+        with self.lock, file_lock(filename + ".lock"):
+            # keep the entries saved by other processes in the meantime
+            entries = {}
+            if os.path.exists(filename):
+                try:
+                    with open(filename, "r") as file:
+                        entries = json.load(file)
+                except (OSError, ValueError):
+                    entries = {}
+            entries.update(self.entries)
+
+            # replace the file at once, readers never see a partial file
+            with replacing(filename, "w") as file:
+                json.dump(entries, file, indent=1)
@@ -15,9 +15,138 @@
 
 
 import math
+import os
+import tempfile
 import numpy as np
 
 
+def mapped_file(directory, prefix="path-"):
+    """Creates a new, empty file for memory-mapped data in the directory, returns its path"""
+    fd, filename = tempfile.mkstemp(suffix=".dat", prefix=prefix, dir=directory)
+    os.close(fd)
+    return filename
+
+
+class Trajectory:
+    """Preallocated, NumPy backed storage of a path that grows frame by frame, optionally memory-mapped to a file"""
+
+    def __init__(self, columns=None, capacity=0, filename=None):
+        """Initialization, columns is None for scalar data"""
+        self.columns = columns
+        self.length = 0
+        self.filename = filename  # backing file of the memory-mapped storage
+        self.data = self.allocate(max(capacity, 1))
+
+    @classmethod
+    def create(cls, columns=None, capacity=0, directory=None):
+        """Creates a trajectory, memory-mapped to a new file in the directory if one is given"""
+        if directory is None:
+            return cls(columns, capacity)
+        return cls(columns, capacity, mapped_file(directory))
+
+    def shape(self, rows):
+        """Shape of the underlying array with the given number of rows"""
+        if self.columns is None:
+            return (rows,)
+        return (rows, self.columns)
+
+    def allocate(self, rows):
+        """Creates a new, empty storage"""
+        if self.filename is None:
+            return np.empty(self.shape(rows))
+        return np.memmap(self.filename, dtype=float, mode="w+", shape=self.shape(rows))
+
+    def reset(self, capacity=0, filename=None):
+        """Removes the stored rows, replaces the storage"""
+        self.length = 0
+        self.filename = filename
+        self.data = self.allocate(max(capacity, 1))
+
+    def reserve(self, capacity):
+        """Makes room for the given number of rows"""
+        if capacity <= len(self.data):
+            return
+        if self.filename is None:
+            data = np.empty(self.shape(capacity))
+            data[: self.length] = self.data[: self.length]
+            self.data = data
+        else:
+            # grow the file, the stored rows stay in place
+            self.data.flush()
+            self.data = None
+            with open(self.filename, "r+b") as file:
+                file.truncate(int(np.prod(self.shape(capacity))) * np.dtype(float).itemsize)
+            self.data = np.memmap(self.filename, dtype=float, mode="r+", shape=self.shape(capacity))
+
+    def append(self, item):
+        """Adds a new row, the storage is doubled if it is full"""
+        if self.length == len(self.data):
+            self.reserve(max(2 * len(self.data), 1))
+        self.data[self.length] = item
+        self.length += 1
+
+    def extend(self, items):
+        """Adds multiple rows"""
+        items = np.asarray(items, dtype=float)
+        self.reserve(self.length + len(items))
+        self.data[self.length : self.length + len(items)] = items
+        self.length += len(items)
+
+    def clear(self):
+        """Removes the stored rows, keeps the allocated storage"""
+        self.length = 0
+
+    def flush(self):
+        """Writes the memory-mapped rows to the disk"""
+        if self.filename is not None:
+            self.data.flush()
+
+    def delete(self):
+        """Releases the storage, removes the backing file of memory-mapped data"""
+        filename = self.filename
+        self.reset()
+        if filename is not None:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    @property
+    def array(self):
+        """Zero-copy (N,) or (N, columns) view of the stored rows"""
+        return self.data[: self.length]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.array
+        return self.array.astype(dtype)
+
+    def __getstate__(self):
+        # only the stored rows are pickled, memory-mapped data stays in its file
+        state = {"columns": self.columns, "length": self.length, "filename": self.filename}
+        if self.filename is None:
+            state["data"] = self.array
+        else:
+            self.flush()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.filename is not None:
+            self.data = np.memmap(
+                self.filename, dtype=float, mode="r+", shape=self.shape(max(self.length, 1))
+            )
+
+
 class Motion:
     """Class that stores every detail of the objects being tracked"""
 
@@ -32,22 +161,45 @@ class Motion:
         self.rectangle_visible = rectangle_visible  # False if user doesn't set one
 
         # output, raw data
-        self.rectangle_path = []
-        self.point_path = []
-        self.size_change = []
+        self.rectangle_path = Trajectory(4)  # (x, y, w, h) of every frame
+        self.point_path = Trajectory(2)  # (x, y) of every frame
+        self.size_change = Trajectory()
 
         # filtered, calculated output
         self.position = None
         self.velocity = None
         self.acceleration = None
 
+        # int32 copy of the point path for drawing
+        self.trail_cache = None
+        self.trail_source = None
+        self.trail_mapping = None
+
     def __str__(self):
         return self.name
 
-    def reset_data(self):
-        self.rectangle_path = []
-        self.point_path = []
-        self.size_change = []
+    def trail(self, offset=(0, 0), scale=1.0):
+        """(N, 2) int32 array of the point path for cv2.polylines, converted again only if the path or the mapping changed"""
+        mapping = (tuple(offset), scale)
+        if (
+            self.trail_source is not self.point_path
+            or self.trail_mapping != mapping
+            or len(self.trail_cache) != len(self.point_path)
+        ):
+            self.trail_cache = ((self.point_path.array - offset) * scale).astype(np.int32)
+            self.trail_source = self.point_path
+            self.trail_mapping = mapping
+        return self.trail_cache
+
+    def reset_data(self, capacity=0):
+        """Clears the paths, preallocates them for the given number of frames"""
+        # memory-mapped paths of the previous run are unmapped, their files removed
+        for trajectory in (self.rectangle_path, self.point_path, self.size_change):
+            trajectory.delete()
+
+        self.rectangle_path = Trajectory(4, capacity)
+        self.point_path = Trajectory(2, capacity)
+        self.size_change = Trajectory(None, capacity)
 
         # filtered, calculated output
         self.position = None
@@ -89,10 +241,8 @@ class Rotation:
         return False
 
     def calculate(self):
-        P = np.vectorize(lambda P: P.point_path)
-
-        path1 = P(self.P1)
-        path2 = P(self.P2)
+        path1 = self.P1.point_path.array
+        path2 = self.P2.point_path.array
         rotation_init = np.arctan2(
             self.P2.point[1] - self.P1.point[1], self.P2.point[0] - self.P1.point[0]
         )
@@ -0,0 +1,596 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import atexit
+import bisect
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import queue
+from collections import OrderedDict
+import numpy as np
+import cv2
+from MotionTrackerBeta.functions.transforms import crop_roi
+
+
+class FrameReader(threading.Thread):
+    """Thread that decodes (and ROI-crops) frames ahead of the trackers into a bounded buffer"""
+
+    def __init__(self, camera, num_of_frames, roi_rect=None, buffer_size=8, step=1):
+        """Initialization, only every step-th frame is decoded and returned"""
+        self.camera = camera
+        self.num_of_frames = num_of_frames
+        self.roi_rect = roi_rect
+        self.step = step
+        self.buffer = queue.Queue(maxsize=buffer_size)
+        self.is_running = True
+
+        # call parent function
+        super(FrameReader, self).__init__(daemon=True)
+
+    def run(self):
+        """Decodes the frames until the requested number is reached or an error occurs"""
+        try:
+            for i in range(self.num_of_frames):
+                # skip the frames in between without converting them
+                if i > 0:
+                    for _ in range(self.step - 1):
+                        self.camera.grab()
+                ret, frame = self.camera.read()
+
+                # crop roi if provided
+                if ret and self.roi_rect is not None and len(self.roi_rect) == 4:
+                    frame = crop_roi(frame, self.roi_rect)
+
+                # stop on cancel or on the first failed read
+                if not self.put((ret, frame)) or not ret:
+                    return
+        except Exception:
+            # an exception of the decoder or the crop ends the frames like a failed read
+            pass
+
+        # the reads after the last frame fail instead of waiting forever
+        self.put((False, None))
+
+    def put(self, item):
+        """Waits for free space in the buffer, returns False if the reader was stopped"""
+        while self.is_running:
+            try:
+                self.buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read(self):
+        """Returns the next frame in the same format as cv2.VideoCapture.read"""
+        return self.buffer.get()
+
+    def stop(self):
+        """Stops decoding, waits for the thread to exit"""
+        self.is_running = False
+        self.join()
+
+
+def cache_paths(filename, suffix):
+    """Cache file next to the video and in the temporary directory for read-only locations"""
+    digest = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()
+    return [
+        filename + suffix,
+        os.path.join(tempfile.gettempdir(), "MotionTracker", digest + suffix),
+    ]
+
+
+def video_signature(filename):
+    """Size and modification time of the video, the caches are rebuilt if they change"""
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime]
+
+
+@contextlib.contextmanager
+def replacing(path, mode):
+    """Opens a new temporary file next to the path, it replaces the path if the block succeeds"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(path) + ".", dir=directory)
+    try:
+        with os.fdopen(fd, mode) as file:
+            yield file
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class KeyframeIndex:
+    """Frame indices and timestamps of the keyframes of a video, cached in a JSON file next to it"""
+
+    SUFFIX = ".keyframes.json"
+
+    # indices opened in this process by video path, shared by the prefetcher and the proxy generator
+    guard = threading.Lock()
+    locks = {}
+    opened = {}  # path -> (signature, index)
+
+    def __init__(self, keyframes, timestamps, num_of_frames):
+        """Initialization"""
+        self.keyframes = keyframes
+        self.timestamps = timestamps  # ms
+        self.num_of_frames = num_of_frames
+
+    @classmethod
+    def build(cls, filename, is_running=None):
+        """Reads the packets of the video without decoding them, returns None if the backend doesn't report keyframes or if cancelled"""
+        camera = cv2.VideoCapture(filename)
+        try:
+            # raw packets, no decoding
+            if not camera.isOpened() or not camera.set(cv2.CAP_PROP_FORMAT, -1):
+                return None
+            keyframes, timestamps = [], []
+            frame = 0
+            while camera.grab():
+                if is_running is not None and not is_running():
+                    return None
+                if camera.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keyframes.append(frame)
+                    timestamps.append(camera.get(cv2.CAP_PROP_POS_MSEC))
+                frame += 1
+        finally:
+            camera.release()
+
+        if not keyframes or keyframes[0] != 0:
+            return None
+        return cls(keyframes, timestamps, frame)
+
+    @classmethod
+    def open(cls, filename, is_running=None):
+        """Loads the cached index or builds and caches it, returns None if the video can't be indexed"""
+        try:
+            signature = video_signature(filename)
+        except OSError:
+            return None
+
+        key = os.path.abspath(filename)
+        with cls.guard:
+            lock = cls.locks.setdefault(key, threading.Lock())
+
+        # the index is built once, the other threads of the video wait for it
+        while not lock.acquire(timeout=0.1):
+            if is_running is not None and not is_running():
+                return None
+        try:
+            opened = cls.opened.get(key)
+            if opened is not None and opened[0] == signature:
+                return opened[1]
+            index = cls.load(filename, signature)
+            if index is None:
+                index = cls.build(filename, is_running)
+                if index is None:
+                    return None
+                index.save(filename, signature)
+            cls.opened[key] = (signature, index)
+            return index
+        finally:
+            lock.release()
+
+    @classmethod
+    def load(cls, filename, signature):
+        """Reads the cached index, returns None if there is none for this video"""
+        for path in cache_paths(filename, cls.SUFFIX):
+            try:
+                with open(path, "r") as file:
+                    data = json.load(file)
+                if data["signature"] == signature:
+                    return cls(data["keyframes"], data["timestamps"], data["frames"])
+            except (OSError, ValueError, KeyError):
+                pass
+        return None
+
+    def save(self, filename, signature):
+        """Caches the index in the first writable location"""
+        data = {
+            "signature": signature,
+            "frames": self.num_of_frames,
+            "keyframes": self.keyframes,
+            "timestamps": self.timestamps,
+        }
+        for path in cache_paths(filename, self.SUFFIX):
+            try:
+                with replacing(path, "w") as file:
+                    json.dump(data, file)
+                return
+            except OSError:
+                pass
+
+    def keyframe(self, frame):
+        """Index of the last keyframe at or before the frame"""
+        return self.keyframes[max(bisect.bisect_right(self.keyframes, frame) - 1, 0)]
+
+
+class IndexedCapture:
+    """cv2.VideoCapture with frame accurate seeking: jumps to the preceding keyframe of the index and decodes forward"""
+
+    def __init__(self, filename, index=None):
+        """Initialization, seeking falls back to the backend while the index is None"""
+        self.camera = cv2.VideoCapture(filename)
+        self.index = index
+        self.position = 0  # index of the next frame
+
+    def isOpened(self):
+        return self.camera.isOpened()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return self.camera.get(prop)
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return self.camera.set(prop, value)
+        return self.seek(int(value))
+
+    def seek(self, frame):
+        """Moves to the frame, only decodes forward if no keyframe is in between"""
+        frame = max(frame, 0)
+        if self.index is None or frame >= self.index.num_of_frames:
+            ret = self.camera.set(cv2.CAP_PROP_POS_FRAMES, frame)
+            self.position = frame
+            return ret
+
+        keyframe = self.index.keyframe(frame)
+        if not keyframe <= self.position <= frame:
+            if not self.camera.set(cv2.CAP_PROP_POS_FRAMES, keyframe):
+                return False
+            self.position = keyframe
+
+        # decode without color conversion up to the frame
+        while self.position < frame:
+            if not self.grab():
+                return False
+        return True
+
+    def grab(self):
+        ret = self.camera.grab()
+        if ret:
+            self.position += 1
+        return ret
+
+    def retrieve(self):
+        return self.camera.retrieve()
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.camera.release()
+
+
+class FrameCache:
+    """LRU cache of decoded frames limited by their total size"""
+
+    def __init__(self, max_size=512 * 1024 * 1024):
+        """Initialization, max_size is given in bytes"""
+        self.max_size = max_size
+        self.size = 0
+        self.frames = OrderedDict()  # frame index -> frame
+        self.lock = threading.Lock()
+
+    def get(self, index):
+        """Returns the frame or None if it is not cached"""
+        with self.lock:
+            frame = self.frames.get(index)
+            if frame is not None:
+                self.frames.move_to_end(index)
+            return frame
+
+    def put(self, index, frame):
+        """Stores the frame, evicts the least recently used frames over the limit"""
+        if frame.nbytes > self.max_size:
+            return
+        with self.lock:
+            if index in self.frames:
+                self.size -= self.frames.pop(index).nbytes
+            self.frames[index] = frame
+            self.size += frame.nbytes
+            while self.size > self.max_size:
+                _, evicted = self.frames.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.size = 0
+
+    def __contains__(self, index):
+        with self.lock:
+            return index in self.frames
+
+
+class CachedCapture:
+    """Drop-in replacement of cv2.VideoCapture for the playback, frames are served from an LRU cache that a background thread fills ahead of the playhead"""
+
+    def __init__(self, filename, cache_size=512, prefetch=32):
+        """
+        Initialization
+
+        :param filename: (str) path of the video
+        :param cache_size: (float) memory limit of the decoded frames in MB
+        :param prefetch: (int) number of frames decoded ahead of the playhead
+        """
+        self.filename = filename
+        self.camera = IndexedCapture(filename)  # decoder of the cache misses
+        self.num_of_frames = int(self.camera.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.cache = FrameCache(int(cache_size * 1024 * 1024))
+
+        # the prefetched frames and the frame at the playhead must fit in the cache, otherwise they evict each other
+        frame_nbytes = int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)) * int(self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)) * 3
+        if frame_nbytes > 0:
+            prefetch = min(prefetch, max(self.cache.max_size // frame_nbytes - 1, 0))
+        self.prefetch = prefetch
+        self.position = 0  # index of the next frame to read
+        self.frame = None  # last retrieved frame
+        self.grabbed = None  # index of the last grabbed frame, decoded only when it is retrieved
+        self.retrieved = None  # index of the last retrieved frame
+        self.step = 1  # interval of the retrieved frames, only these frames are prefetched
+
+        # background decoder
+        self.condition = threading.Condition()
+        self.is_running = True
+        self.prefetcher = threading.Thread(target=self.run_prefetch, daemon=True)
+        self.prefetcher.start()
+
+        # the decoder thread must stop before the interpreter exits
+        atexit.register(self.release)
+
+    def isOpened(self):
+        return self.camera.isOpened()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return self.camera.get(prop)
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return self.camera.set(prop, value)
+        self.position = min(max(int(value), 0), self.num_of_frames)
+        self.retrieved = None
+        self.step = 1
+        self.wake()
+        return True
+
+    def decode(self, index):
+        """Decodes the frame of the given index on the calling thread"""
+        if self.camera.position != index:
+            self.camera.seek(index)
+        ret, frame = self.camera.read()
+        if ret:
+            self.cache.put(index, frame)
+        return ret, frame
+
+    def grab(self):
+        """Moves to the next frame without decoding it, the frame is decoded by retrieve"""
+        index = self.position
+        if index >= self.num_of_frames:
+            return False
+        self.grabbed = index
+        self.position = index + 1
+        return True
+
+    def retrieve(self):
+        """Returns a copy of the last grabbed frame, drawing on it doesn't change the cache"""
+        index = self.grabbed
+        if index is not None and index != self.retrieved:
+            frame = self.cache.get(index)
+            if frame is None:
+                ret, frame = self.decode(index)
+                if not ret:
+                    return False, None
+
+            # frames skipped by grab aren't prefetched
+            if self.retrieved is not None and index > self.retrieved:
+                self.step = index - self.retrieved
+            else:
+                self.step = 1
+            self.frame = frame
+            self.retrieved = index
+            self.wake()
+        if self.frame is None:
+            return False, None
+        return True, self.frame.copy()
+
+    def read(self):
+        """Returns the next frame in the same format as cv2.VideoCapture.read"""
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def wake(self):
+        """Notifies the prefetcher about the new position"""
+        with self.condition:
+            self.condition.notify()
+
+    def missing(self, end):
+        """Index of the first frame ahead of the playhead that is not cached, None if all are"""
+        # the next frames in the interval of the retrieved ones
+        step = self.step
+        start = self.position if self.retrieved is None else max(self.retrieved + step, self.position)
+        for index in range(start, min(start + self.prefetch * step, end), step):
+            if index not in self.cache:
+                return index
+        return None
+
+    def run_prefetch(self):
+        """Decodes the frames ahead of the playhead with a separate decoder"""
+        # keyframe index of the accurate seeks, built on the first opening of the video
+        keyframes = KeyframeIndex.open(self.filename, lambda: self.is_running)
+        self.camera.index = keyframes
+        camera = IndexedCapture(self.filename, keyframes)
+        end = self.num_of_frames  # the frame count of some containers is too large
+        if keyframes is not None:
+            end = min(end, keyframes.num_of_frames)
+        try:
+            while self.is_running:
+                index = self.missing(end)
+                if index is None:
+                    with self.condition:
+                        self.condition.wait(0.1)
+                    continue
+
+                # seek only if the frame isn't the next one of the decoder
+                if camera.position != index:
+                    camera.seek(index)
+                ret, frame = camera.read()
+                if not ret:
+                    # no more readable frames
+                    end = index
+                    continue
+                self.cache.put(index, frame)
+        finally:
+            camera.release()
+
+    def release(self):
+        """Stops the prefetcher, releases the decoders and the cache"""
+        atexit.unregister(self.release)
+        self.is_running = False
+        self.wake()
+        self.prefetcher.join()
+        self.camera.release()
+        self.cache.clear()
+
+
+class ProxyCache(threading.Thread):
+    """Thread that generates downscaled JPEG proxies of every Nth frame for the slider preview, cached in a file next to the video"""
+
+    SUFFIX = ".proxy.npz"
+
+    def __init__(self, filename, width=480, count=1000, quality=80):
+        """
+        Initialization
+
+        :param filename: (str) path of the video
+        :param width: (int) width of the proxies in pixels
+        :param count: (int) maximal number of proxies, sets the step between them
+        :param quality: (int) JPEG quality of the proxies
+        """
+        self.filename = filename
+        self.width = width
+        self.quality = quality
+        camera = cv2.VideoCapture(filename)
+        self.num_of_frames = int(camera.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.video_width = int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))
+        camera.release()
+        self.step = max(1, -(-self.num_of_frames // count))
+        self.proxies = []  # JPEG encoded proxies in frame order
+        self.is_running = True
+
+        # call parent function
+        super(ProxyCache, self).__init__(daemon=True)
+
+        # the decoder thread must stop before the interpreter exits
+        atexit.register(self.stop)
+
+    @property
+    def scale(self):
+        """Size of the proxies relative to the frames"""
+        return min(self.width / max(self.video_width, 1), 1)
+
+    def get(self, frame):
+        """Decoded proxy nearest to the frame, None if it isn't generated yet"""
+        index = min(round(frame / self.step), (self.num_of_frames - 1) // self.step)
+        proxies = self.proxies
+        if index >= len(proxies):
+            return None
+        return cv2.imdecode(proxies[index], cv2.IMREAD_COLOR)
+
+    def load(self, signature):
+        """Loads the cached proxies, returns False if there are none for this video"""
+        for path in cache_paths(self.filename, self.SUFFIX):
+            try:
+                with np.load(path) as data:
+                    if (
+                        list(data["signature"]) != signature
+                        or int(data["step"]) != self.step
+                        or int(data["width"]) != self.width
+                    ):
+                        continue
+                    blob, offsets = data["blob"], data["offsets"]
+            except (OSError, ValueError, KeyError):
+                continue
+            self.proxies = [blob[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+            return True
+        return False
+
+    def save(self, signature):
+        """Stores the proxies in one blob in the first writable location"""
+        offsets = np.cumsum([0] + [len(proxy) for proxy in self.proxies])
+        blob = np.concatenate(self.proxies) if self.proxies else np.empty(0, np.uint8)
+        for path in cache_paths(self.filename, self.SUFFIX):
+            try:
+                with replacing(path, "wb") as file:
+                    np.savez(
+                        file,
+                        signature=np.array(signature),
+                        step=self.step,
+                        width=self.width,
+                        blob=blob,
+                        offsets=offsets,
+                    )
+                return
+            except OSError:
+                pass
+
+    def run(self):
+        """Loads the proxies or decodes, downscales and encodes them in frame order"""
+        try:
+            signature = video_signature(self.filename)
+        except OSError:
+            return
+        if self.load(signature):
+            return
+
+        camera = IndexedCapture(self.filename, KeyframeIndex.open(self.filename, lambda: self.is_running))
+        try:
+            for frame in range(0, self.num_of_frames, self.step):
+                if not self.is_running:
+                    return
+                camera.seek(frame)
+                ret, image = camera.read()
+                if not ret:
+                    break
+                image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+                ret, proxy = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if not ret:
+                    break
+                self.proxies.append(proxy.ravel())
+        finally:
+            camera.release()
+        self.save(signature)
+
+    def stop(self):
+        """Stops generating the proxies, waits for the thread to exit"""
+        atexit.unregister(self.stop)
+        self.is_running = False
+        if self.is_alive():
+            self.join()
@@ -14,6 +14,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import numpy as np
+import scipy.signal
+import scipy.integrate
 import pynumdiff
 import pynumdiff.optimize
 
@@ -298,18 +300,46 @@ def differentiate(p, dt, parameters):
         return False, 0, 0, 0
 
 
-def optimize_and_differentiate(p, dt, parameters):
-    """Calculates the velocity and the acceleration based on the given position data using optimization to determine the ideal parameters of the delected differentiation algorithm"""
-    gamma = np.exp(-1.6 * np.log(parameters[2]) - 0.71 * np.log(dt) - 5.1)
+def tv_gamma(cutoff, dt):
+    """Regularization of the parameter optimization for the given cutoff frequency"""
+    return np.exp(-1.6 * np.log(cutoff) - 0.71 * np.log(dt) - 5.1)
+
+
+def search_params(optimizer, x, dt, stage, known_params, search, found, **kwargs):
+    """Runs the parameter optimization of a stage, starts it from or replaces it by the known parameters"""
+    known = known_params[stage] if known_params is not None and len(known_params) > stage else None
+    if known is not None and not search:
+        params = list(known)
+    else:
+        initial = None if known is None else [list(known)]
+        params, val = optimizer(x, dt, params=initial, **kwargs)
+    if found is not None:
+        found.append([v.item() if isinstance(v, np.generic) else v for v in params])
+    return params, None
+
+
+def optimize_and_differentiate(p, dt, parameters, known_params=None, search=True, found=None):
+    """
+    Calculates the velocity and the acceleration based on the given position data using optimization to determine the ideal parameters of the delected differentiation algorithm
+
+    :param known_params: (list) previously found parameters of the two stages, the searches are started from them
+    :param search: (bool) if False the known parameters are used without searching
+    :param found: (list) the parameters found for the two stages are appended to it
+    """
+    gamma = tv_gamma(parameters[2], dt)
 
     if parameters[1] == "Iterated First Order Finite Difference":
         try:
-            params, val = pynumdiff.optimize.finite_difference.first_order(
-                p, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.finite_difference.first_order,
+                p, dt, 0, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             ps, v = pynumdiff.finite_difference.first_order(p, dt, params)
-            params, val = pynumdiff.optimize.finite_difference.first_order(
-                v, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.finite_difference.first_order,
+                v, dt, 1, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             v, a = pynumdiff.finite_difference.first_order(
                 v, dt, params, options={"iterate": True}
@@ -320,12 +350,16 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Finite Difference with Median Smoothing":
         try:
-            params, val = pynumdiff.optimize.smooth_finite_difference.mediandiff(
-                p, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.mediandiff,
+                p, dt, 0, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             ps, v = pynumdiff.smooth_finite_difference.mediandiff(p, dt, params)
-            params, val = pynumdiff.optimize.finite_difference.first_order(
-                v, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.finite_difference.first_order,
+                v, dt, 1, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             v, a = pynumdiff.smooth_finite_difference.mediandiff(v, dt, params)
             return True, ps, v, a
@@ -334,12 +368,16 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Finite Difference with Mean Smoothing":
         try:
-            params, val = pynumdiff.optimize.smooth_finite_difference.meandiff(
-                p, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.meandiff,
+                p, dt, 0, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             ps, v = pynumdiff.smooth_finite_difference.meandiff(p, dt, params)
-            params, val = pynumdiff.optimize.smooth_finite_difference.meandiff(
-                v, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.meandiff,
+                v, dt, 1, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             v, a = pynumdiff.smooth_finite_difference.meandiff(v, dt, params)
             return True, ps, v, a
@@ -348,12 +386,16 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Finite Difference with Gaussian Smoothing":
         try:
-            params, val = pynumdiff.optimize.smooth_finite_difference.gaussiandiff(
-                p, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.gaussiandiff,
+                p, dt, 0, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             ps, v = pynumdiff.smooth_finite_difference.gaussiandiff(p, dt, params)
-            params, val = pynumdiff.optimize.smooth_finite_difference.gaussiandiff(
-                v, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.gaussiandiff,
+                v, dt, 1, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             v, a = pynumdiff.smooth_finite_difference.gaussiandiff(v, dt, params)
             return True, ps, v, a
@@ -362,12 +404,16 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Finite Difference with Butterworth Smoothing":
         try:
-            params, val = pynumdiff.optimize.smooth_finite_difference.butterdiff(
-                p, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.butterdiff,
+                p, dt, 0, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             ps, v = pynumdiff.smooth_finite_difference.butterdiff(p, dt, params)
-            params, val = pynumdiff.optimize.smooth_finite_difference.butterdiff(
-                v, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.butterdiff,
+                v, dt, 1, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             v, a = pynumdiff.smooth_finite_difference.butterdiff(v, dt, params)
             return True, ps, v, a
@@ -376,12 +422,16 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Finite Difference with Friedrichs Smoothing":
         try:
-            params, val = pynumdiff.optimize.smooth_finite_difference.friedrichsdiff(
-                p, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.friedrichsdiff,
+                p, dt, 0, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             ps, v = pynumdiff.smooth_finite_difference.friedrichsdiff(p, dt, params)
-            params, val = pynumdiff.optimize.smooth_finite_difference.friedrichsdiff(
-                p, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.friedrichsdiff,
+                p, dt, 1, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             v, a = pynumdiff.smooth_finite_difference.friedrichsdiff(v, dt, params)
             return True, ps, v, a
@@ -390,12 +440,16 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Finite Difference with Spline Smoothing":
         try:
-            params, val = pynumdiff.optimize.smooth_finite_difference.splinediff(
-                p, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.splinediff,
+                p, dt, 0, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             ps, v = pynumdiff.smooth_finite_difference.splinediff(p, dt, params)
-            params, val = pynumdiff.optimize.smooth_finite_difference.splinediff(
-                v, dt, params=None, options={"iterate": True}, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.smooth_finite_difference.splinediff,
+                v, dt, 1, known_params, search, found,
+                options={"iterate": True}, tvgamma=gamma
             )
             v, a = pynumdiff.smooth_finite_difference.splinediff(v, dt, params)
             return True, ps, v, a
@@ -412,8 +466,10 @@ def optimize_and_differentiate(p, dt, parameters):
             (
                 params,
                 val,
-            ) = pynumdiff.optimize.total_variation_regularization.iterative_velocity(
-                p, dt, params=None, tvgamma=gamma, options=options
+            ) = search_params(
+                pynumdiff.optimize.total_variation_regularization.iterative_velocity,
+                p, dt, 0, known_params, search, found,
+                tvgamma=gamma, options=options
             )
             ps, v = pynumdiff.total_variation_regularization.iterative_velocity(
                 p, dt, params, options
@@ -421,8 +477,10 @@ def optimize_and_differentiate(p, dt, parameters):
             (
                 params,
                 val,
-            ) = pynumdiff.optimize.total_variation_regularization.iterative_velocity(
-                v, dt, params=None, tvgamma=gamma, options=options
+            ) = search_params(
+                pynumdiff.optimize.total_variation_regularization.iterative_velocity,
+                v, dt, 1, known_params, search, found,
+                tvgamma=gamma, options=options
             )
             v, a = pynumdiff.total_variation_regularization.iterative_velocity(
                 v, dt, params, options
@@ -437,8 +495,10 @@ def optimize_and_differentiate(p, dt, parameters):
     ):
         try:
 
-            params, val = pynumdiff.optimize.total_variation_regularization.velocity(
-                p, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.total_variation_regularization.velocity,
+                p, dt, 0, known_params, search, found,
+                tvgamma=gamma
             )
             (
                 ps,
@@ -447,8 +507,10 @@ def optimize_and_differentiate(p, dt, parameters):
                 p, dt, params
             )
 
-            params, val = pynumdiff.optimize.total_variation_regularization.velocity(
-                v, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.total_variation_regularization.velocity,
+                v, dt, 1, known_params, search, found,
+                tvgamma=gamma
             )
             (
                 v,
@@ -468,8 +530,10 @@ def optimize_and_differentiate(p, dt, parameters):
             (
                 params,
                 val,
-            ) = pynumdiff.optimize.total_variation_regularization.acceleration(
-                p, dt, params=None, tvgamma=gamma
+            ) = search_params(
+                pynumdiff.optimize.total_variation_regularization.acceleration,
+                p, dt, 0, known_params, search, found,
+                tvgamma=gamma
             )
             (
                 ps,
@@ -480,8 +544,10 @@ def optimize_and_differentiate(p, dt, parameters):
             (
                 params,
                 val,
-            ) = pynumdiff.optimize.total_variation_regularization.acceleration(
-                v, dt, params=None, tvgamma=gamma
+            ) = search_params(
+                pynumdiff.optimize.total_variation_regularization.acceleration,
+                v, dt, 1, known_params, search, found,
+                tvgamma=gamma
             )
             (
                 v,
@@ -498,8 +564,10 @@ def optimize_and_differentiate(p, dt, parameters):
         "Convex Total Variation Regularization with Sliding Jerk",
     }:
         try:
-            (params, val) = pynumdiff.optimize.total_variation_regularization.jerk(
-                p, dt, params=None, tvgamma=gamma
+            (params, val) = search_params(
+                pynumdiff.optimize.total_variation_regularization.jerk,
+                p, dt, 0, known_params, search, found,
+                tvgamma=gamma
             )
             (
                 ps,
@@ -507,8 +575,10 @@ def optimize_and_differentiate(p, dt, parameters):
             ) = pynumdiff.total_variation_regularization._total_variation_regularization.jerk(
                 p, dt, params
             )
-            (params, val) = pynumdiff.optimize.total_variation_regularization.jerk(
-                v, dt, params=None, tvgamma=gamma
+            (params, val) = search_params(
+                pynumdiff.optimize.total_variation_regularization.jerk,
+                v, dt, 1, known_params, search, found,
+                tvgamma=gamma
             )
             (
                 v,
@@ -529,8 +599,10 @@ def optimize_and_differentiate(p, dt, parameters):
             (
                 params,
                 val,
-            ) = pynumdiff.optimize.total_variation_regularization.smooth_acceleration(
-                p, dt, params=None, tvgamma=gamma
+            ) = search_params(
+                pynumdiff.optimize.total_variation_regularization.smooth_acceleration,
+                p, dt, 0, known_params, search, found,
+                tvgamma=gamma
             )
             (
                 ps,
@@ -541,8 +613,10 @@ def optimize_and_differentiate(p, dt, parameters):
             (
                 params,
                 val,
-            ) = pynumdiff.optimize.total_variation_regularization.smooth_acceleration(
-                v, dt, params=None, tvgamma=gamma
+            ) = search_params(
+                pynumdiff.optimize.total_variation_regularization.smooth_acceleration,
+                v, dt, 1, known_params, search, found,
+                tvgamma=gamma
             )
             (
                 v,
@@ -556,14 +630,18 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Spectral Derivative":
         try:
-            params, val = pynumdiff.optimize.linear_model.spectraldiff(
-                p, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.linear_model.spectraldiff,
+                p, dt, 0, known_params, search, found,
+                tvgamma=gamma
             )
 
             ps, v = pynumdiff.linear_model._linear_model.spectraldiff(p, dt, params)
 
-            params, val = pynumdiff.optimize.linear_model.spectraldiff(
-                v, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.linear_model.spectraldiff,
+                v, dt, 1, known_params, search, found,
+                tvgamma=gamma
             )
 
             v, a = pynumdiff.linear_model._linear_model.spectraldiff(v, dt, params)
@@ -573,12 +651,16 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Savitzky-Golay Filter":
         try:
-            params, val = pynumdiff.optimize.linear_model.savgoldiff(
-                p, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.linear_model.savgoldiff,
+                p, dt, 0, known_params, search, found,
+                tvgamma=gamma
             )
             ps, v = pynumdiff.linear_model._linear_model.savgoldiff(p, dt, params)
-            params, val = pynumdiff.optimize.linear_model.savgoldiff(
-                v, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.linear_model.savgoldiff,
+                v, dt, 1, known_params, search, found,
+                tvgamma=gamma
             )
             v, a = pynumdiff.linear_model._linear_model.savgoldiff(v, dt, params)
             return True, ps, v, a
@@ -587,12 +669,16 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Sliding Polynomial Derivative":
         try:
-            params, val = pynumdiff.optimize.linear_model.polydiff(
-                p, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.linear_model.polydiff,
+                p, dt, 0, known_params, search, found,
+                tvgamma=gamma
             )
             ps, v = pynumdiff.linear_model._linear_model.polydiff(p, dt, params)
-            params, val = pynumdiff.optimize.linear_model.polydiff(
-                v, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.linear_model.polydiff,
+                v, dt, 1, known_params, search, found,
+                tvgamma=gamma
             )
             v, a = pynumdiff.linear_model._linear_model.polydiff(v, dt, params)
             return True, ps, v, a
@@ -601,12 +687,16 @@ def optimize_and_differentiate(p, dt, parameters):
             return False, 0, 0, 0
     elif parameters[1] == "Sliding Chebychev Polynomial Fit":
         try:
-            params, val = pynumdiff.optimize.linear_model.chebydiff(
-                p, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.linear_model.chebydiff,
+                p, dt, 0, known_params, search, found,
+                tvgamma=gamma
             )
             ps, v = pynumdiff.linear_model._linear_model.chebydiff(p, dt, params)
-            params, val = pynumdiff.optimize.linear_model.chebydiff(
-                v, dt, params=None, tvgamma=gamma
+            params, val = search_params(
+                pynumdiff.optimize.linear_model.chebydiff,
+                v, dt, 1, known_params, search, found,
+                tvgamma=gamma
             )
             v, a = pynumdiff.linear_model._linear_model.chebydiff(v, dt, params)
             return True, ps, v, a
@@ -614,4 +704,201 @@ def optimize_and_differentiate(p, dt, parameters):
             print(e)
             return False, 0, 0, 0
     else:
-        return False, 0, 0, 0
\ No newline at end of file
+        return False, 0, 0, 0
+
+
+def differentiate_series(p, dt, parameters, known_params=None, search=True):
+    """Differentiates a single series with the selected algorithm, optimized if requested, process pool entry, also returns the optimized parameters"""
+    if parameters[0]:
+        found = []
+        ret, ps, v, a = optimize_and_differentiate(p, dt, parameters, known_params, search, found)
+        return ret, ps, v, a, found
+    ret, ps, v, a = differentiate(p, dt, parameters)
+    return ret, ps, v, a, None
+
+
+# linear methods that can differentiate every series at once
+BATCH_METHODS = {
+    "First Order Finite Difference",
+    "Second Order Finite Difference",
+    "Finite Difference with Mean Smoothing",
+    "Finite Difference with Gaussian Smoothing",
+    "Finite Difference with Friedrichs Smoothing",
+    "Finite Difference with Butterworth Smoothing",
+    "Savitzky-Golay Filter",
+    "Spectral Derivative",
+}
+
+
+def differentiate_batch(P, dt, parameters):
+    """
+    Calculates the velocity and the acceleration of every series at once, vectorized version of differentiate for the methods in BATCH_METHODS
+
+    :param P: (np.array of floats, NxK) time series to differentiate in the columns
+    :param dt: (float) time step
+    :param parameters: (tuple) parameters for the differentiation
+    :return: ret : returns True if the differentiation was successful
+    :return: PS : smoothed positions (NxK)
+    :return: V : calculated velocities (NxK)
+    :return: A : calculated accelerations (NxK)
+    """
+    if parameters[1] not in BATCH_METHODS:
+        return False, 0, 0, 0
+    try:
+        P = np.asarray(P, dtype=float)
+        PS, V = _batch_step(P, dt, parameters)
+        V, A = _batch_step(V, dt, parameters)
+        return True, PS, V, A
+    except Exception as e:
+        print(e)
+        return False, 0, 0, 0
+
+
+def _batch_step(X, dt, parameters):
+    """Smooths and differentiates the columns once, mirrors the corresponding pynumdiff method"""
+    algo = parameters[1]
+    if algo == "First Order Finite Difference":
+        return _first_order(X, dt)
+
+    elif algo == "Second Order Finite Difference":
+        dX = np.empty_like(X)
+        dX[1:-1] = (X[2:] - X[:-2]) / (2 * dt)
+        dX[0] = (-3 * X[0] + 4 * X[1] - X[2]) / (2 * dt)
+        dX[-1] = (3 * X[-1] - 4 * X[-2] + X[-3]) / (2 * dt)
+        return X, dX
+
+    elif algo in {
+        "Finite Difference with Mean Smoothing",
+        "Finite Difference with Gaussian Smoothing",
+        "Finite Difference with Friedrichs Smoothing",
+    }:
+        window_size, iterations = _window_and_iterations(parameters)
+        if algo == "Finite Difference with Mean Smoothing":
+            kernel = np.ones(window_size) / window_size
+        elif algo == "Finite Difference with Gaussian Smoothing":
+            kernel = _gaussian_kernel(window_size)
+        else:
+            t = np.linspace(-0.999, 0.999, window_size)
+            kernel = np.exp(-1 / (1 - t ** 2))
+            kernel = kernel / np.sum(kernel)
+        return _first_order(_convolutional_smoother(X, kernel, iterations), dt)
+
+    elif algo == "Finite Difference with Butterworth Smoothing":
+        options = parameters[3]
+        if options.get("iterate") is True:
+            n, wn, iterations = parameters[2]
+        else:
+            n, wn = parameters[2]
+            iterations = 1
+        b, a = scipy.signal.butter(n, wn)
+        XS = X
+        for _ in range(iterations):
+            if len(X) < 9:
+                XS = scipy.signal.filtfilt(b, a, XS, axis=0, method="pad", padlen=len(X) - 1)
+            else:
+                XS = scipy.signal.filtfilt(b, a, XS, axis=0, method="pad")
+        XS, dX = _first_order(XS, dt)
+        return XS + (np.mean(X, axis=0) - np.mean(XS, axis=0)), dX
+
+    elif algo == "Savitzky-Golay Filter":
+        n, window_size, smoothing_win = parameters[2]
+        window_size = min(window_size, len(X) - 1)
+        smoothing_win = min(smoothing_win, len(X) - 1)
+        if window_size <= n:
+            window_size = n + 1
+        if not window_size % 2:
+            window_size += 1
+        dX = scipy.signal.savgol_filter(X, window_size, n, deriv=1, axis=0) / dt
+        dX = _convolutional_smoother(dX, _gaussian_kernel(smoothing_win), 1)
+        return _integrate(X, dX, dt), dX
+
+    elif algo == "Spectral Derivative":
+        return _spectral(X, dt, parameters)
+
+
+def _window_and_iterations(parameters):
+    """Window size and number of iterations of the convolutional smoothers"""
+    options = parameters[3] if len(parameters) > 3 else {}
+    if options.get("iterate") is True:
+        window_size, iterations = parameters[2]
+    else:
+        window_size = parameters[2][0] if isinstance(parameters[2], list) else parameters[2]
+        iterations = 1
+    return window_size, iterations
+
+
+def _first_order(X, dt):
+    """First order centered difference of the columns"""
+    dX = np.diff(X, axis=0) / dt
+    dX = np.vstack((dX[:1], dX, dX[-1:]))
+    return X, (dX[:-1] + dX[1:]) / 2
+
+
+def _gaussian_kernel(window_size):
+    """Gaussian kernel used by pynumdiff"""
+    sigma = window_size / 6.0
+    t = np.linspace(-2.7 * sigma, 2.7 * sigma, window_size)
+    kernel = np.exp(-(t ** 2) / (2 * sigma ** 2)) / np.sqrt(2 * np.pi * sigma ** 2)
+    return kernel / np.sum(kernel)
+
+
+def _convolutional_smoother(X, kernel, iterations):
+    """Forward-backward convolution of the mirrored columns"""
+    XS = np.vstack((X[::-1], X, X[::-1]))
+    kernel = kernel[:, np.newaxis]
+    w = np.arange(len(XS)) / (len(XS) - 1)
+    w = w[:, np.newaxis]
+    for _ in range(iterations):
+        forward = scipy.signal.convolve(XS, kernel, mode="same")
+        backward = scipy.signal.convolve(XS[::-1], kernel, mode="same")[::-1]
+        XS = forward * w + backward * (1 - w)
+    return XS[len(X) : 2 * len(X)]
+
+
+def _integrate(X, dX, dt):
+    """Integrates the derivative, the integration constant is fitted to the original columns"""
+    XS = scipy.integrate.cumulative_trapezoid(dX, axis=0)
+    XS = np.vstack((XS[:1] - dX[:1], XS)) * dt
+    return XS + np.mean(X - XS, axis=0)
+
+
+def _spectral(X, dt, parameters):
+    """Spectral derivative of the columns with high frequency attenuation"""
+    options = parameters[3] if len(parameters) > 3 and parameters[3] is not None else {}
+    even_extension = options.get("even_extension", True)
+    pad_to_zero_dxdt = options.get("pad_to_zero_dxdt", True)
+    wn = parameters[2][0] if isinstance(parameters[2], list) else parameters[2]
+    original_L = len(X)
+    original = X
+
+    # make derivative go to zero at ends (optional)
+    if pad_to_zero_dxdt:
+        padding = 100
+        X = np.vstack((np.repeat(X[:1], padding, axis=0), X, np.repeat(X[-1:], padding, axis=0)))
+        XS = _convolutional_smoother(X, np.ones(padding // 2) / (padding // 2), 1)
+        XS[padding:-padding] = X[padding:-padding]
+        X = XS
+    else:
+        padding = 0
+
+    # do even extension (optional)
+    if even_extension:
+        X = np.vstack((X, X[::-1]))
+
+    # if odd, make N even
+    N = len(X)
+    if N % 2 != 0:
+        X = np.vstack((X, X[-1:]))
+        N += 1
+
+    # frequency range, remove signals with a frequency higher than wn
+    k = np.asarray(list(range(0, N // 2)) + [0] + list(range(-N // 2 + 1, 0)))
+    k = k * 2 * np.pi / (dt * N)
+    discrete_wn = int(wn * N)
+    k[discrete_wn : N - discrete_wn] = 0
+
+    # derivative = 90 deg phase shift
+    dX = np.real(np.fft.ifft(1.0j * k[:, np.newaxis] * np.fft.fft(X, axis=0), axis=0))
+    dX = dX[padding : original_L + padding]
+    return _integrate(original, dX, dt), dX
+
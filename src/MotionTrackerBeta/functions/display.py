@@ -27,8 +27,11 @@ def display_objects(
     point_bool,
     trajectory_length,
     marker_size=20,
+    offset=(0, 0),
+    scale=1.0,
 ):
-    """Draws tracked object onto the video frame for playback and export"""
+    """Draws tracked object onto the video frame for playback and export, offset and scale map the coordinates to a cropped, resized frame"""
+    ox, oy = offset
     for obj in objects:
         if obj.visible:
             if (pos >= section_start - 1) and (pos <= section_stop):
@@ -55,40 +58,26 @@ def display_objects(
                 if point_bool:
                     x, y = obj.point_path[int(pos - section_start + 1)]
                     frame = cv2.drawMarker(
-                        frame, (int(x), int(y)), (0, 0, 255), 0, markerSize=marker_size, thickness=2
+                        frame,
+                        (int((x - ox) * scale), int((y - oy) * scale)),
+                        (0, 0, 255),
+                        0,
+                        markerSize=marker_size,
+                        thickness=2,
                     )
-                    if pos - section_start < trajectory_length:
-                        for i in range(1, int(pos - section_start + 2)):
-                            x0, y0 = obj.point_path[i - 1]
-                            x1, y1 = obj.point_path[i]
-                            # print(f"x:{x0}   y:{y0}   x:{x1}   y:{y1}")
-                            frame = cv2.line(
-                                frame,
-                                (int(x0), int(y0)),
-                                (int(x1), int(y1)),
-                                (0, 0, 255),
-                                2,
-                            )
-                    else:
-                        for i in range(0, trajectory_length + +1):
-                            x0, y0 = obj.point_path[
-                                int(pos - section_start + i - trajectory_length)
-                            ]
-                            x1, y1 = obj.point_path[
-                                int(pos - section_start + i - trajectory_length + 1)
-                            ]
-                            frame = cv2.line(
-                                frame,
-                                (int(x0), int(y0)),
-                                (int(x1), int(y1)),
-                                (0, 0, 255),
-                                2,
-                            )
+
+                    # trail of the last trajectory_length frames in one call
+                    current = int(pos - section_start + 1)
+                    first = max(0, current - 1 - trajectory_length)
+                    trail = obj.trail(offset, scale)[first : current + 1]
+                    if len(trail) > 1:
+                        frame = cv2.polylines(frame, [trail], False, (0, 0, 255), 2)
 
                 # Only draw rectangle if it was manually set (not auto-generated)
                 if box_bool and getattr(obj, 'rectangle_visible', True):
+                    x, y, w, h = obj.rectangle_path[int(pos - section_start + 1)]
                     x0, y0, x1, y1 = tracker2gui(
-                        obj.rectangle_path[int(pos - section_start + 1)]
+                        ((x - ox) * scale, (y - oy) * scale, w * scale, h * scale)
                     )
                     frame = cv2.rectangle(frame, (x0, y0), (x1, y1), (255, 0, 0), 2)
                     cv2.putText(
@@ -103,6 +92,25 @@ def display_objects(
                     )
     return frame
 
+def fit_frame(frame, width, height, out=None):
+    """Resizes the BGR frame to fit in width x height keeping its aspect ratio, converts it to RGB in out if it has the right size"""
+    h, w = frame.shape[:2]
+    scale = min(width / w, height / h)
+    size = (max(round(w * scale), 1), max(round(h * scale), 1))
+    if out is None or out.shape != (size[1], size[0], 3):
+        out = np.empty((size[1], size[0], 3), np.uint8)
+
+    # area averaging by halving (the fast path of INTER_AREA), bilinear for the remaining factor below 2
+    while w >= 2 * size[0] and h >= 2 * size[1]:
+        frame = cv2.resize(
+            frame[: h // 2 * 2, : w // 2 * 2], (w // 2, h // 2), interpolation=cv2.INTER_AREA
+        )
+        h, w = frame.shape[:2]
+    cv2.resize(frame, size, dst=out, interpolation=cv2.INTER_LINEAR)
+    cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+    return out
+
+
 def draw_grid(x_num, y_num, frame, color_name):
     """Draws grid onto the frame with the given parameters"""
     dx = frame.shape[1] / x_num
@@ -0,0 +1,263 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from MotionTrackerBeta.functions.display import display_objects
+from MotionTrackerBeta.classes.reader import FrameReader
+
+
+# codecs offered for the export: fourcc, file extension
+EXPORT_CODECS = {
+    "MPEG-4 (mp4v)": ("mp4v", ".mp4"),
+    "H.264 (avc1)": ("avc1", ".mp4"),
+    "Motion JPEG (MJPG)": ("MJPG", ".avi"),
+    "Lossless (FFV1)": ("FFV1", ".mkv"),
+}
+
+
+def available_codecs():
+    """Names of the export codecs the installed OpenCV can encode"""
+    available = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (fourcc, extension) in EXPORT_CODECS.items():
+            writer = cv2.VideoWriter(
+                os.path.join(directory, "probe" + extension),
+                cv2.VideoWriter_fourcc(*fourcc),
+                1,
+                (64, 64),
+            )
+            if writer.isOpened():
+                available.append(name)
+            writer.release()
+    return available
+
+
+def draw_batch(
+    frames, positions, start, stop, objects, box_bool, point_bool, trajectory_length, marker_size, offset, scale, size
+):
+    """Resizes the frames to the output size and draws the objects onto them at that resolution"""
+    drawn = []
+    for pos, frame in zip(positions, frames):
+        if size is not None:
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        drawn.append(
+            display_objects(
+                frame,
+                pos,
+                start,
+                stop,
+                objects,
+                box_bool,
+                point_bool,
+                trajectory_length,
+                marker_size,
+                offset,
+                scale,
+            )
+        )
+    return drawn
+
+
+def put_while(buffer, item, alive):
+    """Waits for free space in the queue while alive returns True, returns False if it stopped"""
+    while alive():
+        try:
+            buffer.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def export_video(
+    camera,
+    objects,
+    start,
+    stop,
+    filename,
+    fps,
+    box_bool,
+    point_bool,
+    trajectory_length,
+    marker_size=20,
+    progress=None,
+    is_running=None,
+    workers=None,
+    batch_size=8,
+    codec="mp4v",
+    scale=1.0,
+    step=1,
+    roi_rect=None,
+):
+    """
+    Exports the section of the video with the tracked objects displayed, without depending on Qt
+
+    Decoding, drawing and encoding run as a pipeline: a reader thread decodes the frames, a pool of threads
+    draws the objects on batches of frames and a writer thread encodes the batches in order.
+
+    :param camera: (cv2.VideoCapture) opened video
+    :param objects: (list of Motion) tracked objects
+    :param start: (int) first frame of the section
+    :param stop: (int) last frame of the section
+    :param filename: (str) path of the exported video
+    :param fps: (float) frame rate of the source video, the exported one is fps / step
+    :param box_bool: (bool) draw the rectangles
+    :param point_bool: (bool) draw the points
+    :param trajectory_length: (int) number of frames of the displayed trajectories
+    :param marker_size: (int) size of the point markers
+    :param progress: (callable) called with the progress in percent
+    :param is_running: (callable) returns False if the export was cancelled
+    :param workers: (int) number of threads drawing the objects, the number of cores by default
+    :param batch_size: (int) number of frames drawn by a thread at once
+    :param codec: (str) fourcc of the exported video
+    :param scale: (float) size of the exported video relative to the (cropped) source
+    :param step: (int) only every step-th frame is exported
+    :param roi_rect: (tuple) (x0, y0, x1, y1) rectangle the exported video is cropped to, None for the full frame
+    :return: ret : returns True if the export was successful
+    :return: message : error message on failure, None if successful or cancelled
+    """
+    workers = workers or os.cpu_count() or 1
+    step = max(int(step), 1)
+    num_of_frames = -(-int(stop - start) // step)
+
+    # output size, the overlay is drawn at this resolution
+    h = int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    w = int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))
+    offset = (0, 0)
+    if roi_rect is not None and len(roi_rect) == 4:
+        offset = (min(roi_rect[0], roi_rect[2]), min(roi_rect[1], roi_rect[3]))
+        w = abs(roi_rect[2] - roi_rect[0])
+        h = abs(roi_rect[3] - roi_rect[1])
+    else:
+        roi_rect = None
+    size = None
+    if scale != 1:
+        size = (max(round(w * scale), 1), max(round(h * scale), 1))
+        w, h = size
+
+    # initialize writer
+    fourcc = cv2.VideoWriter_fourcc(*codec)
+    writer = cv2.VideoWriter(filename, fourcc, fps / step, (w, h))
+    if not writer.isOpened():
+        return False, f"Unable to create video file with the {codec} codec!"
+
+    # goto start
+    camera.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    # trails are converted once, before the threads share them
+    for obj in objects:
+        obj.trail(offset, scale)
+
+    def running():
+        return is_running is None or is_running()
+
+    # drawn batches in frame order, bounded so that decoding can't run far ahead of encoding
+    batches = queue.Queue(maxsize=2 * workers)
+    errors = []
+
+    def write():
+        """Writer thread: encodes the drawn batches in order until the end mark"""
+        while True:
+            item = batches.get()
+            if item is None:
+                return
+            last, future = item
+            try:
+                for frame in future.result():
+                    writer.write(frame)
+            except Exception as e:
+                errors.append(str(e))
+                return
+
+            # update progress, last is the position of the last written frame in the video
+            if progress is not None:
+                progress(min(int((last - start + step) / (stop - start) * 100), 100))
+
+    reader = FrameReader(camera, num_of_frames, roi_rect, 2 * batch_size, step)
+    encoder = threading.Thread(target=write, daemon=True)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    reader.start()
+    encoder.start()
+
+    ret, message = True, None
+    try:
+        index = 0
+        while index < num_of_frames:
+            # stop if cancelled or the writer failed
+            if not running() or not encoder.is_alive():
+                ret = False
+                break
+
+            # read a batch
+            frames = []
+            while len(frames) < batch_size and index + len(frames) < num_of_frames:
+                read, frame = reader.read()
+                if not read:
+                    ret, message = False, "Unable to read video frame!"
+                    break
+                frames.append(frame)
+
+            # draw it in the pool, written in order by the writer
+            if frames:
+                positions = [start + (index + i) * step for i in range(len(frames))]
+                future = pool.submit(
+                    draw_batch,
+                    frames,
+                    positions,
+                    start,
+                    stop,
+                    objects,
+                    box_bool,
+                    point_bool,
+                    trajectory_length,
+                    marker_size,
+                    offset,
+                    scale,
+                    size,
+                )
+                if not put_while(
+                    batches, (positions[-1], future), lambda: running() and encoder.is_alive()
+                ):
+                    ret = False
+                    break
+                index += len(frames)
+            if not ret:
+                break
+    finally:
+        # let the writer finish the submitted batches, drop them if cancelled
+        if not running():
+            while not batches.empty():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    break
+        put_while(batches, None, encoder.is_alive)
+        encoder.join()
+        reader.stop()
+        pool.shutdown(cancel_futures=True)
+        writer.release()
+
+    if errors:
+        return False, f"Unable to export video frame!\n{errors[0]}"
+    if not running():
+        return False, None
+    return ret, message
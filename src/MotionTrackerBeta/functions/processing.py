@@ -0,0 +1,292 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import signal
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from MotionTrackerBeta.functions.differentiate import (
+    differentiate_series,
+    differentiate_batch,
+    tv_gamma,
+    BATCH_METHODS,
+)
+from MotionTrackerBeta.classes.cache import series_key, series_fingerprint
+
+
+DERIVATIVE_FAILED = "Error: A porblem occured while calculating the derivative!"
+
+
+def derivative_error(parameters):
+    """Error message of a failed differentiation"""
+    if parameters[1] == "Sliding Chebychev Polynomial Fit":
+        return DERIVATIVE_FAILED + "\n-pychebfun is not installed.\nInstall it via pip install pychebfun!"
+    return DERIVATIVE_FAILED
+
+
+def init_worker():
+    """Worker process entry: the processes started by the pynumdiff optimization are stopped together with the worker"""
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, stop_worker)
+
+
+def stop_worker(signum, frame):
+    """Terminates the children of the worker process and exits"""
+    for child in multiprocessing.active_children():
+        child.terminate()
+    os._exit(1)
+
+
+def stop_workers(pool):
+    """Shuts the process pool down without waiting for the running tasks, their workers are terminated"""
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def differentiate_all(
+    series,
+    dt,
+    parameters,
+    workers=1,
+    cache=None,
+    param_store=None,
+    progress=None,
+    is_running=None,
+):
+    """
+    Differentiates the series without depending on Qt
+
+    :param series: (list of np.arrays) time series to differentiate
+    :param dt: (float) time step
+    :param parameters: (tuple) parameters of the differentiation, see PostProcessSettings.collectParameters
+    :param workers: (int) number of worker processes of the optimization
+    :param cache: (DiffCache) previously calculated results
+    :param param_store: (ParamStore) previously optimized parameters
+    :param progress: (callable) called with the progress in percent
+    :param is_running: (callable) returns False if the calculation was cancelled
+    :return: ret : returns True if the differentiation was successful
+    :return: result : list of (smoothed, velocity, acceleration) tuples in the order of the series, error message on failure or None if cancelled
+    """
+    engine = Differentiator(dt, parameters, workers, cache, param_store, progress, is_running)
+    return engine.run(series)
+
+
+def differentiate_objects(objects, dt, parameters, **kwargs):
+    """Differentiates the X and Y coordinates of the Motion objects, stores the results in them, the keyword arguments are passed to differentiate_all"""
+    series = []
+    for M in objects:
+        M.reset_output()
+        series.append(M.point_path.array[:, 0])
+        series.append(M.point_path.array[:, 1])
+
+    ret, results = differentiate_all(series, dt, parameters, **kwargs)
+    if not ret:
+        return False, results
+
+    for i, M in enumerate(objects):
+        (xs, vx, ax), (ys, vy, ay) = results[2 * i], results[2 * i + 1]
+
+        # Smoothed postion
+        M.position = np.column_stack((xs, ys))
+
+        # Velocity
+        M.velocity = np.column_stack((vx, vy))
+
+        # Acceleration
+        M.acceleration = np.column_stack((ax, ay))
+    return True, None
+
+
+def differentiate_rotation(rotation, dt, parameters, **kwargs):
+    """Differentiates the angle of the Rotation object, stores the results in it, the keyword arguments are passed to differentiate_all"""
+    ret, results = differentiate_all([rotation.rotation], dt, parameters, **kwargs)
+    if not ret:
+        return False, results
+
+    # Smoothed postion
+    rotation.rotation, rotation.ang_velocity, rotation.ang_acceleration = results[0]
+    return True, None
+
+
+class Differentiator:
+    """Differentiates multiple series: cached results are reused, the linear methods are vectorized, the optimizations run on a process pool"""
+
+    def __init__(
+        self,
+        dt,
+        parameters,
+        workers=1,
+        cache=None,
+        param_store=None,
+        progress=None,
+        is_running=None,
+    ):
+        """Initialization, see differentiate_all"""
+        self.dt = dt
+        self.parameters = parameters
+        self.workers = workers
+        self.cache = cache
+        self.param_store = param_store
+        self.progress = progress
+        self.is_running = is_running
+
+    def running(self):
+        """Returns False if the calculation was cancelled"""
+        return self.is_running is None or self.is_running()
+
+    def report(self, results):
+        """Reports the ratio of the finished series"""
+        if self.progress is not None:
+            self.progress(int(100 / len(results) * (len(results) - results.count(None))))
+
+    def run(self, series):
+        """Differentiates the series, see differentiate_all"""
+        if self.parameters is None:
+            return False, "Error: Invalid parameters!"
+
+        # previously calculated results are reused
+        keys = [series_key(p, self.dt, self.parameters) for p in series]
+        results = [None] * len(series)
+        if self.cache is not None:
+            results = [self.cache.get(key) for key in keys]
+        missing = [k for k in range(len(series)) if results[k] is None]
+
+        if not missing:
+            ret, message = True, None
+        # linear methods, every series in a single call
+        elif not self.parameters[0] and self.parameters[1] in BATCH_METHODS:
+            ret, message = self.run_batch(series, missing, keys, results)
+        # optimizations are worth the worker processes
+        elif self.parameters[0] and self.workers > 1 and len(missing) > 1:
+            ret, message = self.run_parallel(series, missing, keys, results)
+        # fixed parameters cost less than starting the workers, calculate them in this process
+        else:
+            ret, message = self.run_serial(series, missing, keys, results)
+
+        if not ret:
+            return False, message
+        self.save_params()
+        if self.progress is not None:
+            self.progress(100)
+        return True, results
+
+    def run_batch(self, series, missing, keys, results):
+        """Differentiates the missing series with the vectorized methods"""
+        P = np.column_stack([series[k] for k in missing])
+        ret, PS, V, A = differentiate_batch(P, self.dt, self.parameters)
+        if not ret:
+            return False, derivative_error(self.parameters)
+        for j, k in enumerate(missing):
+            self.store_result(results, keys, k, (PS[:, j], V[:, j], A[:, j]))
+        return True, None
+
+    def run_serial(self, series, missing, keys, results):
+        """Differentiates the missing series one after the other"""
+        for k in missing:
+            if not self.running():
+                return False, None
+            ret, ps, v, a, found = differentiate_series(
+                series[k], self.dt, self.parameters, *self.known_params(series[k])
+            )
+            if not ret:
+                return False, derivative_error(self.parameters)
+            self.store_result(results, keys, k, (ps, v, a))
+            self.store_params(series[k], found)
+            self.report(results)
+        return True, None
+
+    def run_parallel(self, series, missing, keys, results):
+        """Optimizes and differentiates the missing series as independent tasks of a process pool"""
+        # not a multiprocessing.Pool, the optimization starts its own worker processes
+        pool = ProcessPoolExecutor(max_workers=min(self.workers, len(missing)), initializer=init_worker)
+        finished = False
+        try:
+            futures = {
+                pool.submit(
+                    differentiate_series,
+                    series[k],
+                    self.dt,
+                    self.parameters,
+                    *self.known_params(series[k])
+                ): k
+                for k in missing
+            }
+            pending = set(futures)
+            while pending:
+                # stop the workers if cancelled
+                if not self.running():
+                    return False, None
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ret, ps, v, a, found = future.result()
+                    if not ret:
+                        return False, derivative_error(self.parameters)
+                    self.store_result(results, keys, futures[future], (ps, v, a))
+                    self.store_params(series[futures[future]], found)
+
+                # per-series progress
+                if done:
+                    self.report(results)
+            finished = True
+            return True, None
+        except Exception as e:
+            return False, f"{DERIVATIVE_FAILED}\n{e}"
+        finally:
+            if finished:
+                pool.shutdown()
+            else:
+                # the optimizations still running are not waited for
+                stop_workers(pool)
+
+    def store_result(self, results, keys, k, result):
+        """Saves the result of the k-th series, adds it to the cache"""
+        results[k] = result
+        if self.cache is not None:
+            self.cache.put(keys[k], result)
+
+    def known_params(self, p):
+        """Previously optimized parameters of the series, the search is skipped if they were found for the same series"""
+        if not self.parameters[0] or self.param_store is None:
+            return None, True
+        gamma = tv_gamma(self.parameters[2], self.dt)
+        params = self.param_store.get(self.parameters[1], series_fingerprint(p), self.dt, gamma)
+        if params is not None:
+            return params, False
+
+        # warm start from the parameters of a similar recording
+        return self.param_store.nearest(self.parameters[1], self.dt, gamma), True
+
+    def store_params(self, p, found):
+        """Saves the parameters found by the optimization"""
+        if not found or self.param_store is None:
+            return
+        gamma = tv_gamma(self.parameters[2], self.dt)
+        self.param_store.put(self.parameters[1], series_fingerprint(p), self.dt, gamma, found)
+
+    def save_params(self):
+        """Writes the parameter store to its file"""
+        if self.param_store is None or not self.parameters[0]:
+            return
+        try:
+            self.param_store.save()
+        except OSError as e:
+            print(e)
@@ -0,0 +1,1280 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import math
+import os
+import multiprocessing
+import numpy as np
+import cv2
+from MotionTrackerBeta.functions.transforms import *
+from MotionTrackerBeta.classes.reader import FrameReader, IndexedCapture, KeyframeIndex
+from MotionTrackerBeta.classes.classes import Trajectory, mapped_file
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from scipy.optimize import linear_sum_assignment
+from queue import Empty
+
+
+TRACKING_FAILED = "Tracking failed!\n Tracker returned with failure!\n\nTry adding or changing the rectangle around the point, it might improve tracking."
+
+# largest distance in pixels between the trackers and the template matches of a stride, larger ones are tracked frame by frame
+STRIDE_TOLERANCE = 2.0
+
+# restarting the trackers costs accuracy, failed strides are retried after at most this many strides
+MAX_PATIENCE = 16
+
+
+def create_tracker(tracker_type):
+    """Creates the OpenCV tracker of the given type"""
+    if tracker_type == "BOOSTING":
+        return cv2.legacy.TrackerBoosting_create()
+    if tracker_type == "MIL":
+        return cv2.legacy.TrackerMIL_create()
+    if tracker_type == "KCF":
+        return cv2.TrackerKCF_create()
+    if tracker_type == "TLD":
+        return cv2.legacy.TrackerTLD_create()
+    if tracker_type == "MEDIANFLOW":
+        return cv2.legacy.TrackerMedianFlow_create()
+    # if tracker_type == "GOTURN":
+    #    return cv2.TrackerGOTURN_create()
+    if tracker_type == "MOSSE":
+        return cv2.legacy.TrackerMOSSE_create()
+    if tracker_type == "CSRT":
+        return cv2.TrackerCSRT_create()
+
+
+class FlowTracker:
+    """Tracks the points of every object together with pyramidal Lucas-Kanade optical flow, with forward-backward error checking"""
+
+    def __init__(self, win_size=21, max_level=3, fb_threshold=1.0):
+        """
+        Initialization
+
+        :param win_size: (int) size of the search window on every pyramid level
+        :param max_level: (int) number of pyramid levels above the frame
+        :param fb_threshold: (float) largest accepted forward-backward error in pixels
+        """
+        self.params = dict(
+            winSize=(win_size, win_size),
+            maxLevel=max_level,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01),
+        )
+        self.fb_threshold = fb_threshold
+        self.gray = None
+        self.points = None
+        self.boxes = None
+        self.offsets = None
+
+    def init(self, frame, boxes, points):
+        """Starts tracking the points, the boxes (x, y, w, h) follow them rigidly, returns (ret, message)"""
+        self.gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.points = np.array(points, dtype=np.float32).reshape(-1, 1, 2)
+        self.boxes = np.array(boxes, dtype=float).reshape(-1, 4)
+        self.offsets = self.points.reshape(-1, 2) - self.boxes[:, :2]
+        return True, None
+
+    def update(self, frame):
+        """Moves every point to the frame, returns (ret, box) of every object like cv2.Tracker.update"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        # one call for every point, then back to the previous frame
+        points, status, _ = cv2.calcOpticalFlowPyrLK(self.gray, gray, self.points, None, **self.params)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.gray, points, None, **self.params)
+        error = np.linalg.norm((back - self.points).reshape(-1, 2), axis=1)
+        found = (status.ravel() == 1) & (back_status.ravel() == 1) & (error <= self.fb_threshold)
+
+        # lost points stay in place, the tracking fails on them
+        self.points = np.where(found[:, None, None], points, self.points)
+        self.gray = gray
+        self.boxes[:, :2] = self.points.reshape(-1, 2) - self.offsets
+        return [(bool(ok), tuple(box)) for ok, box in zip(found, self.boxes)]
+
+
+# marker dictionaries tried on the first frame, the larger sets contain the smaller ones
+ARUCO_DICTIONARIES = [
+    "DICT_4X4_1000",
+    "DICT_5X5_1000",
+    "DICT_6X6_1000",
+    "DICT_7X7_1000",
+    "DICT_ARUCO_ORIGINAL",
+    "DICT_APRILTAG_36h11",
+]
+
+
+def create_marker_detector(dictionary):
+    """Returns a function that detects the markers of the dictionary on a grayscale frame: (corners, ids)"""
+    dictionary = cv2.aruco.getPredefinedDictionary(getattr(cv2.aruco, dictionary))
+    if hasattr(cv2.aruco, "ArucoDetector"):
+        detector = cv2.aruco.ArucoDetector(dictionary, cv2.aruco.DetectorParameters())
+        return lambda gray: detector.detectMarkers(gray)[:2]
+
+    # OpenCV < 4.7
+    parameters = cv2.aruco.DetectorParameters_create()
+    return lambda gray: cv2.aruco.detectMarkers(gray, dictionary, parameters=parameters)[:2]
+
+
+class ArucoTracker:
+    """Follows the objects by detecting fiducial markers once per frame, every object is assigned the marker under its point"""
+
+    def __init__(self, max_missing=15):
+        """Initialization, a marker may be missed on max_missing consecutive frames before the tracking fails"""
+        self.max_missing = max_missing
+        self.detect = None
+        self.ids = None  # marker id -> object index
+        self.boxes = None
+        self.offsets = None  # box corner relative to the marker center
+        self.missing = None
+
+    def init(self, frame, boxes, points):
+        """Finds the dictionary and the marker of every object on the first frame, returns (ret, message)"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.boxes = np.array(boxes, dtype=float).reshape(-1, 4)
+        self.missing = np.zeros(len(self.boxes), dtype=int)
+        best = {}
+        for dictionary in ARUCO_DICTIONARIES:
+            detect = create_marker_detector(dictionary)
+            corners, ids = detect(gray)
+            if ids is None or len(ids) == 0:
+                continue
+            ids = np.asarray(ids).ravel()
+
+            # the marker containing the point, the closest one if none contains it
+            assigned = {}
+            offsets = np.zeros((len(self.boxes), 2))
+            centers = np.array([c.reshape(-1, 2).mean(axis=0) for c in corners])
+            for i, point in enumerate(points):
+                inside = [
+                    k
+                    for k, c in enumerate(corners)
+                    if cv2.pointPolygonTest(c.reshape(-1, 1, 2), (float(point[0]), float(point[1])), False) >= 0
+                ]
+                k = inside[0] if inside else int(np.argmin(np.linalg.norm(centers - point, axis=1)))
+                if not inside and np.linalg.norm(centers[k] - point) > max(self.boxes[i, 2:]):
+                    continue
+                assigned[int(ids[k])] = i
+                offsets[i] = self.boxes[i, :2] - centers[k]
+            if len(assigned) > len(best):
+                best, self.detect, self.offsets = assigned, detect, offsets
+            if len(best) == len(self.boxes):
+                break
+
+        # every object needs its own marker
+        if len(best) < len(self.boxes):
+            return False, "Unable to initialize the tracker!\n\nEvery object needs its own ArUco marker under its point."
+        self.ids = best
+        return True, None
+
+    def update(self, frame):
+        """Detects the markers, returns (ret, box) of every object like cv2.Tracker.update"""
+        corners, ids = self.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        self.missing += 1
+        if ids is not None:
+            for c, marker in zip(corners, np.asarray(ids).ravel()):
+                i = self.ids.get(int(marker))
+                if i is None:
+                    continue
+
+                # the box keeps its size and its offset from the marker center
+                self.boxes[i, :2] = c.reshape(-1, 2).mean(axis=0) + self.offsets[i]
+                self.missing[i] = 0
+
+        # undetected markers keep their last position for a few frames
+        return [(bool(m <= self.max_missing), tuple(box)) for m, box in zip(self.missing, self.boxes)]
+
+
+class BlobTracker:
+    """Follows identical dot markers: one blob detection per frame, blobs are assigned to the predicted positions of the objects"""
+
+    def __init__(self, max_missing=15, gate=1.0):
+        """
+        Initialization
+
+        :param max_missing: (int) number of consecutive frames a marker may be missed before the tracking fails
+        :param gate: (float) largest accepted distance from the predicted position relative to the box size
+        """
+        self.max_missing = max_missing
+        self.gate = gate
+        self.bright = True  # bright markers on a dark background
+        self.area = None  # (min, max) accepted blob area
+        self.positions = None  # blob centers of the objects
+        self.velocities = None
+        self.boxes = None
+        self.offsets = None  # box corner relative to the blob center
+        self.missing = None
+
+    def detect(self, frame):
+        """Centers and areas of the blobs of the frame, one thresholding and connected component pass"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        mode = cv2.THRESH_BINARY if self.bright else cv2.THRESH_BINARY_INV
+        _, mask = cv2.threshold(gray, 0, 255, mode | cv2.THRESH_OTSU)
+        _, labels, stats, centroids = cv2.connectedComponentsWithStats(mask)
+        return centroids[1:], stats[1:, cv2.CC_STAT_AREA], labels
+
+    def init(self, frame, boxes, points):
+        """Finds the blob under the point of every object, returns (ret, message)"""
+        self.boxes = np.array(boxes, dtype=float).reshape(-1, 4)
+        points = np.array(points, dtype=float).reshape(-1, 2)
+        self.missing = np.zeros(len(self.boxes), dtype=int)
+
+        # markers are bright if the pixels under the points are brighter than the mean of the frame, dark otherwise
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+        px = np.clip(points[:, 0].astype(int), 0, w - 1)
+        py = np.clip(points[:, 1].astype(int), 0, h - 1)
+        self.bright = gray[py, px].mean() >= gray.mean()
+
+        centers, areas, labels = self.detect(frame)
+        indices = labels[py, px] - 1
+        if (indices < 0).any() or len(set(indices)) < len(indices):
+            return False, "Unable to initialize the tracker!\n\nEvery object needs its own blob under its point."
+
+        self.positions = centers[indices]
+        self.velocities = np.zeros_like(self.positions)
+        self.offsets = self.boxes[:, :2] - self.positions
+        self.area = (areas[indices].min() / 4, areas[indices].max() * 4)
+        return True, None
+
+    def update(self, frame):
+        """Detects the blobs and assigns them, returns (ret, box) of every object like cv2.Tracker.update"""
+        centers, areas, _ = self.detect(frame)
+        centers = centers[(areas >= self.area[0]) & (areas <= self.area[1])]
+
+        # constant velocity prediction, optimal assignment within the gate
+        predicted = self.positions + self.velocities
+        self.missing += 1
+        if len(centers):
+            cost = np.linalg.norm(predicted[:, None, :] - centers[None, :, :], axis=2)
+            rows, cols = linear_sum_assignment(cost)
+            gates = self.gate * self.boxes[rows, 2:].max(axis=1)
+            accepted = cost[rows, cols] <= gates
+            rows, cols = rows[accepted], cols[accepted]
+            self.velocities[rows] = centers[cols] - self.positions[rows]
+            predicted[rows] = centers[cols]
+            self.missing[rows] = 0
+
+        # undetected markers move on with their velocity for a few frames
+        self.positions = predicted
+        self.boxes[:, :2] = self.positions + self.offsets
+        return [(bool(m <= self.max_missing), tuple(box)) for m, box in zip(self.missing, self.boxes)]
+
+
+class CoarseToFine:
+    """Runs the trackers on a downscaled frame, every box is refined at full resolution by a local sub-pixel template match"""
+
+    def __init__(self, downscale, margin=0.25, min_score=0.5):
+        """
+        Initialization
+
+        :param downscale: (int) the trackers see frames this many times smaller
+        :param margin: (float) search distance of the refinement around the coarse box relative to the box size
+        :param min_score: (float) smallest accepted match score, the coarse box is kept below it
+        """
+        self.downscale = downscale
+        self.margin = margin
+        self.min_score = min_score
+        self.templates = None  # grayscale full resolution patches of the objects
+        self.anchors = None  # box center relative to the template corner
+        self.sizes = None  # (w, h) of the boxes at full and at the downscaled resolution
+        self.shifts = None  # rounding error of the downscaled box centers
+
+    def resize(self, frame):
+        """The frame seen by the trackers"""
+        return cv2.resize(
+            frame, None, fx=1 / self.downscale, fy=1 / self.downscale, interpolation=cv2.INTER_AREA
+        )
+
+    def init(self, frame, boxes):
+        """Cuts the templates of the boxes (x, y, w, h) from the full resolution frame, returns the downscaled boxes"""
+        height, width = frame.shape[:2]
+        self.templates, self.anchors, self.sizes, self.shifts = [], [], [], []
+        coarse_boxes = []
+        for x, y, w, h in boxes:
+            # boxes at the edge of the frame stay there, empty boxes are not
+            coarse = (
+                max(round(x / self.downscale), 0),
+                max(round(y / self.downscale), 0),
+                max(round(w / self.downscale), 1),
+                max(round(h / self.downscale), 1),
+            )
+            coarse_boxes.append(coarse)
+            self.sizes.append(((w, h), coarse[2:]))
+            self.shifts.append(
+                (
+                    x + w / 2 - (coarse[0] + coarse[2] / 2) * self.downscale,
+                    y + h / 2 - (coarse[1] + coarse[3] / 2) * self.downscale,
+                )
+            )
+
+            # the part of the box inside the frame
+            x0, y0 = max(int(round(x)), 0), max(int(round(y)), 0)
+            x1, y1 = min(int(round(x + w)), width), min(int(round(y + h)), height)
+            if x1 - x0 < 3 or y1 - y0 < 3:
+                self.templates.append(None)
+                self.anchors.append(None)
+                continue
+            self.templates.append(cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY))
+            self.anchors.append((x + w / 2 - x0, y + h / 2 - y0))
+        return coarse_boxes
+
+    def refine(self, frame, results):
+        """Scales the (ret, box) results of the trackers to the full resolution frame and refines their position"""
+        height, width = frame.shape[:2]
+        refined = []
+        for (ret, box), template, anchor, ((w0, h0), (cw0, ch0)), (sx, sy) in zip(
+            results, self.templates, self.anchors, self.sizes, self.shifts
+        ):
+            # coarse box, the size follows the relative size change of the downscaled box
+            cx = (box[0] + box[2] / 2) * self.downscale + sx
+            cy = (box[1] + box[3] / 2) * self.downscale + sy
+            w, h = w0 * box[2] / cw0, h0 * box[3] / ch0
+            if ret and template is not None:
+                cx, cy = self.match(frame, template, anchor, cx, cy, width, height)
+            refined.append((ret, (cx - w / 2, cy - h / 2, w, h)))
+        return refined
+
+    def match(self, frame, template, anchor, cx, cy, width, height):
+        """Sub-pixel position of the box center near (cx, cy), unchanged if the template is not found"""
+        th, tw = template.shape
+        margin = max(int(self.margin * max(tw, th)), 2 * self.downscale)
+        x0 = max(int(round(cx - anchor[0])) - margin, 0)
+        y0 = max(int(round(cy - anchor[1])) - margin, 0)
+        x1 = min(int(round(cx - anchor[0])) + tw + margin, width)
+        y1 = min(int(round(cy - anchor[1])) + th + margin, height)
+        if x1 - x0 < tw or y1 - y0 < th:
+            return cx, cy
+
+        # normalized correlation in the neighbourhood of the coarse box only
+        region = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        scores = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (px, py) = cv2.minMaxLoc(scores)
+        if score < self.min_score:
+            return cx, cy
+        return (
+            x0 + px + peak_offset(scores[py, max(px - 1, 0) : px + 2], px > 0) + anchor[0],
+            y0 + py + peak_offset(scores[max(py - 1, 0) : py + 2, px], py > 0) + anchor[1],
+        )
+
+
+def peak_offset(values, inner):
+    """Sub-pixel offset of the maximum from a parabola fitted on it and its two neighbours"""
+    if not inner or len(values) < 3:
+        return 0.0
+    left, center, right = values
+    curvature = left - 2 * center + right
+    if curvature >= 0:
+        return 0.0
+    return float(np.clip((left - right) / (2 * curvature), -0.5, 0.5))
+
+
+# trackers that follow every object together
+GROUP_TRACKERS = {"LK-FLOW": FlowTracker, "ARUCO": ArucoTracker, "BLOB": BlobTracker}
+
+
+def track_objects(
+    camera,
+    objects,
+    start,
+    stop,
+    tracker_type,
+    size,
+    roi_rect,
+    buffer_size=8,
+    workers=1,
+    progress=None,
+    is_running=None,
+    sizes=None,
+    directory=None,
+    downscale=1,
+    stride=1,
+    stride_threshold=5.0,
+):
+    """
+    Tracks the objects through the section of the video without depending on Qt
+
+    :param camera: (cv2.VideoCapture) opened video
+    :param objects: (list of tuples) starting (point, rectangle) of the objects
+    :param start: (int) first frame of the section
+    :param stop: (int) last frame of the section
+    :param tracker_type: (str) name of the OpenCV tracker
+    :param size: (bool) track the size change of the objects
+    :param roi_rect: (tuple) region of interest (x0, y0, x1, y1) or (0, 0) if not set
+    :param buffer_size: (int) number of frames decoded ahead of the trackers
+    :param workers: (int) number of threads updating the trackers
+    :param progress: (callable) called with the progress in percent
+    :param is_running: (callable) returns False if the tracking was cancelled
+    :param sizes: (list of tuples) reference (w, h) of the size change, the starting rectangles by default
+    :param directory: (str) directory of the memory-mapped paths, kept in memory if None
+    :param downscale: (int) the trackers run on frames this many times smaller, the boxes are refined at full resolution
+    :param stride: (int) only every stride-th frame is tracked, the frames in between are interpolated
+    :param stride_threshold: (float) largest motion in pixels during a stride, faster parts are tracked frame by frame
+    :return: ret : returns True if the tracking was successful
+    :return: result : (rectangle_path, point_path, size_change) Trajectories of every object, error message on failure or None if cancelled
+    """
+
+    # set camera to start frame, read it
+    camera.set(cv2.CAP_PROP_POS_FRAMES, start - 1)
+    ret, frame = camera.read()
+
+    # check errors
+    if not ret:
+        return False, "Unable to read video frame!"
+
+    # crop roi if provided
+    if len(roi_rect) == 4:
+        frame = crop_roi(frame, roi_rect)
+
+    # reference sizes of the size change
+    if sizes is None:
+        sizes = [(rectangle[2], rectangle[3]) for point, rectangle in objects]
+
+    # store data, preallocated for the whole section
+    paths = []
+    capacity = int(stop - start) + 1
+    for (point, rectangle), (w0, h0) in zip(objects, sizes):
+        rectangle_path = Trajectory.create(4, capacity, directory)
+        point_path = Trajectory.create(2, capacity, directory)
+        size_change = Trajectory.create(None, capacity if size else 0, directory)
+        rectangle_path.append(rectangle)
+        point_path.append(point)
+        if size:
+            size_change.append((rectangle[2] / w0 + rectangle[3] / h0) / 2)
+        paths.append((rectangle_path, point_path, size_change))
+
+    # worker pool for the tracker updates, OpenCV releases the GIL while updating
+    pool = None
+    if workers > 1 and tracker_type not in GROUP_TRACKERS:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    start_trackers = lambda frame, boxes, points: create_update(
+        frame, boxes, points, tracker_type, downscale, pool
+    )
+
+    reader = None
+    try:
+        # boxes and points in the cropped frame
+        ret, update = start_trackers(
+            frame,
+            [rect2cropped(rectangle, roi_rect) for point, rectangle in objects],
+            [(point[0] - roi_rect[0], point[1] - roi_rect[1]) for point, rectangle in objects],
+        )
+        if not ret:
+            return False, update
+
+        # every stride-th frame is tracked, the reader can not skip ahead of the trackers
+        if stride > 1:
+            return update_with_stride(
+                update, start_trackers, camera, frame, objects, sizes, paths, start, stop,
+                size, roi_rect, stride, stride_threshold, progress, is_running,
+            )
+
+        # decode frames on a separate thread while the trackers are updated
+        reader = FrameReader(camera, int(stop - start), roi_rect, buffer_size)
+        reader.start()
+        return update_trackers(
+            update, objects, sizes, paths, reader, start, stop, size, roi_rect, progress, is_running
+        )
+    finally:
+        for path in paths:
+            for trajectory in path:
+                trajectory.flush()
+        if pool is not None:
+            pool.shutdown()
+        if reader is not None:
+            reader.stop()
+
+
+def create_update(frame, boxes, points, tracker_type, downscale=1, pool=None):
+    """
+    Initializes the trackers of the objects on the cropped frame
+
+    :param frame: (np.ndarray) cropped frame
+    :param boxes: (list of tuples) (x, y, w, h) of the objects in the cropped frame
+    :param points: (list of tuples) (x, y) of the objects in the cropped frame
+    :param tracker_type: (str) name of the tracker
+    :param downscale: (int) the trackers run on frames this many times smaller, the boxes are refined at full resolution
+    :param pool: (ThreadPoolExecutor) updates the OpenCV trackers in parallel if given
+    :return: ret : returns True if every tracker was initialized
+    :return: update : function returning (ret, box) of every object on a cropped frame, error message on failure
+    """
+
+    # downscaled boxes for the coarse trackers
+    pyramid = None
+    if downscale > 1:
+        pyramid = CoarseToFine(downscale)
+        boxes = pyramid.init(frame, boxes)
+        points = [(x / downscale, y / downscale) for x, y in points]
+        frame = pyramid.resize(frame)
+
+    if tracker_type in GROUP_TRACKERS:
+        # a single tracker follows every object
+        tracker = GROUP_TRACKERS[tracker_type]()
+        ret, message = tracker.init(frame, boxes, points)
+        if not ret:
+            return False, message
+        update = tracker.update
+    else:
+        # creating tracker objects, adding them into list
+        trackers = []
+        for box in boxes:
+            tracker = create_tracker(tracker_type)
+
+            # initialize cv2 with starting frame
+            try:
+                tracker.init(frame, tuple(round(v) for v in box))
+            except:
+                return False, "Unable to initialize the tracker!"
+            trackers.append(tracker)
+        if pool is not None:
+            update = lambda frame: list(pool.map(lambda tracker: tracker.update(frame), trackers))
+        else:
+            update = lambda frame: [tracker.update(frame) for tracker in trackers]
+
+    # coarse trackers, results refined on the full resolution frame
+    if pyramid is not None:
+        coarse_update = update
+        update = lambda frame: pyramid.refine(frame, coarse_update(pyramid.resize(frame)))
+    return True, update
+
+
+def point_offsets(objects):
+    """Position of the points relative to their rectangles, constant during the tracking"""
+    return [
+        (
+            (point[0] - rectangle[0]) / rectangle[2],
+            (point[1] - rectangle[1]) / rectangle[3],
+        )
+        for point, rectangle in objects
+    ]
+
+
+def object_rows(box, offset, size0, roi_rect):
+    """(rectangle, point, size change) of an object in the full frame from its box in the cropped frame"""
+    x, y, w, h = box
+
+    # for the calculation of the point
+    dx, dy = offset
+
+    # for zoom
+    w0, h0 = size0
+    return (
+        (roi_rect[0] + x, roi_rect[1] + y, w, h),
+        (roi_rect[0] + x + dx * w, roi_rect[1] + y + dy * h),
+        (w / w0 + h / h0) / 2,
+    )
+
+
+def update_trackers(
+    update, objects, sizes, paths, reader, start, stop, size, roi_rect, progress, is_running
+):
+    """Updates the trackers with the frames provided by the reader, update returns (ret, box) of every object"""
+
+    # constants of the objects for the calculation of the point and the size change
+    offsets = point_offsets(objects)
+
+    # tracking loop
+    last_progress = None
+    for j in range(int(stop - start)):
+        # break loop if cancelled
+        if is_running is not None and not is_running():
+            return False, None
+
+        # read frame, already cropped by the reader
+        ret, frame = reader.read()
+
+        # check for errors
+        if not ret:
+            return False, "Unable to read video frame!"
+
+        # update trackers, every object is updated before the frame advances
+        try:
+            results = update(frame)
+        except Exception as e:
+            return False, f"Tracking failed!\n{e}\n\nTry adding or changing the rectangle around the point, it might improve tracking."
+
+        for i in range(len(results)):
+            ret, roi_box = results[i]
+
+            # handle errors
+            if not ret:
+                return False, TRACKING_FAILED
+
+            # traditional tracking
+            rectangle_path, point_path, size_change = paths[i]
+            rectangle, point, change = object_rows(roi_box, offsets[i], sizes[i], roi_rect)
+            rectangle_path.append(rectangle)
+            point_path.append(point)
+
+            # change of size
+            if size:
+                size_change.append(change)
+
+        # progress, only reported when it changes
+        value = math.ceil(j / (stop - start) * 100)
+        if progress is not None and value != last_progress:
+            progress(value)
+            last_progress = value
+
+    return True, paths
+
+
+def update_with_stride(
+    update,
+    start_trackers,
+    camera,
+    frame,
+    objects,
+    sizes,
+    paths,
+    start,
+    stop,
+    size,
+    roi_rect,
+    stride,
+    threshold,
+    progress,
+    is_running,
+    tolerance=STRIDE_TOLERANCE,
+):
+    """
+    Updates the trackers on every stride-th frame only, the frames in between are interpolated linearly
+
+    Frames that are not tracked are skipped with camera.grab(). The first stride is tracked frame by frame
+    to measure the velocities of the objects. Every stride is verified independently of the trackers:
+    before the trackers see the frame, the objects of the last verified frame are found by template
+    matching near the positions their velocities predict, then the trackers must agree with the matches.
+    A stride that is not verified or in which an object moves more than the threshold is tracked frame
+    by frame from the last verified frame, the trackers are restarted only if they already saw the stride.
+
+    :param update: (callable) returns (ret, box) of every object on a cropped frame
+    :param start_trackers: (callable) restarts the trackers on a cropped frame from (boxes, points), returns (ret, update)
+    :param camera: (cv2.VideoCapture) video positioned after the first frame of the section
+    :param frame: (np.ndarray) cropped first frame of the section
+    :param stride: (int) number of frames between the tracked frames
+    :param threshold: (float) largest motion in pixels that is interpolated
+    :param tolerance: (float) largest distance in pixels between the trackers and the template matches
+    :return: ret : returns True if the tracking was successful
+    :return: result : paths of the objects, error message on failure or None if cancelled
+    """
+
+    # constants of the objects for the calculation of the point and the size change
+    offsets = point_offsets(objects)
+
+    # boxes and points of the last verified frame in the cropped frame, the trackers restart from them
+    boxes = [rect2cropped(rectangle, roi_rect) for point, rectangle in objects]
+    points = [(point[0] - roi_rect[0], point[1] - roi_rect[1]) for point, rectangle in objects]
+    velocities = np.zeros((len(objects), 2))  # pixels per frame during the last verified step
+
+    length = int(stop - start)
+    position = 0  # index of the last verified frame in the section
+    step = 1  # the velocities are measured frame by frame before the first stride
+    settled = 0  # frames tracked one by one since the last stride
+    moved = 0.0  # motion during the last stride of these frames
+    patience = stride  # frames tracked one by one before the next stride, doubled by every failed stride
+    last_progress = None
+    while position < length:
+        # break loop if cancelled
+        if is_running is not None and not is_running():
+            return False, None
+
+        # skip the frames in between without retrieving them
+        k = min(step, length - position)
+        ret = all(camera.grab() for _ in range(k - 1))
+        if ret:
+            ret, next_frame = camera.read()
+
+        # check for errors
+        if not ret:
+            return False, "Unable to read video frame!"
+        if len(roi_rect) == 4:
+            next_frame = crop_roi(next_frame, roi_rect)
+
+        # the objects of the verified frame near their predicted positions, the trackers haven't seen the stride yet
+        matches = None
+        if k > 1:
+            predicted = [
+                (x + k * vx, y + k * vy, w, h) for (x, y, w, h), (vx, vy) in zip(boxes, velocities)
+            ]
+            matches = match_boxes(frame, next_frame, boxes, predicted, math.ceil(threshold))
+            if matches is None or max(box_distance(box, match) for box, match in zip(boxes, matches)) > threshold:
+                # too fast to interpolate or not found, track the stride frame by frame
+                camera.set(cv2.CAP_PROP_POS_FRAMES, start + position)
+                step, settled, moved = 1, 0, 0.0
+                patience = min(2 * patience, MAX_PATIENCE * stride)
+                continue
+
+        # update trackers
+        try:
+            results = update(next_frame)
+        except Exception as e:
+            return False, f"Tracking failed!\n{e}\n\nTry adding or changing the rectangle around the point, it might improve tracking."
+
+        # largest motion of the objects since the last verified frame
+        next_boxes = [box for ret, box in results]
+        next_points = [
+            (x + dx * w, y + dy * h) for (x, y, w, h), (dx, dy) in zip(next_boxes, offsets)
+        ]
+        lost = not all(ret for ret, box in results)
+        motion = max(math.dist(point, next_point) for point, next_point in zip(points, next_points))
+
+        # the trackers disagree with the matches, restart them on the verified frame and track the stride frame by frame
+        if matches is not None and (
+            lost or max(box_distance(box, match) for box, match in zip(next_boxes, matches)) > tolerance
+        ):
+            ret, update = start_trackers(frame, boxes, points)
+            if not ret:
+                return False, update
+            camera.set(cv2.CAP_PROP_POS_FRAMES, start + position)
+            step, settled, moved = 1, 0, 0.0
+            patience = min(2 * patience, MAX_PATIENCE * stride)
+            continue
+
+        # handle errors
+        if lost:
+            return False, TRACKING_FAILED
+
+        # the skipped frames are interpolated between the tracked ones
+        weights = np.arange(1, k + 1)[:, None] / k
+        for box, offset, size0, (rectangle_path, point_path, size_change) in zip(next_boxes, offsets, sizes, paths):
+            rectangle, point, change = object_rows(box, offset, size0, roi_rect)
+            rectangle_path.extend(rectangle_path[-1] + weights * (np.array(rectangle) - rectangle_path[-1]))
+            point_path.extend(point_path[-1] + weights * (np.array(point) - point_path[-1]))
+
+            # change of size
+            if size:
+                size_change.extend(size_change[-1] + weights[:, 0] * (change - size_change[-1]))
+
+        # back to the stride once the objects have slowed down
+        if k > 1:
+            patience = stride
+        elif stride > 1:
+            settled += 1
+            moved += motion
+            if settled % stride == 0:
+                if settled >= patience and moved <= threshold:
+                    step = stride
+                moved = 0.0
+
+        velocities = (np.array(next_points) - np.array(points)) / k
+        frame, boxes, points = next_frame, next_boxes, next_points
+        position += k
+
+        # progress, only reported when it changes
+        value = math.ceil(position / length * 100)
+        if progress is not None and value != last_progress:
+            progress(value)
+            last_progress = value
+
+    return True, paths
+
+
+def box_distance(box, other):
+    """Distance of the centers of two (x, y, w, h) boxes"""
+    return math.dist((box[0] + box[2] / 2, box[1] + box[3] / 2), (other[0] + other[2] / 2, other[1] + other[3] / 2))
+
+
+def match_boxes(frame, next_frame, boxes, predicted, margin, min_score=0.5):
+    """
+    Finds the content of the boxes of the frame near the predicted boxes of the next frame
+
+    :param margin: (int) search distance around the predicted boxes in pixels
+    :param min_score: (float) smallest accepted normalized correlation
+    :return: sub-pixel (x, y, w, h) of every box in the next frame, None if a box is outside the frames or not found
+    """
+    height, width = frame.shape[:2]
+    matches = []
+    for (x, y, w, h), (px, py, _, _) in zip(boxes, predicted):
+        x0, y0 = int(round(x)), int(round(y))
+        x1, y1 = int(round(x + w)), int(round(y + h))
+        sx0, sy0 = int(round(px)) - margin, int(round(py)) - margin
+        sx1, sy1 = sx0 + (x1 - x0) + 2 * margin, sy0 + (y1 - y0) + 2 * margin
+        if min(x0, y0, sx0, sy0) < 0 or max(x1, sx1) > width or max(y1, sy1) > height or x1 - x0 < 3 or y1 - y0 < 3:
+            return None
+
+        # normalized correlation in the neighbourhood of the prediction only
+        template = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        region = cv2.cvtColor(next_frame[sy0:sy1, sx0:sx1], cv2.COLOR_BGR2GRAY)
+        scores = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (mx, my) = cv2.minMaxLoc(scores)
+        if score < min_score:
+            return None
+        matches.append(
+            (
+                x + sx0 - x0 + mx + peak_offset(scores[my, max(mx - 1, 0) : mx + 2], mx > 0),
+                y + sy0 - y0 + my + peak_offset(scores[max(my - 1, 0) : my + 2, mx], my > 0),
+                w,
+                h,
+            )
+        )
+    return matches
+
+
+def track_objects_in_process(
+    filename,
+    objects,
+    start,
+    stop,
+    tracker_type,
+    size,
+    roi_rect,
+    group,
+    queue,
+    cancel,
+    sizes=None,
+    directory=None,
+    downscale=1,
+    stride=1,
+    stride_threshold=5.0,
+):
+    """Worker process entry: tracks a group of objects with its own VideoCapture, reports progress on the queue"""
+    is_running = lambda: not cancel.is_set()
+    camera = IndexedCapture(filename, KeyframeIndex.open(filename, is_running))
+    try:
+        return track_objects(
+            camera,
+            objects,
+            start,
+            stop,
+            tracker_type,
+            size,
+            roi_rect,
+            progress=lambda value: queue.put((group, value)),
+            is_running=is_running,
+            sizes=sizes,
+            directory=directory,
+            downscale=downscale,
+            stride=stride,
+            stride_threshold=stride_threshold,
+        )
+    finally:
+        camera.release()
+
+
+def split_section(start, stop, chunks, overlap):
+    """
+    Splits the section into time chunks that can be tracked in parallel
+
+    :param start: (int) first frame of the section
+    :param stop: (int) last frame of the section
+    :param chunks: (int) number of chunks
+    :param overlap: (int) number of frames a chunk starts before the end of the previous one
+    :return: list of (first frame, boundary, last frame) tuples, the chunk is kept from its boundary
+    """
+    length = math.ceil((stop - start) / chunks)
+    result = []
+    for boundary in range(start, stop, length):
+        result.append((max(start, boundary - overlap), boundary, min(boundary + length, stop)))
+    return result
+
+
+def seed_objects(paths, index):
+    """Returns the (point, rectangle) of every object at the given index of the paths"""
+    return [(point_path[index], rectangle_path[index]) for rectangle_path, point_path, size_change in paths]
+
+
+def delete_paths(paths):
+    """Releases the storage of paths that are no longer needed"""
+    for path in paths:
+        for trajectory in path:
+            trajectory.delete()
+
+
+def diverged_chunks(chunks, results, tolerance):
+    """
+    Compares the consecutive time chunks on their boundary frames
+
+    :param chunks: (list of tuples) chunks returned by split_section
+    :param results: (list) paths of every chunk as returned by track_objects
+    :param tolerance: (float) maximal distance in pixels of the two chunks on the boundary frame
+    :return: indices of the chunks that disagree with the previous one
+    """
+    diverged = []
+    for k in range(1, len(chunks)):
+        first, boundary, last = chunks[k]
+        for previous, current in zip(results[k - 1], results[k]):
+            # the previous chunk ends on the boundary frame
+            x0, y0 = previous[1][-1]
+            x1, y1 = current[1][boundary - first]
+            if math.hypot(x1 - x0, y1 - y0) > tolerance:
+                diverged.append(k)
+                break
+    return diverged
+
+
+def stitch_chunks(chunks, results, directory=None):
+    """
+    Joins the paths of the time chunks at their boundaries
+
+    :param chunks: (list of tuples) chunks returned by split_section
+    :param results: (list) paths of every chunk as returned by track_objects
+    :param directory: (str) directory of the memory-mapped output, kept in memory if None
+    :return: joined (rectangle_path, point_path, size_change) of every object
+    """
+    capacity = chunks[-1][2] - chunks[0][0] + 1
+    paths = []
+    for i in range(len(results[0])):
+        joined = tuple(
+            Trajectory.create(part.columns, capacity, directory) for part in results[0][i]
+        )
+        for k, (first, boundary, last) in enumerate(chunks):
+            # keep every chunk after its boundary
+            skip = boundary - first + 1 if k > 0 else 0
+            for trajectory, part in zip(joined, results[k][i]):
+                trajectory.extend(part.array[skip:])
+                trajectory.flush()
+        paths.append(joined)
+    return paths
+
+
+class SectionTracker:
+    """Qt-free tracking of a section of the video, chooses between the single process, the process pool and the time chunk modes"""
+
+    def __init__(
+        self,
+        camera,
+        start,
+        stop,
+        tracker_type,
+        size,
+        roi_rect,
+        buffer_size=8,
+        workers=1,
+        processes=1,
+        filename=None,
+        chunks=1,
+        chunk_overlap=30,
+        chunk_tolerance=5.0,
+        seed_tracker_type="MOSSE",
+        session_dir=None,
+        downscale=1,
+        stride=1,
+        stride_threshold=5.0,
+        progress=None,
+        message=None,
+        is_running=None,
+    ):
+        """
+        Initialization
+
+        :param camera: (cv2.VideoCapture) opened video
+        :param start: (int) first frame of the section
+        :param stop: (int) last frame of the section
+        :param tracker_type: (str) name of the OpenCV tracker
+        :param size: (bool) track the size change of the objects
+        :param roi_rect: (tuple) region of interest (x0, y0, x1, y1), None if not set
+        :param buffer_size: (int) number of frames decoded ahead of the trackers
+        :param workers: (int) number of threads updating the trackers
+        :param processes: (int) number of processes the objects are shared between
+        :param filename: (str) path of the video, required to open it in the worker processes
+        :param chunks: (int) number of time chunks tracked in parallel
+        :param chunk_overlap: (int) frames tracked by two consecutive chunks
+        :param chunk_tolerance: (float) allowed distance of the chunks at the boundary (pixels)
+        :param seed_tracker_type: (str) fast tracker seeding the chunks
+        :param session_dir: (str) paths are memory-mapped to files in this directory if set
+        :param downscale: (int) the trackers run on frames this many times smaller, the boxes are refined at full resolution
+        :param stride: (int) only every stride-th frame is tracked, the frames in between are interpolated
+        :param stride_threshold: (float) largest motion in pixels during a stride, faster parts are tracked frame by frame
+        :param progress: (callable) called with the progress in percent
+        :param message: (callable) called with the description of the current step
+        :param is_running: (callable) returns False if the tracking was cancelled
+        """
+        self.camera = camera
+        self.section_start = start
+        self.section_stop = stop
+        self.tracker_type = tracker_type
+        self.size = size
+        self.roi_rect = (0, 0) if roi_rect is None else roi_rect  # in x0, y1, x1, y1 format
+        self.buffer_size = buffer_size
+        self.workers = workers
+        self.processes = processes
+        self.filename = filename
+        self.chunks = chunks
+        self.chunk_overlap = chunk_overlap
+        self.chunk_tolerance = chunk_tolerance
+        self.seed_tracker_type = seed_tracker_type
+        self.session_dir = session_dir
+        self.downscale = downscale
+        self.stride = stride
+        self.stride_threshold = stride_threshold
+        self.progress = progress
+        self.message = message
+        self.is_running = is_running
+
+    def running(self):
+        """Returns False if the tracking was cancelled"""
+        return self.is_running is None or self.is_running()
+
+    def report(self, value):
+        """Reports the progress"""
+        if self.progress is not None:
+            self.progress(value)
+
+    def describe(self, text):
+        """Reports the current step"""
+        if self.message is not None:
+            self.message(text)
+
+    def prepare_session(self):
+        """Creates the session directory, removes the files of the previous run, returns False and the message on failure"""
+        if self.session_dir is None:
+            return True, None
+        try:
+            os.makedirs(self.session_dir, exist_ok=True)
+            for name in os.listdir(self.session_dir):
+                if name.endswith(".dat"):
+                    try:
+                        os.remove(os.path.join(self.session_dir, name))
+                    except OSError:
+                        pass
+        except OSError as e:
+            return False, f"Unable to create the session directory!\n{e}"
+        return True, None
+
+    def timestamps(self, fps, timestamp=None):
+        """Fills the timestamp Trajectory of the section (memory-mapped to a new file in the session directory), a new one is created if not given"""
+        frames = int(self.section_stop - self.section_start) + 1
+        if timestamp is None:
+            timestamp = Trajectory()
+        else:
+            # the file of the previous run is unmapped before it is removed
+            timestamp.delete()
+        timestamp_file = None
+        if self.session_dir is not None:
+            timestamp_file = mapped_file(self.session_dir, "timestamp-")
+        timestamp.reset(frames, timestamp_file)
+        timestamp.extend(np.arange(frames) / fps)
+        timestamp.flush()
+        return timestamp
+
+    def track(self, objects):
+        """
+        Tracks the objects through the section
+
+        :param objects: (list of tuples) starting (point, rectangle) of the objects
+        :return: ret : returns True if the tracking was successful
+        :return: result : (rectangle_path, point_path, size_change) Trajectories of every object, error message on failure or None if cancelled
+        """
+        ret, result = self.prepare_session()
+        if not ret:
+            return False, result
+
+        try:
+            if (
+                self.chunks > 1
+                and self.filename
+                and self.section_stop - self.section_start > self.chunks * self.chunk_overlap
+            ):
+                return self.track_in_chunks(objects)
+            elif self.processes > 1 and len(objects) > 1 and self.filename:
+                return self.track_in_processes(objects)
+            return self.track_objects(
+                objects, self.section_start, self.section_stop, progress=self.report
+            )
+        except OSError as e:
+            # memory-mapped files that can't be created or grown
+            return False, f"Unable to store the paths!\n{e}"
+        finally:
+            # set camera position to start
+            self.camera.set(cv2.CAP_PROP_POS_FRAMES, self.section_start)
+
+    def track_objects(self, objects, start, stop, tracker_type=None, size=None, progress=None, sizes=None):
+        """Tracks the objects in this process, with the tracker of the section unless another one is given"""
+        return track_objects(
+            self.camera,
+            objects,
+            start,
+            stop,
+            self.tracker_type if tracker_type is None else tracker_type,
+            self.size if size is None else size,
+            self.roi_rect,
+            self.buffer_size,
+            self.workers,
+            progress=progress,
+            is_running=self.running,
+            sizes=sizes,
+            directory=self.session_dir,
+            downscale=self.downscale,
+            stride=self.stride,
+            stride_threshold=self.stride_threshold,
+        )
+
+    def track_in_processes(self, objects):
+        """Splits the objects into groups, every group is tracked in a separate process with its own VideoCapture"""
+
+        # contiguous groups so that the results can be merged in order
+        n = math.ceil(len(objects) / min(self.processes, len(objects)))
+        groups = [objects[i : i + n] for i in range(0, len(objects), n)]
+        jobs = [
+            (group, self.section_start, self.section_stop, None, self.session_dir)
+            for group in groups
+        ]
+
+        # merge the results in order
+        ret, results = self.run_in_processes(jobs, self.tracker_type, (0, 100))
+        if not ret:
+            return False, results
+        return True, [path for result in results for path in result]
+
+    def track_in_chunks(self, objects):
+        """Splits the section into time chunks tracked in parallel, seeded by a fast first pass"""
+
+        # fast first pass for the seeds of the chunks
+        self.describe("Seeding time chunks...")
+        ret, seed_paths = self.track_objects(
+            objects,
+            self.section_start,
+            self.section_stop,
+            self.seed_tracker_type,
+            False,
+            progress=lambda value: self.report(int(value * 0.2)),
+        )
+        if not ret:
+            if seed_paths is None:
+                return False, None
+
+            # the fast tracker lost an object, track the section in one piece
+            self.describe("Tracking objects...")
+            return self.track_objects(
+                objects, self.section_start, self.section_stop, progress=self.report
+            )
+
+        # the size change is relative to the rectangles set by the user
+        sizes = [(rectangle[2], rectangle[3]) for point, rectangle in objects]
+
+        # track the chunks in parallel
+        self.describe("Tracking objects...")
+        chunks = split_section(
+            self.section_start, self.section_stop, self.chunks, self.chunk_overlap
+        )
+        jobs = [
+            (
+                seed_objects(seed_paths, first - self.section_start) if k > 0 else objects,
+                first,
+                last,
+                sizes,
+                self.session_dir,
+            )
+            for k, (first, boundary, last) in enumerate(chunks)
+        ]
+        ret, results = self.run_in_processes(jobs, self.tracker_type, (20, 100))
+        delete_paths(seed_paths)
+        if not ret:
+            return False, results
+
+        # re-track the chunks that diverged from the previous chunk
+        diverged = diverged_chunks(chunks, results, self.chunk_tolerance)
+        while diverged and self.running():
+            k = diverged[0]
+            first, boundary, last = chunks[k]
+            self.describe(
+                f"Re-tracking section {k + 1}/{len(chunks)}, it diverged at frame {boundary}..."
+            )
+            ret, result = self.track_objects(
+                seed_objects(results[k - 1], -1), boundary, last, sizes=sizes
+            )
+            if not ret:
+                return False, result
+            delete_paths(results[k])
+            chunks[k] = (boundary, boundary, last)
+            results[k] = result
+            diverged = diverged_chunks(chunks, results, self.chunk_tolerance)
+        if not self.running():
+            return False, None
+
+        # join the chunks at their boundaries
+        paths = stitch_chunks(chunks, results, self.session_dir)
+        for result in results:
+            delete_paths(result)
+        return True, paths
+
+    def run_in_processes(self, jobs, tracker_type, progress_range):
+        """Runs the (objects, start, stop, sizes, directory) tracking jobs in worker processes, aggregates their progress"""
+        job_progress = [0] * len(jobs)
+        low, high = progress_range
+
+        # new interpreters, forked workers would inherit the locks held by the threads of this process
+        context = multiprocessing.get_context("spawn")
+
+        # shared objects for progress and cancellation
+        manager = context.Manager()
+        queue = manager.Queue()
+        cancel = manager.Event()
+
+        try:
+            with ProcessPoolExecutor(max_workers=len(jobs), mp_context=context) as executor:
+                futures = [
+                    executor.submit(
+                        track_objects_in_process,
+                        self.filename,
+                        objects,
+                        start,
+                        stop,
+                        tracker_type,
+                        self.size,
+                        self.roi_rect,
+                        g,
+                        queue,
+                        cancel,
+                        sizes,
+                        directory,
+                        self.downscale,
+                        self.stride,
+                        self.stride_threshold,
+                    )
+                    for g, (objects, start, stop, sizes, directory) in enumerate(jobs)
+                ]
+
+                # aggregate progress until every job has finished
+                while not all(future.done() for future in futures):
+                    # stop the other jobs if cancelled or one of them failed
+                    if not self.running() or any(
+                        future.done() and (future.exception() is not None or not future.result()[0])
+                        for future in futures
+                    ):
+                        cancel.set()
+                    try:
+                        g, value = queue.get(timeout=0.1)
+                    except Empty:
+                        continue
+                    job_progress[g] = value
+                    self.report(
+                        int(low + (high - low) * sum(job_progress) / (100 * len(jobs)))
+                    )
+
+                # collect the results in order
+                results = []
+                error = None
+                for future in futures:
+                    try:
+                        ret, result = future.result()
+                    except Exception as e:
+                        ret, result = False, f"Tracking failed!\n{e}"
+                    if ret:
+                        results.append(result)
+                    elif error is None:
+                        # the other jobs return None when they are stopped because of this one
+                        error = result
+                if len(results) == len(jobs):
+                    return True, results
+
+                # the paths of the finished jobs are not needed
+                for result in results:
+                    delete_paths(result)
+                if not self.running():
+                    return False, None
+                return False, TRACKING_FAILED if error is None else error
+        except Exception as e:
+            return False, f"Tracking failed!\n{e}"
+        finally:
+            manager.shutdown()
@@ -16,6 +16,7 @@
 
 import sys
 import os
+import multiprocessing
 
 # Ensure local source code is used instead of installed package
 _src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -48,4 +49,6 @@ def MotionTracker():
 
 # run the application
 if __name__ == "__main__":
+    # required by the tracking worker processes in the frozen executable
+    multiprocessing.freeze_support()
     MotionTracker()
\ No newline at end of file
@@ -0,0 +1,299 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+
+from MotionTrackerBeta.batch import run_job, job_output
+from MotionTrackerBeta.classes.cache import DiffCache, ParamStore
+
+
+# memory of a worker process without the frames (interpreter, OpenCV, NumPy), MB
+PROCESS_MEMORY = 150
+
+
+class JobQueue:
+    """Persistent queue of the batch jobs in a SQLite file, jobs interrupted by a crash are resumed"""
+
+    def __init__(self, filename):
+        """Initialization, creates the table if the file is new"""
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE,
+                job TEXT,
+                status TEXT DEFAULT 'pending',
+                message TEXT,
+                attempts INTEGER DEFAULT 0,
+                updated REAL
+            )"""
+        )
+        self.connection.commit()
+
+    def add(self, job):
+        """Adds the job, returns False if the same job is already in the queue"""
+        text = json.dumps(job, sort_keys=True)
+        key = hashlib.sha1(text.encode()).hexdigest()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO jobs (key, job, updated) VALUES (?, ?, ?)",
+                (key, text, time.time()),
+            )
+        return cursor.rowcount > 0
+
+    def resume(self):
+        """Requeues the jobs left running by a crash, returns their number"""
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = 'pending', updated = ? WHERE status = 'running'",
+                (time.time(),),
+            )
+        return cursor.rowcount
+
+    def retry_failed(self):
+        """Requeues the failed jobs, returns their number"""
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = 'pending', updated = ? WHERE status = 'failed'",
+                (time.time(),),
+            )
+        return cursor.rowcount
+
+    def claim(self):
+        """Marks the oldest pending job as running, returns its (id, job) or None if there are no pending jobs"""
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT id, job FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ? WHERE id = ?",
+                (time.time(), row[0]),
+            )
+        return row[0], json.loads(row[1])
+
+    def finish(self, job_id, ret, message):
+        """Stores the outcome of the job"""
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, message = ?, updated = ? WHERE id = ?",
+                ("done" if ret else "failed", message, time.time(), job_id),
+            )
+
+    def release(self, job_id):
+        """Puts the claimed job back to the pending ones"""
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = 'pending', updated = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+    def counts(self):
+        """Number of jobs by status"""
+        rows = self.connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return dict(rows.fetchall())
+
+    def close(self):
+        self.connection.close()
+
+
+def memory_budget():
+    """Half of the physical memory in MB, None if it can't be determined"""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (2 * 1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def estimate_memory(job, processes=1, buffer_size=8):
+    """Estimated peak memory of the job in MB: decoded frames of every tracking process and the paths"""
+    camera = cv2.VideoCapture(job["video"])
+    try:
+        w = camera.get(cv2.CAP_PROP_FRAME_WIDTH)
+        h = camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        num_of_frames = camera.get(cv2.CAP_PROP_FRAME_COUNT)
+    finally:
+        camera.release()
+
+    # frames in the buffer of the reader, the decoded and the cropped frame
+    frames = w * h * 3 * (buffer_size + 2)
+
+    # rectangle, point, size change, position, velocity and acceleration of every object
+    paths = num_of_frames * len(job.get("objects", [])) * 13 * 8
+    return processes * (PROCESS_MEMORY + frames / 2 ** 20) + paths / 2 ** 20
+
+
+def run_queued_job(job, workers=1, processes=1, chunks=1, cache_dir=None, params_file=None):
+    """Worker process entry: runs the job and saves its results, returns (ret, message)"""
+    cache = DiffCache(directory=cache_dir) if cache_dir else None
+    param_store = ParamStore(params_file) if params_file else None
+    ret, result = run_job(job, workers, processes, chunks, cache, param_store)
+    if not ret:
+        return False, result
+    output = job_output(job)
+    result.to_csv(output, index=False)
+    if param_store is not None:
+        param_store.save()
+    return True, output
+
+
+class Scheduler:
+    """Runs the jobs of the queue on a pool of worker processes within a CPU and a memory budget"""
+
+    def __init__(
+        self,
+        queue,
+        cpus=None,
+        memory=None,
+        workers=1,
+        processes=1,
+        chunks=1,
+        cache_dir=None,
+        params_file=None,
+        message=print,
+    ):
+        """
+        Initialization
+
+        :param queue: (JobQueue) persistent queue of the jobs
+        :param cpus: (int) number of cores the jobs may use at once, all of them by default
+        :param memory: (float) memory the jobs may use at once in MB, half of the physical memory by default
+        :param workers: (int) number of threads updating the trackers of a job
+        :param processes: (int) number of processes a job is shared between
+        :param chunks: (int) number of time chunks of a job tracked in parallel
+        :param cache_dir: (str) directory of the persistent differentiation cache
+        :param params_file: (str) JSON file of the optimized differentiation parameters
+        :param message: (callable) called with the status messages
+        """
+        self.queue = queue
+        self.cpus = os.cpu_count() if cpus is None else cpus
+        self.memory = memory_budget() if memory is None else memory
+        self.workers = workers
+        self.processes = processes
+        self.chunks = chunks
+        self.cache_dir = cache_dir
+        self.params_file = params_file
+        self.message = message
+
+    def job_workers(self):
+        """Threads updating the trackers of a tracking process, limited so that a job fits in the CPU budget"""
+        processes = max(self.processes, self.chunks, 1)
+        return max(1, min(self.workers, self.cpus // processes))
+
+    def cost(self, job):
+        """Cores and memory needed by the job"""
+        processes = max(self.processes, self.chunks, 1)
+        # every tracking process updates the trackers on its worker threads
+        cpus = processes * self.job_workers()
+        try:
+            memory = estimate_memory(job, processes)
+        except Exception:
+            memory = processes * PROCESS_MEMORY
+        return cpus, memory
+
+    def run(self):
+        """Runs the pending jobs until the queue is empty, returns the number of failed jobs"""
+        resumed = self.queue.resume()
+        if resumed:
+            self.message(f"Resuming {resumed} interrupted job(s)")
+
+        failed = 0
+        running = {}  # future -> (id, job, cpus, memory)
+        waiting = None  # claimed job that doesn't fit in the budget yet
+        suspects = set()  # jobs running when a worker process died, they run alone
+        pool = ProcessPoolExecutor(max_workers=max(1, self.cpus))
+        try:
+            while True:
+                # start jobs while the budgets allow, at least one job always runs
+                while True:
+                    if waiting is None:
+                        claimed = self.queue.claim()
+                        if claimed is None:
+                            break
+                        waiting = claimed + self.cost(claimed[1])
+                    job_id, job, cpus, memory = waiting
+                    used_cpus = sum(item[2] for item in running.values())
+                    used_memory = sum(item[3] for item in running.values())
+                    if running and (
+                        used_cpus + cpus > self.cpus
+                        or (self.memory is not None and used_memory + memory > self.memory)
+                        or job_id in suspects
+                        or any(item[0] in suspects for item in running.values())
+                    ):
+                        break
+                    try:
+                        future = pool.submit(
+                            run_queued_job,
+                            job,
+                            self.job_workers(),
+                            self.processes,
+                            self.chunks,
+                            self.cache_dir,
+                            self.params_file,
+                        )
+                    except BrokenProcessPool:
+                        # a worker died while the jobs were started, the running jobs report it
+                        break
+                    running[future] = waiting
+                    waiting = None
+                    self.message(f"Started {job.get('video')}")
+
+                if not running:
+                    break
+
+                # wait for a job to finish
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                broken = [future for future in done if isinstance(future.exception(), BrokenProcessPool)]
+                if broken:
+                    # a dead worker fails every job of the pool, start a new pool for the others
+                    done, _ = wait(list(running))
+                    pool.shutdown(wait=False)
+                    pool = ProcessPoolExecutor(max_workers=max(1, self.cpus))
+                    alone = len(done) == 1
+                for future in done:
+                    job_id, job, cpus, memory = running.pop(future)
+                    try:
+                        ret, result = future.result()
+                    except BrokenProcessPool:
+                        # the job that killed its worker is found by running the jobs alone
+                        if not alone and job_id not in suspects:
+                            suspects.add(job_id)
+                            self.queue.release(job_id)
+                            self.message(f"Restarting {job.get('video')}")
+                            continue
+                        ret, result = False, "The worker process of the job died unexpectedly!"
+                    except Exception as e:
+                        ret, result = False, str(e)
+                    suspects.discard(job_id)
+                    self.queue.finish(job_id, ret, result)
+                    if ret:
+                        self.message(f"Finished {job.get('video')}, saved {result}")
+                    else:
+                        failed += 1
+                        self.message(f"Failed {job.get('video')}: {result}")
+        finally:
+            pool.shutdown()
+        return failed
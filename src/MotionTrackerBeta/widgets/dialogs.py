@@ -43,6 +43,7 @@ from PyQt5.QtGui import (
 )
 from PyQt5.QtCore import Qt, pyqtSignal
 from MotionTrackerBeta.functions.helper import *
+from MotionTrackerBeta.functions.exporting import EXPORT_CODECS, available_codecs
 from MotionTrackerBeta.classes.classes import *
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
 from matplotlib.figure import Figure
@@ -743,7 +744,7 @@ class TrackingSettings(QDialog):
             self.setStyleSheet(style.read())
         self.setWindowIcon(QIcon(os.path.dirname(os.path.dirname(__file__))+"/images/logo.svg"))
         self.setObjectName("tracker_window")
-        self.setFixedSize(270, 200)
+        self.setFixedSize(270, 380)
 
         ## initilaize and organize layout
 
@@ -751,7 +752,7 @@ class TrackingSettings(QDialog):
         algoLBL = QLabel("Tracking Algorithm:")
         self.algoCMB = QComboBox()
         self.algoCMB.addItems(
-            ["CSRT", "BOOSTING", "MIL", "KCF", "TLD", "MEDIANFLOW", "MOSSE"]
+            ["CSRT", "BOOSTING", "MIL", "KCF", "TLD", "MEDIANFLOW", "MOSSE", "LK-FLOW", "ARUCO", "BLOB"]
         )
 
         # size change CheckBox
@@ -760,10 +761,40 @@ class TrackingSettings(QDialog):
         self.sizeCHB.setLayoutDirection(Qt.RightToLeft)
         self.sizeCHB.stateChanged.connect(self.sizeMode)
 
+        # resolution of the trackers, refined at full resolution
+        resolutionLBL = QLabel("Tracking resolution:")
+        self.resolutionCMB = QComboBox()
+        self.resolutionCMB.addItems(["Full", "1/2 (refined)", "1/4 (refined)"])
+
+        # every stride-th frame is tracked, the rest is interpolated
+        strideLBL = QLabel("Frame stride:")
+        self.strideLNE = QLineEdit("1")
+        self.strideLNE.setValidator(QIntValidator(1, 1000))
+
         # FPS input LineEdit
         fpsLBL = QLabel("Real FPS:")
         self.fpsLNE = QLineEdit()
         self.fpsLNE.setValidator(QIntValidator(1, 100000))
+
+        # number of threads updating the trackers
+        workersLBL = QLabel("Worker threads:")
+        self.workersLNE = QLineEdit("1")
+        self.workersLNE.setValidator(QIntValidator(1, 256))
+
+        # number of processes the objects are shared between
+        processesLBL = QLabel("Worker processes:")
+        self.processesLNE = QLineEdit("1")
+        self.processesLNE.setValidator(QIntValidator(1, 256))
+
+        # number of time chunks tracked in parallel
+        chunksLBL = QLabel("Time chunks:")
+        self.chunksLNE = QLineEdit("1")
+        self.chunksLNE.setValidator(QIntValidator(1, 256))
+
+        # memory-mapped paths for long recordings
+        diskLBL = QLabel("Store paths on disk:")
+        self.diskCHB = QCheckBox()
+        self.diskCHB.setLayoutDirection(Qt.RightToLeft)
         self.notificationLBL = QLabel(
             "Important information: Only the CSRF algorithm is capable of tracking the size change of an object!"
         )
@@ -786,14 +817,44 @@ class TrackingSettings(QDialog):
         sizeLayout.addWidget(sizeLBL)
         sizeLayout.addWidget(self.sizeCHB)
 
+        resolutionLayout = QHBoxLayout()
+        resolutionLayout.addWidget(resolutionLBL)
+        resolutionLayout.addWidget(self.resolutionCMB)
+
+        strideLayout = QHBoxLayout()
+        strideLayout.addWidget(strideLBL)
+        strideLayout.addWidget(self.strideLNE)
+
         fpsLayout = QHBoxLayout()
         fpsLayout.addWidget(fpsLBL)
         fpsLayout.addWidget(self.fpsLNE)
 
+        workersLayout = QHBoxLayout()
+        workersLayout.addWidget(workersLBL)
+        workersLayout.addWidget(self.workersLNE)
+
+        processesLayout = QHBoxLayout()
+        processesLayout.addWidget(processesLBL)
+        processesLayout.addWidget(self.processesLNE)
+
+        chunksLayout = QHBoxLayout()
+        chunksLayout.addWidget(chunksLBL)
+        chunksLayout.addWidget(self.chunksLNE)
+
+        diskLayout = QHBoxLayout()
+        diskLayout.addWidget(diskLBL)
+        diskLayout.addWidget(self.diskCHB)
+
         Layout = QVBoxLayout()
         Layout.addLayout(algoLayout)
         Layout.addLayout(sizeLayout)
+        Layout.addLayout(resolutionLayout)
+        Layout.addLayout(strideLayout)
         Layout.addLayout(fpsLayout)
+        Layout.addLayout(workersLayout)
+        Layout.addLayout(processesLayout)
+        Layout.addLayout(chunksLayout)
+        Layout.addLayout(diskLayout)
         Layout.addWidget(self.notificationLBL)
         Layout.addItem(QSpacerItem(0, 60, QSizePolicy.Maximum, QSizePolicy.Expanding))
         Layout.addWidget(trackBTN)
@@ -810,6 +871,93 @@ class TrackingSettings(QDialog):
             self.algoCMB.setEnabled(True)
 
 
+class VideoExportSettings(QDialog):
+    """Modal dialog for users to specify the video export settings"""
+
+    def __init__(self, parent=None):
+        """Initialization"""
+
+        # call parent function
+        super().__init__(parent)
+
+        # styling
+        self.setWindowFlags(self.windowFlags() ^ Qt.WindowContextHelpButtonHint)
+        self.setWindowTitle("Video export settings")
+        self.setModal(True)
+        with open(os.path.dirname(os.path.dirname(__file__))+"/style/tracking.qss", "r") as style:
+            self.setStyleSheet(style.read())
+        self.setWindowIcon(QIcon(os.path.dirname(os.path.dirname(__file__))+"/images/logo.svg"))
+        self.setObjectName("tracker_window")
+        self.setFixedSize(270, 240)
+
+        ## initilaize and organize layout
+
+        # codec, filled with the available ones when first shown
+        codecLBL = QLabel("Codec:")
+        self.codecCMB = QComboBox()
+
+        # output size relative to the source
+        scaleLBL = QLabel("Scale:")
+        self.scaleCMB = QComboBox()
+        self.scaleCMB.addItems(["100%", "75%", "50%", "25%"])
+
+        # frame decimation
+        stepLBL = QLabel("Export every Nth frame:")
+        self.stepLNE = QLineEdit("1")
+        self.stepLNE.setValidator(QIntValidator(1, 10000))
+
+        # crop to the ROI rectangle
+        roiLBL = QLabel("Crop to ROI:")
+        self.roiCHB = QCheckBox()
+        self.roiCHB.setLayoutDirection(Qt.RightToLeft)
+
+        # button
+        exportBTN = QPushButton("Export")
+        exportBTN.clicked.connect(self.accept)
+        exportBTN.setObjectName("trackBTN")
+
+        # Organizing widgets into layouts
+        codecLayout = QHBoxLayout()
+        codecLayout.addWidget(codecLBL)
+        codecLayout.addWidget(self.codecCMB)
+
+        scaleLayout = QHBoxLayout()
+        scaleLayout.addWidget(scaleLBL)
+        scaleLayout.addWidget(self.scaleCMB)
+
+        stepLayout = QHBoxLayout()
+        stepLayout.addWidget(stepLBL)
+        stepLayout.addWidget(self.stepLNE)
+
+        roiLayout = QHBoxLayout()
+        roiLayout.addWidget(roiLBL)
+        roiLayout.addWidget(self.roiCHB)
+
+        Layout = QVBoxLayout()
+        Layout.addLayout(codecLayout)
+        Layout.addLayout(scaleLayout)
+        Layout.addLayout(stepLayout)
+        Layout.addLayout(roiLayout)
+        Layout.addItem(QSpacerItem(0, 20, QSizePolicy.Maximum, QSizePolicy.Expanding))
+        Layout.addWidget(exportBTN)
+        self.setLayout(Layout)
+
+    def set_params(self, roi_available):
+        """Lists the codecs the installed OpenCV can encode, enables cropping if a ROI is set"""
+        if self.codecCMB.count() == 0:
+            self.codecCMB.addItems(available_codecs())
+        self.roiCHB.setEnabled(roi_available)
+        if not roi_available:
+            self.roiCHB.setChecked(False)
+
+    def get_params(self):
+        """Returns the fourcc, the file extension, the scale, the frame step and whether to crop to the ROI"""
+        fourcc, extension = EXPORT_CODECS.get(self.codecCMB.currentText(), ("mp4v", ".mp4"))
+        scale = int(self.scaleCMB.currentText().rstrip("%")) / 100
+        step = int(self.stepLNE.text()) if self.stepLNE.text() != "" else 1
+        return fourcc, extension, scale, max(step, 1), self.roiCHB.isChecked()
+
+
 class RotationSettings(QDialog):
     """Dialog to select points for rotation tracking"""
 
@@ -15,9 +15,8 @@
 
 
 from PyQt5.QtCore import QThread, pyqtSignal
-import cv2
 from MotionTrackerBeta.functions.helper import *
-from MotionTrackerBeta.functions.display import display_objects
+from MotionTrackerBeta.functions.exporting import export_video
 from MotionTrackerBeta.classes.classes import *
 
 
@@ -46,6 +45,10 @@ class ExportingThread(QThread):
         point_bool,
         trajectory_lenght,
         marker_size=20,
+        codec="mp4v",
+        scale=1.0,
+        step=1,
+        roi_rect=None,
     ):
         """Initialization"""
         self.camera = camera
@@ -59,6 +62,10 @@ class ExportingThread(QThread):
         self.point_bool = point_bool
         self.trajectory_length = trajectory_lenght
         self.marker_size = marker_size
+        self.codec = codec
+        self.scale = scale
+        self.step = step
+        self.roi_rect = roi_rect
 
         # call parent function
         super(ExportingThread, self).__init__()
@@ -69,52 +76,31 @@ class ExportingThread(QThread):
 
     def run(self):
         """Runs the exporting algorithm algoritm"""
-
-        # initialize writer
-        h = int(self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        w = int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH))
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        writer = cv2.VideoWriter(self.filename, fourcc, self.fps, (w, h))
-
-        # goto start
-        self.camera.set(cv2.CAP_PROP_POS_FRAMES, self.section_start)
-
-        # export frame by frame
-        for i in range(int(self.section_stop - self.section_start)):
-
-            # get position
-            pos = self.camera.get(cv2.CAP_PROP_POS_FRAMES)
-
-            # read frame
-            ret, frame = self.camera.read()
-
-            # stop in case of error
-            if not ret:
-                self.is_running = False
-                self.error_occured.emit("Unable to read video frame!")
-                break
-
-            # display objects
-            frame = display_objects(
-                frame,
-                pos,
-                self.section_start,
-                self.section_stop,
-                self.objects,
-                self.box_bool,
-                self.point_bool,
-                self.trajectory_length,
-                self.marker_size,
-            )
-
-            # write frame to file
-            writer.write(frame)
-
-            # update progress
-            self.progressChanged.emit(
-                int(pos / (self.section_stop - self.section_start) * 100)
-            )
-
-        if self.is_running:
-            # emit signal
-            self.success.emit()
+        ret, message = export_video(
+            self.camera,
+            self.objects,
+            self.section_start,
+            self.section_stop,
+            self.filename,
+            self.fps,
+            self.box_bool,
+            self.point_bool,
+            self.trajectory_length,
+            self.marker_size,
+            progress=self.progressChanged.emit,
+            is_running=lambda: self.is_running,
+            codec=self.codec,
+            scale=self.scale,
+            step=self.step,
+            roi_rect=self.roi_rect,
+        )
+
+        # stop in case of error
+        if not ret:
+            if message is not None:
+                self.error_occured.emit(message)
+            self.is_running = False
+            return
+
+        # emit signal
+        self.success.emit()
@@ -40,11 +40,13 @@ from MotionTrackerBeta.widgets.trackers import TrackingThreadV2
 from MotionTrackerBeta.widgets.process import PostProcesserThread
 from MotionTrackerBeta.widgets.export import ExportingThread
 
-from MotionTrackerBeta.functions.display import display_objects, draw_grid
+from MotionTrackerBeta.functions.display import display_objects, draw_grid, fit_frame
 from MotionTrackerBeta.functions.transforms import *
 from MotionTrackerBeta.functions.helper import *
 
 from MotionTrackerBeta.classes.classes import *
+from MotionTrackerBeta.classes.cache import DiffCache, ParamStore
+from MotionTrackerBeta.classes.reader import CachedCapture, ProxyCache
 
 from math import floor, ceil
 
@@ -59,7 +61,9 @@ class VideoWidget(QWidget):
     def __init__(self):
         super(VideoWidget, self).__init__()
 
-        self.camera = None  # cv2.VideoCapture object
+        self.camera = None  # CachedCapture object, interface of cv2.VideoCapture
+        self.proxy = None  # low resolution previews of the slider
+        self.display_buffer = None  # RGB frame displayed by the label
         self.fps = None  # fps read from file
         self.num_of_frames = 0  # nember of frames in video
         self.x_offset = 0  # x-offset of the zoomed in window
@@ -73,7 +77,9 @@ class VideoWidget(QWidget):
         self.video_height = None  # height of the opened video
         self.objects_to_track = []  # list to store the tracked objects
         self.rotations = []  # list to store the tracked rotations
-        self.timestamp = []  # list to store the timestamps after the tracking
+        self.timestamp = Trajectory()  # timestamps after the tracking
+        self.diff_cache = DiffCache()  # results of the post-processing
+        self.param_store = ParamStore()  # optimized parameters of the post-processing
         self.point_tmp = (
             None  # temporary variable for point selection of the tracked objects
         )
@@ -293,6 +299,7 @@ class VideoWidget(QWidget):
         self.VideoSLD.setMaximum(10000)
         self.VideoSLD.setValue(0)
         self.VideoSLD.valueChanged.connect(self.positionVideo)
+        self.VideoSLD.sliderReleased.connect(self.positionVideo)
 
         # Add controllers to layout
         PlayerControlLayout = QHBoxLayout()
@@ -635,6 +642,7 @@ class VideoWidget(QWidget):
 
         # initializing dialogs
         self.settingsDialog = TrackingSettings()
+        self.videoExportDialog = VideoExportSettings()
         self.progressDialog = TrackingProgress()
         self.postProcessProgressDialog = CalculationProgress()
         self.postProcessDialog = PostProcessSettings()
@@ -662,7 +670,14 @@ class VideoWidget(QWidget):
 
     def openVideo(self):
         """Creates the VideoCapture object and gets required properties"""
-        self.camera = cv2.VideoCapture(self.filename)
+        # decoded frames are cached and prefetched ahead of the playhead
+        settings = QSettings("MotionTracker", "MotionTracker")
+        cache_size = settings.value("frame_cache_mb", 512, type=int)
+        self.camera = CachedCapture(self.filename, cache_size)
+
+        # proxies of the slider preview, generated in the background
+        self.proxy = ProxyCache(self.filename)
+        self.proxy.start()
 
         # get essential video properties
         self.fps = self.camera.get(cv2.CAP_PROP_FPS)
@@ -734,6 +749,9 @@ class VideoWidget(QWidget):
         if self.camera is not None:
             self.camera.release()
             self.camera = None
+        if self.proxy is not None:
+            self.proxy.stop()
+            self.proxy = None
 
         # reorganize layout
         self.PropGB.setVisible(False)
@@ -847,28 +865,9 @@ class VideoWidget(QWidget):
                     self.marker_size,
                 )
 
-            # crop and color
+            # crop, fit to the label and display
             frame = crop_frame(frame, self.x_offset, self.y_offset, self.zoom)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            # convert form opencv to pyqt
-            img = QImage(
-                frame.data,
-                frame.shape[1],
-                frame.shape[0],
-                frame.shape[1] * frame.shape[2],
-                QImage.Format_RGB888,
-            )
-            pix = QPixmap.fromImage(img)
-            pix = pix.scaled(
-                self.VidLBL.width(),
-                self.VidLBL.height(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation,
-            )
-
-            # display label
-            self.VidLBL.setPixmap(pix)
+            self.displayFrame(frame)
 
             # move the slider
             pos_in_frames = self.camera.get(cv2.CAP_PROP_POS_FRAMES)
@@ -971,28 +970,9 @@ class VideoWidget(QWidget):
                     self.marker_size,
                 )
 
-            # crop and color
+            # crop, fit to the label and display
             frame = crop_frame(frame, self.x_offset, self.y_offset, self.zoom)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            # convert from opencv to pyqt
-            img = QImage(
-                frame,
-                frame.shape[1],
-                frame.shape[0],
-                frame.shape[1] * frame.shape[2],
-                QImage.Format_RGB888,
-            )
-            pix = QPixmap.fromImage(img)
-            pix = pix.scaled(
-                self.VidLBL.width(),
-                self.VidLBL.height(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation,
-            )
-
-            # display in label
-            self.VidLBL.setPixmap(pix)
+            self.displayFrame(frame)
 
     def JumpForward(self):
         "Jumps formard 10 frames"
@@ -1071,12 +1051,40 @@ class VideoWidget(QWidget):
         pos = self.VideoSLD.value()
         pos_in_frames = round(pos / 10000 * self.num_of_frames)
 
+        # preview while the slider is dragged, the frame is decoded on release
+        if self.VideoSLD.isSliderDown() and self.displayProxy(pos_in_frames):
+            return
+
         # set position
         self.camera.set(cv2.CAP_PROP_POS_FRAMES, pos_in_frames)
 
         # load the frame
         self.nextFrame()
 
+    def displayFrame(self, frame):
+        """Resizes the BGR frame to the label in one step, displays it without converting it to a pixmap"""
+        self.display_buffer = fit_frame(
+            frame, self.VidLBL.width(), self.VidLBL.height(), self.display_buffer
+        )
+        h, w = self.display_buffer.shape[:2]
+        img = QImage(self.display_buffer.data, w, h, 3 * w, QImage.Format_RGB888)
+        self.VidLBL.setImage(img)
+
+    def displayProxy(self, pos_in_frames):
+        """Displays the low resolution preview of the frame, returns False if it isn't available yet"""
+        if self.proxy is None:
+            return False
+        frame = self.proxy.get(pos_in_frames)
+        if frame is None:
+            return False
+
+        # crop, fit to the label and display, offsets are given on the full frame
+        scale = self.proxy.scale
+        frame = crop_frame(frame, round(self.x_offset * scale), round(self.y_offset * scale), self.zoom)
+        self.displayFrame(frame)
+        self.modifyTimestampLBL(pos_in_frames)
+        return True
+
     def resizeEvent(self, e):
         "Handles the resizing of the window"
         # reloads the frame
@@ -1973,8 +1981,46 @@ class VideoWidget(QWidget):
             else:
                 fps = self.fps
 
+            # get the number of worker threads
+            if self.settingsDialog.workersLNE.text() != "":
+                workers = int(self.settingsDialog.workersLNE.text())
+            else:
+                workers = 1
+
+            # get the number of worker processes
+            if self.settingsDialog.processesLNE.text() != "":
+                processes = int(self.settingsDialog.processesLNE.text())
+            else:
+                processes = 1
+
+            # get the number of time chunks
+            if self.settingsDialog.chunksLNE.text() != "":
+                chunks = int(self.settingsDialog.chunksLNE.text())
+            else:
+                chunks = 1
+
+            # every tracking process updates its trackers on its own threads, together they don't exceed the cores
+            workers = max(1, min(workers, (os.cpu_count() or 1) // max(processes, chunks, 1)))
+
+            # memory-mapped paths next to the video
+            if self.settingsDialog.diskCHB.isChecked():
+                session_dir = os.path.splitext(self.filename)[0] + "_session"
+            else:
+                session_dir = None
+
+            # downscaled tracking refined at full resolution
+            downscale = [1, 2, 4][self.settingsDialog.resolutionCMB.currentIndex()]
+
+            # get the frame stride
+            if self.settingsDialog.strideLNE.text() != "":
+                stride = int(self.settingsDialog.strideLNE.text())
+            else:
+                stride = 1
+
             # running the tracker
-            self.runTracker(tracker_type, size, fps)
+            self.runTracker(
+                tracker_type, size, fps, workers, processes, chunks, session_dir, downscale, stride
+            )
 
     def eventFilter(self, source, event):
         """Enables users to change X and Y offsets with the W-A-S-D butttons"""
@@ -2004,7 +2050,18 @@ class VideoWidget(QWidget):
         if self.ruler.mm_per_pix is not None:
             return data * self.ruler.mm_per_pix / 1000
 
-    def runTracker(self, tracker_type, size, fps):
+    def runTracker(
+        self,
+        tracker_type,
+        size,
+        fps,
+        workers=1,
+        processes=1,
+        chunks=1,
+        session_dir=None,
+        downscale=1,
+        stride=1,
+    ):
         """Runs the seleted tracking algorithm with the help of a QThread"""
 
         # resets the state in case of error
@@ -2021,6 +2078,13 @@ class VideoWidget(QWidget):
             fps,
             self.timestamp,
             self.roi_rect,
+            workers=workers,
+            processes=processes,
+            filename=self.filename,
+            chunks=chunks,
+            session_dir=session_dir,
+            downscale=downscale,
+            stride=stride,
         )
 
         # connect signals ans start tracker
@@ -2082,6 +2146,8 @@ class VideoWidget(QWidget):
                 self.objects_to_track,
                 self.timestamp[1] - self.timestamp[0],
                 self.postProcessDialog.parameters,
+                cache=self.diff_cache,
+                param_store=self.param_store,
             )
             self.PostProcesser.success.connect(self.calculationFinished)
             self.postProcessProgressDialog.updateName("Calculating derivatives...")
@@ -2122,7 +2188,7 @@ class VideoWidget(QWidget):
         # reset stored info
         self.objects_to_track = []
         self.rotations = []
-        self.timestamp = []
+        self.timestamp = Trajectory()
 
         # clear temp data
         self.point_tmp = None
@@ -2195,6 +2261,8 @@ class VideoWidget(QWidget):
                         R,
                         self.timestamp[1] - self.timestamp[0],
                         self.postProcessDialog.parameters,
+                        cache=self.diff_cache,
+                        param_store=self.param_store,
                     )
                     self.PostProcesser.success.connect(self.calculationFinished)
                     self.progressDialog.updateName("Calculation in progress...")
@@ -2402,11 +2470,17 @@ class VideoWidget(QWidget):
                     df.to_csv(save_name[0])
 
     def exportVideo(self):
-        """Exports the video with the tracked objects in MP! format"""
+        """Exports the video with the tracked objects in the selected format"""
+
+        # get export settings
+        self.videoExportDialog.set_params(self.roi_rect is not None)
+        if not self.videoExportDialog.exec_():
+            return
+        codec, extension, scale, step, crop = self.videoExportDialog.get_params()
 
         # get filename
         save_name = QFileDialog.getSaveFileName(
-            self, "Export Video", "/", "MP4 file (*.mp4)",
+            self, "Export Video", "/", f"{codec} video (*{extension})",
         )
 
         # save video file
@@ -2423,6 +2497,10 @@ class VideoWidget(QWidget):
                 self.pointCHB.isChecked(),
                 round(self.playbackSLD.value() * self.num_of_frames / 100),
                 self.marker_size,
+                codec,
+                scale,
+                step,
+                self.roi_rect if crop else None,
             )
             self.progressDialog.updateName("Exporting video to " + save_name[0])
             self.progressDialog.rejected.connect(self.exporter.cancel)
@@ -15,10 +15,11 @@
 
 
 from PyQt5.QtCore import QThread, pyqtSignal
-import math
+import numpy as np
 import cv2
 from MotionTrackerBeta.functions.helper import *
 from MotionTrackerBeta.functions.transforms import *
+from MotionTrackerBeta.functions.tracking import *
 
 from MotionTrackerBeta.classes.classes import *
 
@@ -71,146 +72,42 @@ class TrackingThread(QThread):
     def run(self):
         self.newObject.emit("Tracking objects...")
 
-        # t0 = time.time()
-        for j in range(len(self.objects_to_track)):
-            M = self.objects_to_track[j]
-
+        # the objects are tracked one after the other
+        for M in self.objects_to_track:
             # emit the name of the tracked object
             self.newObject.emit("Tracking object: " + M.name + "...")
 
             # reset previous data
             M.reset_data()
-            if j == 0:
-                self.timestamp.clear()
-
-            # creating the tracker
-            if self.tracker_type == "BOOSTING":
-                tracker = cv2.legacy.TrackerBoosting_create()
-            if self.tracker_type == "MIL":
-                tracker = cv2.legacy.TrackerMIL_create()
-            if self.tracker_type == "KCF":
-                tracker = cv2.TrackerKCF_create()
-            if self.tracker_type == "TLD":
-                tracker = cv2.legacy.TrackerTLD_create()
-            if self.tracker_type == "MEDIANFLOW":
-                tracker = cv2.legacy.TrackerMedianFlow_create()
-            # if self.tracker_type == "GOTURN":
-            #    tracker = cv2.TrackerGOTURN_create()
-            if self.tracker_type == "MOSSE":
-                tracker = cv2.legacy.TrackerMOSSE_create()
-            if self.tracker_type == "CSRT":
-                tracker = cv2.TrackerCSRT_create()
 
-            # set camera to start frame, get the fps
-            self.camera.set(cv2.CAP_PROP_POS_FRAMES, self.section_start - 1)
+            ret, result = track_objects(
+                self.camera,
+                [(M.point, M.rectangle)],
+                self.section_start,
+                self.section_stop,
+                self.tracker_type,
+                self.size,
+                self.roi_rect,
+                progress=self.progressChanged.emit,
+                is_running=lambda: self.is_running,
+            )
 
-            # initialize tracker
-            ret, frame = self.camera.read()
+            # handle errors, nothing to emit if cancelled
             if not ret:
-                self.error_occured.emit("Unable to read video frame!")
-                return
-
-            # crop roi if provided
-            if len(self.roi_rect) == 4:
-                frame = crop_roi(frame, self.roi_rect)
-
-            # initialize cv2 tracker
-            try:
-                tracker.init(frame, rect2cropped(M.rectangle, self.roi_rect))
-            except:
-                # handle error, stop the thread emit signal
+                if result is not None:
+                    self.error_occured.emit(result)
                 self.is_running = False
-                self.error_occured.emit("Unable to initialize the tracker!")
                 break
+            M.rectangle_path, M.point_path, M.size_change = result[0]
 
-            # add to path list
-            M.rectangle_path.append(M.rectangle)
-            M.point_path.append(M.point)
-
-            # record timestamp only for the first tracking
-            if j == 0:
-                self.timestamp.append(0)
-
-            # for the calculation of the point
-            dy = (M.point[1] - M.rectangle[1]) / M.rectangle[3]
-            dx = (M.point[0] - M.rectangle[0]) / M.rectangle[2]
-
-            # for zoom
-            w0 = M.rectangle[2]
-            h0 = M.rectangle[3]
-
-            # tracking
-            for i in range(int(self.section_stop - self.section_start)):
-                # read the next frame
-                ret, frame = self.camera.read()
-
-                # handle errors
-                if not ret:
-                    self.error_occured.emit("Unable to read video frame!")
-                    self.is_running = False
-                    break
-
-                # crop if roi provided
-                if len(self.roi_rect) == 4:
-                    frame = crop_roi(frame, self.roi_rect)
-
-                # update the tracker
-                try:
-                    ret, roi_box = tracker.update(frame)
-                except Exception as e:
-                    self.error_occured.emit(f"Tracking failed!\n{e}\n\nTry adding or changing the rectangle around the point, it might improve tracking.")
-                    self.is_running = False
-                    break
-
-                if ret:  # tracking duccessfull
-
-                    # traditional tracking
-                    x, y, w, h = roi_box
-                    M.rectangle_path.append(
-                        (self.roi_rect[0] + x, self.roi_rect[1] + y, w, h)
-                    )
-
-                    # M.rectangle_path.append(roi_box)
-                    M.point_path.append(
-                        (
-                            self.roi_rect[0] + roi_box[0] + dx * roi_box[2],
-                            self.roi_rect[1] + roi_box[1] + dy * roi_box[3],
-                        )
-                    )
-
-                    # change of size
-                    if self.size:
-                        M.size_change.append((roi_box[2] / w0 + roi_box[3] / h0) / 2)
-
-                    # log timestamps
-                    if j == 0:
-                        self.timestamp.append((i + 1) / self.fps)
-
-                    # progress
-                    self.progress = math.ceil(
-                        i / (self.section_stop - self.section_start) * 100
-                    )
-                    self.progressChanged.emit(self.progress)
-                else:
-                    # handle errors
-                    self.error_occured.emit(
-                        "Tracking failed!\n Tracker returned with failure!\n\nTry adding or changing the rectangle around the point, it might improve tracking."
-                    )
-                    self.is_running = False
-
-                if not self.is_running:
-                    # reset path
-                    M.rectangle_path = []
-                    break
-
-            if not self.is_running:
-                break
         # set camera pos to start
         self.camera.set(cv2.CAP_PROP_POS_FRAMES, self.section_start)
 
         # emit success signal
         if self.is_running:
-            # print(f"Finished in {time.time()-t0}")
+            frames = int(self.section_stop - self.section_start) + 1
+            self.timestamp.reset(frames)
+            self.timestamp.extend(np.arange(frames) / self.fps)
             self.success.emit()
 
 
@@ -235,6 +132,17 @@ class TrackingThreadV2(QThread):
         fps,
         timestamp,
         roi_rect,
+        buffer_size=8,
+        workers=1,
+        processes=1,
+        filename=None,
+        chunks=1,
+        chunk_overlap=30,
+        chunk_tolerance=5.0,
+        seed_tracker_type="MOSSE",
+        session_dir=None,
+        downscale=1,
+        stride=1,
     ):
         """Intitialization"""
         self.objects_to_track = objects_to_track
@@ -246,6 +154,17 @@ class TrackingThreadV2(QThread):
         self.roi_rect = roi_rect
         self.size = size
         self.fps = fps
+        self.buffer_size = buffer_size  # number of frames decoded ahead
+        self.workers = workers  # number of threads updating the trackers
+        self.processes = processes  # number of processes the objects are shared between
+        self.filename = filename  # required to open the video in the worker processes
+        self.chunks = chunks  # number of time chunks tracked in parallel
+        self.chunk_overlap = chunk_overlap  # frames tracked by two consecutive chunks
+        self.chunk_tolerance = chunk_tolerance  # allowed distance of the chunks at the boundary (pixels)
+        self.seed_tracker_type = seed_tracker_type  # fast tracker seeding the chunks
+        self.session_dir = session_dir  # paths are memory-mapped to files in this directory if set
+        self.downscale = downscale  # trackers run on frames this many times smaller, refined at full resolution
+        self.stride = stride  # every stride-th frame is tracked, the rest is interpolated
         self.progress = "0"
         self.is_running = True
         if roi_rect is None:
@@ -264,150 +183,57 @@ class TrackingThreadV2(QThread):
         # t0 = time.time()
         self.newObject.emit("Tracking objects...")
 
-        # reset previous data
-        self.timestamp.clear()
-
-        # set camera to start frame, read it
-        self.camera.set(cv2.CAP_PROP_POS_FRAMES, self.section_start - 1)
-
-        # initialize tracker
-        ret, frame = self.camera.read()
-
-        # check errors
-        if not ret:
-            self.error_occured.emit("Unable to read video frame!")
-            return
-
-        # crop roi if provided
-        if len(self.roi_rect) == 4:
-            frame = crop_roi(frame, self.roi_rect)
-
-        # creating tracker objects, adding them into list
-        trackers = []
+        # reset previous data, the memory-mapped files are released before the session directory is cleared
         for M in self.objects_to_track:
-            # reset data
             M.reset_data()
+        self.timestamp.delete()
+        objects = [(M.point, M.rectangle) for M in self.objects_to_track]
+
+        # track the objects with the Qt-free engine
+        engine = SectionTracker(
+            self.camera,
+            self.section_start,
+            self.section_stop,
+            self.tracker_type,
+            self.size,
+            self.roi_rect,
+            buffer_size=self.buffer_size,
+            workers=self.workers,
+            processes=self.processes,
+            filename=self.filename,
+            chunks=self.chunks,
+            chunk_overlap=self.chunk_overlap,
+            chunk_tolerance=self.chunk_tolerance,
+            seed_tracker_type=self.seed_tracker_type,
+            session_dir=self.session_dir,
+            downscale=self.downscale,
+            stride=self.stride,
+            progress=self.progressChanged.emit,
+            message=self.newObject.emit,
+            is_running=lambda: self.is_running,
+        )
+        ret, result = engine.track(objects)
+
+        # handle errors, nothing to emit if cancelled
+        if not ret:
+            if result is not None:
+                self.error_occured.emit(result)
+            self.is_running = False
+            return
 
-            # creating the tracker
-            if self.tracker_type == "BOOSTING":
-                tracker = cv2.legacy.TrackerBoosting_create()
-            if self.tracker_type == "MIL":
-                tracker = cv2.legacy.TrackerMIL_create()
-            if self.tracker_type == "KCF":
-                tracker = cv2.TrackerKCF_create()
-            if self.tracker_type == "TLD":
-                tracker = cv2.legacy.TrackerTLD_create()
-            if self.tracker_type == "MEDIANFLOW":
-                tracker = cv2.legacy.TrackerMedianFlow_create()
-            # if self.tracker_type == "GOTURN":
-            #    tracker = cv2.TrackerGOTURN_create()
-            if self.tracker_type == "MOSSE":
-                tracker = cv2.legacy.TrackerMOSSE_create()
-            if self.tracker_type == "CSRT":
-                tracker = cv2.TrackerCSRT_create()
-
-            # initialize cv2 with starting frame
-            try:
-                tracker.init(frame, rect2cropped(M.rectangle, self.roi_rect))
-            except:
-                # handle error, stop the thread emit signal
-                self.is_running = False
-                self.error_occured.emit("Unable to initialize the tracker!")
-                return
-
-            # store data
-            M.rectangle_path.append(M.rectangle)
-            M.point_path.append(M.point)
-
-            # for zoom
-            w0 = M.rectangle[2]
-            h0 = M.rectangle[3]
-
-            # size change if required
-            if self.size:
-                M.size_change.append((M.rectangle[2] / w0 + M.rectangle[3] / h0) / 2)
-
-            # add tracker to list
-            trackers.append(tracker)
-
-        # store timestamp
-        self.timestamp.append(0)
-
-        # tracking loop
-        for j in range(int(self.section_stop - self.section_start)):
-            # read frame
-            ret, frame = self.camera.read()
-
-            # check for errors
-            if not ret:
-                return
-
-            # crop roi if provided
-            if len(self.roi_rect) == 4:
-                frame = crop_roi(frame, self.roi_rect)
-
-            # update trackers
-            for i in range(len(trackers)):
-                try:
-                    ret, roi_box = trackers[i].update(frame)
-                except Exception as e:
-                    self.error_occured.emit(f"Tracking failed!\n{e}\n\nTry adding or changing the rectangle around the point, it might improve tracking.")
-                    self.is_running = False
-                    return
-
-                # successfull tracking
-                if ret:
-                    # traditional tracking
-                    x, y, w, h = roi_box
-
-                    # for the calculation of the point
-                    dy = (M.point[1] - M.rectangle[1]) / M.rectangle[3]
-                    dx = (M.point[0] - M.rectangle[0]) / M.rectangle[2]
-
-                    # for zoom
-                    w0 = M.rectangle[2]
-                    h0 = M.rectangle[3]
-
-                    self.objects_to_track[i].rectangle_path.append(
-                        (self.roi_rect[0] + x, self.roi_rect[1] + y, w, h)
-                    )
-                    # M.rectangle_path.append(roi_box)
-                    self.objects_to_track[i].point_path.append(
-                        (
-                            self.roi_rect[0] + roi_box[0] + dx * roi_box[2],
-                            self.roi_rect[1] + roi_box[1] + dy * roi_box[3],
-                        )
-                    )
-                    # change of size
-                    if self.size:
-                        self.objects_to_track[i].size_change.append(
-                            (roi_box[2] / w0 + roi_box[3] / h0) / 2
-                        )
-                else:
-                    # handle errors
-                    self.error_occured.emit(
-                        "Tracking failed!\n Tracker returned with failure!\n\nTry adding or changing the rectangle around the point, it might improve tracking."
-                    )
-                    self.is_running = False
-                    return
-                if not self.is_running:
-                    break
-
-            # timestamp
-            self.timestamp.append((j + 1) / self.fps)
-
-            # progress
-            self.progress = math.ceil(
-                j / (self.section_stop - self.section_start) * 100
-            )
-            self.progressChanged.emit(self.progress)
-
-            # break loop if cancelled
-            if not self.is_running:
-                break
-
-        # set camera position to start
-        self.camera.set(cv2.CAP_PROP_POS_FRAMES, self.section_start)
+        # store data
+        for M, (rectangle_path, point_path, size_change) in zip(self.objects_to_track, result):
+            M.rectangle_path = rectangle_path
+            M.point_path = point_path
+            M.size_change = size_change
+
+        # timestamp
+        try:
+            engine.timestamps(self.fps, self.timestamp)
+        except OSError as e:
+            self.error_occured.emit(f"Unable to store the timestamps!\n{e}")
+            self.is_running = False
+            return
 
         # emit success signal
         if self.is_running:
@@ -14,7 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from PyQt5.QtWidgets import QLabel
-from PyQt5.QtGui import QMouseEvent,QWheelEvent
+from PyQt5.QtGui import QMouseEvent,QWheelEvent,QPainter
 from PyQt5.QtCore import pyqtSignal
 
 from MotionTrackerBeta.functions.helper import *
@@ -34,8 +34,41 @@ class VideoLabel(QLabel):
         """Intitialization"""
         self.press_pos = None
         self.current_pos = None
+        self.image = None  # QImage displayed instead of the pixmap
         super(VideoLabel, self).__init__(parent)
 
+    def setImage(self, image):
+        """Displays the QImage centered without converting it to a pixmap, its buffer must stay valid while displayed"""
+        if self.image is None:
+            super().clear()
+        self.image = image
+        self.update()
+
+    def setPixmap(self, pixmap):
+        """Displays the pixmap instead of the image"""
+        self.image = None
+        super().setPixmap(pixmap)
+
+    def displayedSize(self):
+        """Size of the displayed image or pixmap, None if there is none"""
+        if self.image is not None:
+            return self.image.size()
+        if self.pixmap():
+            return self.pixmap().size()
+        return None
+
+    def paintEvent(self, event):
+        """Draws the image on top of the label"""
+        super().paintEvent(event)
+        if self.image is not None:
+            painter = QPainter(self)
+            painter.drawImage(
+                (self.width() - self.image.width()) // 2,
+                (self.height() - self.image.height()) // 2,
+                self.image,
+            )
+            painter.end()
+
     def wheelEvent(self, a0: QWheelEvent):
         """Handles wheel event, emits signal with zoom parameter"""
         if a0.angleDelta().y() > 0:
@@ -48,9 +81,9 @@ class VideoLabel(QLabel):
         """Handles mouse press event, emits coordinates"""
         x_label, y_label, = ev.x(), ev.y()
 
-        if self.pixmap():
+        pixmap_size = self.displayedSize()
+        if pixmap_size is not None:
             label_size = self.size()
-            pixmap_size = self.pixmap().size()
             width = pixmap_size.width()
             height = pixmap_size.height()
 
@@ -73,9 +106,9 @@ class VideoLabel(QLabel):
         """Handles mouse movement, emits coordinates"""
         x_label, y_label, = ev.x(), ev.y()
 
-        if self.pixmap():
+        pixmap_size = self.displayedSize()
+        if pixmap_size is not None:
             label_size = self.size()
-            pixmap_size = self.pixmap().size()
             width = pixmap_size.width()
             height = pixmap_size.height()
 
@@ -98,9 +131,9 @@ class VideoLabel(QLabel):
         """Handles mouse release, emits coordinates"""
         x_label, y_label, = ev.x(), ev.y()
 
-        if self.pixmap():
+        pixmap_size = self.displayedSize()
+        if pixmap_size is not None:
             label_size = self.size()
-            pixmap_size = self.pixmap().size()
             width = pixmap_size.width()
             height = pixmap_size.height()
 
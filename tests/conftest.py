@@ -0,0 +1,87 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+import cv2
+import pytest
+
+
+def write_video(filename, frames, fps=30, fourcc="MJPG"):
+    """Writes the BGR frames to a video file"""
+    h, w = frames[0].shape[:2]
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*fourcc), fps, (w, h))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    return filename
+
+
+def moving_patches(positions, size=(240, 320), patch=32, seed=0):
+    """
+    Frames of textured square patches moving over a textured background
+
+    :param positions: (array, frames x objects x 2) top left corners of the patches
+    :return: list of BGR frames
+    """
+    rng = np.random.default_rng(seed)
+    h, w = size
+    background = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (0, 0), 3)
+    patches = [
+        cv2.GaussianBlur(rng.integers(0, 255, (patch, patch, 3), dtype=np.uint8), (0, 0), 1.5)
+        for _ in range(positions.shape[1])
+    ]
+    frames = []
+    for corners in positions:
+        frame = background.copy()
+        for (x, y), image in zip(corners, patches):
+            x, y = int(round(x)), int(round(y))
+            frame[y : y + patch, x : x + patch] = image
+        frames.append(frame)
+    return frames
+
+
+@pytest.fixture(scope="session")
+def patch_video(tmp_path_factory):
+    """Two patches moving on smooth paths: (filename, top left corners of every frame)"""
+    t = np.arange(90)
+    positions = np.stack(
+        (
+            np.column_stack((60 + 40 * np.sin(t / 15), 150 + 30 * np.cos(t / 20))),
+            np.column_stack((220 + 25 * np.cos(t / 18), 100 + 40 * np.sin(t / 12))),
+        ),
+        axis=1,
+    )
+    filename = str(tmp_path_factory.mktemp("videos") / "patches.avi")
+    return write_video(filename, moving_patches(positions)), positions
+
+
+@pytest.fixture(scope="session")
+def numbered_video(tmp_path_factory):
+    """mp4v video with sparse keyframes, the index of every frame is encoded in black and white blocks"""
+    frames = []
+    for k in range(120):
+        frame = np.zeros((64, 128, 3), dtype=np.uint8)
+        for bit in range(8):
+            if k >> bit & 1:
+                frame[16:48, bit * 16 : (bit + 1) * 16] = 255
+        frames.append(frame)
+    filename = str(tmp_path_factory.mktemp("videos") / "numbered.mp4")
+    return write_video(filename, frames, fourcc="mp4v")
+
+
+def frame_number(frame):
+    """Index of a frame of the numbered video"""
+    return sum(1 << bit for bit in range(8) if frame[24:40, bit * 16 + 4 : bit * 16 + 12].mean() > 128)
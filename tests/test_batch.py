@@ -0,0 +1,98 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+
+
+def write_job(tmp_path, patch_video, **options):
+    """Copies the video next to a job file that tracks both patches, returns the path of the job file"""
+    filename, positions = patch_video
+    shutil.copy(filename, tmp_path / "patches.avi")
+    job = {
+        "video": "patches.avi",
+        "tracker": "LK-FLOW",
+        "section": [1, 60],
+        "objects": [
+            {"name": f"P{i + 1}", "point": [round(x) + 16, round(y) + 16], "rectangle": [round(x), round(y), 32, 32]}
+            for i, (x, y) in enumerate(positions[0])
+        ],
+        **options,
+    }
+    with open(tmp_path / "job.json", "w") as file:
+        json.dump(job, file)
+    return str(tmp_path / "job.json")
+
+
+def run_batch(*args):
+    """Runs the motiontracker-batch command in a new interpreter"""
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    env = dict(os.environ, PYTHONPATH=src)
+    return subprocess.run(
+        [sys.executable, "-m", "MotionTrackerBeta.batch", *args],
+        capture_output=True,
+        text=True,
+        env=env,
+        timeout=300,
+    )
+
+
+def test_batch_writes_the_tracked_paths(tmp_path, patch_video):
+    filename, positions = patch_video
+    job = write_job(tmp_path, patch_video)
+    process = run_batch(job)
+    assert process.returncode == 0, process.stderr
+    data = pd.read_csv(tmp_path / "patches_results.csv")
+    assert list(data.columns) == ["Time (s)", "P1 - X (pix)", "P1 - Y (pix)", "P2 - X (pix)", "P2 - Y (pix)"]
+    assert len(data) == 60
+    np.testing.assert_allclose(data["Time (s)"], np.arange(60) / 30)
+    np.testing.assert_allclose(data["P1 - X (pix)"], np.round(positions[:60, 0, 0]) + 16, atol=1)
+    # the Y axis points upwards
+    np.testing.assert_allclose(data["P2 - Y (pix)"], -(np.round(positions[:60, 1, 1]) + 16), atol=1)
+
+
+def test_batch_differentiates_in_the_queue(tmp_path, patch_video):
+    filename, positions = patch_video
+    job = write_job(
+        tmp_path,
+        patch_video,
+        output="velocity.csv",
+        postprocess={"algorithm": "First Order Finite Difference"},
+    )
+    queue = str(tmp_path / "queue.db")
+    process = run_batch(job, "--queue", queue, "--cpus", "1")
+    assert process.returncode == 0, process.stderr
+    assert "1 done" in process.stdout
+    data = pd.read_csv(tmp_path / "velocity.csv")
+    velocity = np.gradient(positions[:60, 0, 0], 1 / 30)
+    assert np.abs(data["P1 - X velocity (pix/s)"] - velocity)[2:-2].mean() < 8
+
+    # the finished job isn't run again
+    process = run_batch(job, "--queue", queue)
+    assert process.returncode == 0, process.stderr
+    assert "Started" not in process.stdout
+
+
+def test_batch_reports_a_missing_video(tmp_path):
+    with open(tmp_path / "job.json", "w") as file:
+        json.dump({"video": "missing.avi", "objects": [{"point": [10, 10]}]}, file)
+    process = run_batch(str(tmp_path / "job.json"))
+    assert process.returncode == 1
+    assert "Unable to open video" in process.stderr
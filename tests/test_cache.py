@@ -0,0 +1,118 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import threading
+import numpy as np
+from MotionTrackerBeta.classes.cache import DiffCache, ParamStore, file_lock, series_key, series_fingerprint
+
+
+def result(n, value=1.0):
+    return tuple(np.full(n, value) for _ in range(3))
+
+
+def test_series_key_depends_on_content_and_parameters():
+    p = np.arange(10.0)
+    parameters = (False, "First Order Finite Difference", None)
+    assert series_key(p, 0.1, parameters) == series_key(p.copy(), 0.1, parameters)
+    assert series_key(p, 0.1, parameters) != series_key(p, 0.2, parameters)
+    assert series_key(p, 0.1, parameters) != series_key(p + 1, 0.1, parameters)
+    assert series_fingerprint(p) == series_fingerprint(list(p))
+
+
+def test_diff_cache_evicts_the_least_recently_used():
+    cache = DiffCache(max_size=1)  # 1 MB
+    n = 12800  # 3 x 100 kB per entry
+    for key in "abc":
+        cache.put(key, result(n))
+    cache.get("a")
+    cache.put("d", result(n))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.size <= cache.max_size
+
+
+def test_diff_cache_persists_to_its_directory(tmp_path):
+    DiffCache(directory=str(tmp_path)).put("key", result(5, 2.0))
+    ps, v, a = DiffCache(directory=str(tmp_path)).get("key")
+    np.testing.assert_array_equal(v, np.full(5, 2.0))
+    assert DiffCache(directory=str(tmp_path)).get("other") is None
+
+
+def test_diff_cache_ignores_a_truncated_file(tmp_path, caplog):
+    cache = DiffCache(directory=str(tmp_path))
+    cache.put("key", result(5, 2.0))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["key.npz"]
+
+    # partial file of a killed job
+    with open(cache.filename("key"), "rb") as file:
+        data = file.read()
+    with open(cache.filename("broken"), "wb") as file:
+        file.write(data[:40])
+    assert DiffCache(directory=str(tmp_path)).get("broken") is None
+    assert "broken" in caplog.text
+
+
+def test_param_store_finds_exact_and_nearest_parameters():
+    store = ParamStore()
+    store.put("Gaussian", "abc", 0.01, 0.5, [[7], [9]])
+    store.put("Gaussian", "def", 0.01, 0.5, [[5], [5]])
+    assert store.get("Gaussian", "abc", 0.01, 0.5) == [[7], [9]]
+    assert store.get("Gaussian", "xyz", 0.01, 0.5) is None
+    assert store.nearest("Gaussian", 0.01, 0.5) == [[5], [5]]
+    assert store.nearest("Gaussian", 0.02, 0.5) is None
+
+
+def test_param_store_save_keeps_entries_of_other_processes(tmp_path):
+    filename = str(tmp_path / "params.json")
+    first = ParamStore(filename)
+    second = ParamStore(filename)
+    first.put("Gaussian", "abc", 0.01, 0.5, [[7]])
+    second.put("Mean", "abc", 0.01, 0.5, [[3]])
+    first.save()
+    second.save()
+
+    merged = ParamStore(filename)
+    assert merged.get("Gaussian", "abc", 0.01, 0.5) == [[7]]
+    assert merged.get("Mean", "abc", 0.01, 0.5) == [[3]]
+    with open(filename) as file:
+        assert len(json.load(file)) == 2
+    assert [path.name for path in tmp_path.iterdir()] == ["params.json"]
+
+
+def test_param_store_concurrent_saves_keep_every_entry(tmp_path):
+    filename = str(tmp_path / "params.json")
+    stores = [ParamStore(filename) for _ in range(8)]
+    for k, store in enumerate(stores):
+        store.put("Gaussian", f"series{k}", 0.01, 0.5, [[k]])
+    threads = [threading.Thread(target=store.save) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    merged = ParamStore(filename)
+    assert [merged.get("Gaussian", f"series{k}", 0.01, 0.5) for k in range(8)] == [[[k]] for k in range(8)]
+    assert sorted(os.listdir(tmp_path)) == ["params.json"]
+
+
+def test_file_lock_replaces_a_stale_lock(tmp_path):
+    path = str(tmp_path / "params.json.lock")
+    open(path, "w").close()
+    os.utime(path, (0, 0))
+    with file_lock(path, timeout=1):
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
@@ -0,0 +1,96 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pickle
+import numpy as np
+from MotionTrackerBeta.classes.classes import Trajectory, Motion
+
+
+def test_trajectory_grows_and_keeps_rows():
+    trajectory = Trajectory(2, capacity=2)
+    for k in range(5):
+        trajectory.append((k, -k))
+    trajectory.extend([(5, -5), (6, -6)])
+    assert len(trajectory) == 7
+    np.testing.assert_array_equal(trajectory.array[:, 0], np.arange(7))
+    np.testing.assert_array_equal(trajectory[-1], (6, -6))
+
+
+def test_scalar_trajectory():
+    trajectory = Trajectory()
+    trajectory.extend([1.0, 2.0])
+    trajectory.append(3.0)
+    np.testing.assert_array_equal(np.asarray(trajectory), [1.0, 2.0, 3.0])
+
+
+def test_memory_mapped_trajectory_grows_in_its_file(tmp_path):
+    trajectory = Trajectory.create(4, 1, str(tmp_path))
+    assert os.path.dirname(trajectory.filename) == str(tmp_path)
+    for k in range(10):
+        trajectory.append((k, k, 1, 1))
+    trajectory.flush()
+    assert os.path.getsize(trajectory.filename) >= 10 * 4 * 8
+    np.testing.assert_array_equal(trajectory.array[:, 0], np.arange(10))
+
+
+def test_memory_mapped_trajectory_pickles_without_its_data(tmp_path):
+    trajectory = Trajectory.create(2, 100, str(tmp_path))
+    trajectory.extend(np.arange(20).reshape(10, 2))
+    data = pickle.dumps(trajectory)
+    assert len(data) < 1000
+
+    copy = pickle.loads(data)
+    assert copy.filename == trajectory.filename
+    np.testing.assert_array_equal(copy.array, trajectory.array)
+
+    # the copy can grow on its own
+    copy.append((100, 101))
+    assert len(copy) == 11
+
+
+def test_in_memory_trajectory_pickles_its_rows():
+    trajectory = Trajectory(2, capacity=100)
+    trajectory.extend([(1, 2), (3, 4)])
+    copy = pickle.loads(pickle.dumps(trajectory))
+    assert copy.filename is None
+    np.testing.assert_array_equal(copy.array, [(1, 2), (3, 4)])
+
+
+def test_delete_removes_the_backing_file(tmp_path):
+    trajectory = Trajectory.create(2, 10, str(tmp_path))
+    filename = trajectory.filename
+    trajectory.append((1, 1))
+    trajectory.delete()
+    assert not os.path.exists(filename)
+    assert len(trajectory) == 0
+
+
+def test_motion_trail_follows_the_path():
+    M = Motion("P1", (0, 0), (0, 0, 10, 10))
+    M.point_path.extend([(1.7, 2.2), (3.1, 4.9)])
+    np.testing.assert_array_equal(M.trail(), [(1, 2), (3, 4)])
+    M.point_path.append((10, 10))
+    np.testing.assert_array_equal(M.trail((1, 1), 0.5), [(0, 0), (1, 1), (4, 4)])
+
+
+def test_reset_data_releases_the_memory_mapped_files(tmp_path):
+    M = Motion("P1", (0, 0), (0, 0, 10, 10))
+    M.point_path = Trajectory.create(2, 10, str(tmp_path))
+    M.point_path.append((1, 1))
+    M.trail()
+    M.reset_data(5)
+    assert list(tmp_path.iterdir()) == []
+    assert len(M.point_path) == 0 and M.point_path.filename is None
@@ -0,0 +1,110 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import time
+import numpy as np
+import pytest
+from MotionTrackerBeta.functions import processing
+from MotionTrackerBeta.functions.differentiate import differentiate, differentiate_batch
+from MotionTrackerBeta.functions.processing import differentiate_all
+
+
+DT = 0.01
+
+
+def noisy_series(count=3, length=200):
+    """Smooth series with measurement noise in the columns"""
+    rng = np.random.default_rng(0)
+    t = np.arange(length) * DT
+    return np.column_stack(
+        [np.sin((k + 1) * 2 * t) * 50 + rng.normal(0, 0.2, length) for k in range(count)]
+    )
+
+
+@pytest.mark.parametrize(
+    "parameters",
+    [
+        (False, "First Order Finite Difference", None),
+        (False, "Second Order Finite Difference", None),
+        (False, "Finite Difference with Mean Smoothing", [5, 2], {"iterate": True}),
+        (False, "Finite Difference with Gaussian Smoothing", [7], {}),
+        (False, "Finite Difference with Friedrichs Smoothing", [9, 2], {"iterate": True}),
+        (False, "Finite Difference with Butterworth Smoothing", [2, 0.1], {}),
+        (False, "Savitzky-Golay Filter", [3, 11, 9], {}),
+        (False, "Spectral Derivative", [0.1], {"even_extension": True, "pad_to_zero_dxdt": True}),
+    ],
+)
+def test_batch_matches_pynumdiff(parameters):
+    P = noisy_series()
+    ret, PS, V, A = differentiate_batch(P, DT, parameters)
+    assert ret
+    for k in range(P.shape[1]):
+        ret, ps, v, a = differentiate(P[:, k], DT, parameters)
+        if not ret:
+            pytest.skip("the pynumdiff method fails with the installed SciPy")
+        scale = np.abs(v).max()
+        np.testing.assert_allclose(PS[:, k], ps, atol=1e-6 * np.abs(ps).max())
+        np.testing.assert_allclose(V[:, k], v, atol=1e-6 * scale)
+        np.testing.assert_allclose(A[:, k], a, atol=1e-6 * np.abs(a).max())
+
+
+def test_batch_rejects_other_methods():
+    ret, PS, V, A = differentiate_batch(noisy_series(), DT, (False, "Kalman Filter", None))
+    assert not ret
+
+
+def test_differentiate_all_keeps_the_order_of_the_series():
+    P = noisy_series(4)
+    parameters = (False, "Finite Difference with Gaussian Smoothing", [7], {})
+    ret, results = differentiate_all([P[:, k] for k in range(4)], DT, parameters, workers=2)
+    assert ret
+    for k, (ps, v, a) in enumerate(results):
+        ret, ps0, v0, a0 = differentiate(P[:, k], DT, parameters)
+        np.testing.assert_allclose(v, v0, atol=1e-6 * np.abs(v0).max())
+
+
+def test_fixed_parameters_run_without_worker_processes(monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("worker processes were started")
+
+    monkeypatch.setattr(processing, "ProcessPoolExecutor", no_pool)
+    P = noisy_series(4)
+    parameters = (False, "Iterated First Order Finite Difference", 2, {})
+    ret, results = differentiate_all([P[:, k] for k in range(4)], DT, parameters, workers=4)
+    assert ret
+    ret, ps, v, a = differentiate(P[:, 3], DT, parameters)
+    np.testing.assert_array_equal(results[3][1], v)
+
+
+def slow_series(p, dt, parameters, known_params=None, search=True):
+    """Stands in for an optimization that takes too long"""
+    time.sleep(60)
+
+
+def test_cancel_stops_the_optimization_workers(monkeypatch):
+    monkeypatch.setattr(processing, "differentiate_series", slow_series)
+    P = noisy_series(2)
+    start = time.time()
+    ret, result = differentiate_all(
+        [P[:, 0], P[:, 1]],
+        DT,
+        (True, "Finite Difference with Gaussian Smoothing", 1.0),
+        workers=2,
+        is_running=lambda: time.time() - start < 0.5,
+    )
+    assert (ret, result) == (False, None)
+    assert time.time() - start < 10
+    assert multiprocessing.active_children() == []
@@ -0,0 +1,74 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from types import SimpleNamespace
+import numpy as np
+import cv2
+import pytest
+from MotionTrackerBeta.functions.display import fit_frame
+
+
+def gradient_frame(width, height):
+    """Smooth BGR frame with different channels, so the resizing and the channel order can be compared"""
+    x, y = np.meshgrid(np.linspace(0, 255, width), np.linspace(0, 255, height))
+    return np.dstack([x, y, 255 - x]).astype(np.uint8)
+
+
+def test_fit_frame_keeps_the_aspect_ratio():
+    frame = gradient_frame(1920, 1080)
+    assert fit_frame(frame, 640, 640).shape == (360, 640, 3)
+    assert fit_frame(frame, 1000, 270).shape == (270, 480, 3)
+    # small frames are enlarged
+    assert fit_frame(gradient_frame(64, 48), 640, 640).shape == (480, 640, 3)
+
+
+def test_fit_frame_matches_area_resizing_in_rgb():
+    frame = gradient_frame(1920, 1080)
+    fitted = fit_frame(frame, 500, 500)
+    reference = cv2.cvtColor(
+        cv2.resize(frame, (fitted.shape[1], fitted.shape[0]), interpolation=cv2.INTER_AREA),
+        cv2.COLOR_BGR2RGB,
+    )
+    assert np.abs(fitted.astype(int) - reference).max() <= 3
+    # red of the output is the last BGR channel
+    assert fitted[0, 0, 0] == pytest.approx(255, abs=3) and fitted[0, 0, 2] == pytest.approx(0, abs=3)
+
+
+def test_fit_frame_reuses_the_buffer_of_the_same_size():
+    frame = gradient_frame(320, 240)
+    out = fit_frame(frame, 160, 160)
+    assert fit_frame(frame, 160, 160, out) is out
+    # a resized label gets a new buffer
+    other = fit_frame(frame, 200, 200, out)
+    assert other is not out and other.shape == (150, 200, 3)
+
+
+def test_display_frame_paints_the_fitted_frame():
+    pytest.importorskip("PyQt5")
+    from MotionTrackerBeta.widgets.gui import VideoWidget
+
+    images = []
+    label = SimpleNamespace(width=lambda: 400, height=lambda: 300, setImage=images.append)
+    widget = SimpleNamespace(VidLBL=label, display_buffer=None)
+    frame = gradient_frame(800, 400)
+    VideoWidget.displayFrame(widget, frame)
+    VideoWidget.displayFrame(widget, frame)
+
+    # the buffer is reused and the image shows it without a copy
+    assert len(images) == 2
+    image = images[-1]
+    assert (image.width(), image.height()) == (400, 200)
+    assert int(image.constBits()) == widget.display_buffer.ctypes.data
+    np.testing.assert_array_equal(widget.display_buffer, fit_frame(frame, 400, 300))
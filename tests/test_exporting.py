@@ -0,0 +1,101 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import cv2
+from MotionTrackerBeta.functions.exporting import export_video
+from tests.conftest import frame_number
+
+
+def export(video, filename, start, stop, **options):
+    """Exports the section of the video without objects, returns the result of the export"""
+    camera = cv2.VideoCapture(video)
+    try:
+        return export_video(camera, [], start, stop, filename, 30, True, True, 10, codec="MJPG", **options)
+    finally:
+        camera.release()
+
+
+def read_frames(filename):
+    """Every frame of the exported video"""
+    camera = cv2.VideoCapture(filename)
+    frames = []
+    while True:
+        ret, frame = camera.read()
+        if not ret:
+            break
+        frames.append(frame)
+    camera.release()
+    return frames
+
+
+def test_export_writes_the_section_in_order(tmp_path, numbered_video):
+    filename = str(tmp_path / "export.avi")
+    progress = []
+    ret, message = export(numbered_video, filename, 10, 70, progress=progress.append, workers=3, batch_size=4)
+    assert ret and message is None
+    assert [frame_number(frame) for frame in read_frames(filename)] == list(range(10, 70))
+    # progress is measured from the start of the section
+    assert progress == sorted(progress) and progress[0] < 20 and progress[-1] == 100
+
+
+def test_export_stops_when_cancelled(tmp_path, numbered_video):
+    filename = str(tmp_path / "export.avi")
+    progress = []
+    ret, message = export(
+        numbered_video,
+        filename,
+        0,
+        120,
+        progress=progress.append,
+        is_running=lambda: not progress,
+        workers=2,
+        batch_size=4,
+    )
+    assert not ret and message is None
+    assert len(read_frames(filename)) < 120
+
+
+def test_export_skips_frames_with_the_step(tmp_path, numbered_video):
+    filename = str(tmp_path / "export.avi")
+    ret, message = export(numbered_video, filename, 10, 70, step=3, batch_size=4)
+    assert ret
+    assert [frame_number(frame) for frame in read_frames(filename)] == list(range(10, 70, 3))
+    camera = cv2.VideoCapture(filename)
+    assert camera.get(cv2.CAP_PROP_FPS) == 10
+    camera.release()
+
+
+def test_export_scales_the_frames(tmp_path, numbered_video):
+    filename = str(tmp_path / "export.avi")
+    ret, message = export(numbered_video, filename, 0, 40, scale=0.5)
+    assert ret
+    frames = read_frames(filename)
+    assert frames[0].shape == (32, 64, 3)
+    numbers = [frame_number(cv2.resize(frame, (128, 64), interpolation=cv2.INTER_NEAREST)) for frame in frames]
+    assert numbers == list(range(40))
+
+
+def test_export_crops_to_the_roi(tmp_path, numbered_video):
+    filename = str(tmp_path / "export.avi")
+    # the corners may be given in any order
+    ret, message = export(numbered_video, filename, 0, 40, roi_rect=(64, 48, 0, 16))
+    assert ret
+    frames = read_frames(filename)
+    assert len(frames) == 40 and frames[0].shape == (32, 64, 3)
+    camera = cv2.VideoCapture(numbered_video)
+    for frame in frames:
+        read, source = camera.read()
+        assert abs(frame.astype(int) - source[16:48, :64]).mean() < 8
+    camera.release()
@@ -0,0 +1,197 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import threading
+import time
+import numpy as np
+import cv2
+from MotionTrackerBeta.classes.reader import (
+    CachedCapture,
+    FrameCache,
+    FrameReader,
+    IndexedCapture,
+    KeyframeIndex,
+    ProxyCache,
+    video_signature,
+)
+from tests.conftest import frame_number, write_video
+
+
+def test_frame_cache_is_limited_by_size():
+    cache = FrameCache(max_size=3 * 100)
+    for k in range(5):
+        cache.put(k, np.zeros(100, np.uint8))
+    assert [k in cache for k in range(5)] == [False, False, True, True, True]
+    cache.get(2)
+    cache.put(5, np.zeros(100, np.uint8))
+    assert 2 in cache and 3 not in cache
+
+
+def test_keyframe_index_is_built_and_cached(numbered_video, tmp_path):
+    index = KeyframeIndex.open(numbered_video)
+    assert index is not None
+    assert index.num_of_frames == 120
+    assert index.keyframes[0] == 0
+    assert 1 < len(index.keyframes) < 120
+    assert index.keyframe(index.keyframes[1] + 1) == index.keyframes[1]
+
+    # the second opening reads the cache
+    cached = KeyframeIndex.open(numbered_video)
+    assert cached.keyframes == index.keyframes
+
+
+def test_indexed_capture_seeks_exactly(numbered_video):
+    camera = IndexedCapture(numbered_video, KeyframeIndex.open(numbered_video))
+    for frame in (57, 3, 119, 58, 0):
+        assert camera.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        ret, image = camera.read()
+        assert ret and frame_number(image) == frame
+    camera.release()
+
+
+def test_frame_reader_skips_frames(numbered_video):
+    camera = cv2.VideoCapture(numbered_video)
+    reader = FrameReader(camera, 5, step=3)
+    reader.start()
+    numbers = [frame_number(reader.read()[1]) for _ in range(5)]
+    reader.stop()
+    camera.release()
+    assert numbers == [0, 3, 6, 9, 12]
+
+
+class BrokenCapture:
+    """Capture whose decoder raises after the given number of frames"""
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def grab(self):
+        return True
+
+    def read(self):
+        if self.frames == 0:
+            raise cv2.error("corrupt frame")
+        self.frames -= 1
+        return True, np.zeros((4, 4, 3), np.uint8)
+
+
+def test_frame_reader_reports_a_failing_decoder():
+    reader = FrameReader(BrokenCapture(2), 5)
+    reader.start()
+    results = [reader.read()[0] for _ in range(3)]
+    reader.stop()
+    assert results == [True, True, False]
+
+
+def test_cached_capture_serves_the_right_frames(numbered_video):
+    camera = CachedCapture(numbered_video, cache_size=16)
+    try:
+        numbers = [frame_number(camera.read()[1]) for _ in range(10)]
+        assert numbers == list(range(10))
+        camera.set(cv2.CAP_PROP_POS_FRAMES, 100)
+        ret, frame = camera.read()
+        assert ret and frame_number(frame) == 100
+        assert camera.get(cv2.CAP_PROP_POS_FRAMES) == 101
+
+        # drawing on a returned frame doesn't change the cache
+        frame[:] = 0
+        camera.set(cv2.CAP_PROP_POS_FRAMES, 100)
+        assert frame_number(camera.read()[1]) == 100
+    finally:
+        camera.release()
+
+
+def test_cached_capture_prefetches_only_what_fits_in_the_cache(numbered_video):
+    # 4 frames of 64x128 fit in the cache
+    camera = CachedCapture(numbered_video, cache_size=4 * 64 * 128 * 3 / 2 ** 20, prefetch=32)
+    try:
+        assert camera.prefetch == 3
+        camera.read()
+        deadline = time.time() + 5
+        while camera.missing(camera.num_of_frames) is not None and time.time() < deadline:
+            time.sleep(0.01)
+        # the prefetcher stops once the window is cached
+        assert camera.missing(camera.num_of_frames) is None
+        assert [k in camera.cache for k in range(5)] == [True, True, True, True, False]
+    finally:
+        camera.release()
+
+
+def test_cached_capture_prefetches_the_frames_after_the_skipped_ones(numbered_video):
+    camera = CachedCapture(numbered_video, cache_size=16)
+    try:
+        camera.set(cv2.CAP_PROP_POS_FRAMES, 60)
+        numbers = []
+        for _ in range(3):
+            ret, frame = camera.read()
+            numbers.append(frame_number(frame))
+            # skipped frames aren't decoded
+            assert all(camera.grab() for _ in range(3))
+        assert numbers == [60, 64, 68]
+        assert camera.grabbed == 71 and camera.retrieved == 68
+
+        deadline = time.time() + 5
+        while camera.missing(camera.num_of_frames) is not None and time.time() < deadline:
+            time.sleep(0.01)
+        # every fourth frame is prefetched up to the end of the video
+        assert camera.missing(camera.num_of_frames) is None
+        assert 116 in camera.cache and not any(k in camera.cache for k in (117, 118, 119))
+        assert frame_number(camera.read()[1]) == 72
+    finally:
+        camera.release()
+
+
+def test_keyframe_index_is_built_once_for_concurrent_openings(tmp_path, monkeypatch):
+    frames = [np.full((32, 32, 3), k, np.uint8) for k in range(30)]
+    video = write_video(str(tmp_path / "video.mp4"), frames, fourcc="mp4v")
+    builds = []
+    build = KeyframeIndex.build.__func__
+
+    def slow_build(cls, filename, is_running=None):
+        builds.append(filename)
+        time.sleep(0.2)
+        return build(cls, filename, is_running)
+
+    monkeypatch.setattr(KeyframeIndex, "build", classmethod(slow_build))
+    indices = []
+    threads = [threading.Thread(target=lambda: indices.append(KeyframeIndex.open(video))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert indices[0] is not None and all(index is indices[0] for index in indices)
+    assert sorted(os.listdir(tmp_path)) == ["video.mp4", "video.mp4" + KeyframeIndex.SUFFIX]
+
+
+def test_proxy_cache_is_saved_and_reused(tmp_path):
+    frames = [np.full((48, 64, 3), 4 * k, np.uint8) for k in range(40)]
+    video = write_video(str(tmp_path / "video.mp4"), frames, fourcc="mp4v")
+    proxies = ProxyCache(video, width=32, count=10)
+    proxies.start()
+    proxies.join()
+    assert len(proxies.proxies) == 10
+    assert proxies.get(8).shape == (24, 32, 3)
+
+    # the index of the proxies is the shared one, only the cache files are left next to the video
+    assert KeyframeIndex.open(video) is KeyframeIndex.opened[os.path.abspath(video)][1]
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["video.mp4", "video.mp4" + KeyframeIndex.SUFFIX, "video.mp4" + ProxyCache.SUFFIX]
+    )
+    cached = ProxyCache(video, width=32, count=10)
+    assert cached.load(video_signature(video))
+    assert len(cached.proxies) == 10
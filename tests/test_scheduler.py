@@ -0,0 +1,91 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from MotionTrackerBeta import scheduler
+from MotionTrackerBeta.scheduler import JobQueue, Scheduler
+
+
+def test_queue_adds_every_job_once(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    assert queue.add({"video": "a.mp4", "tracker": "KCF"})
+    assert not queue.add({"tracker": "KCF", "video": "a.mp4"})
+    assert queue.add({"video": "b.mp4"})
+    assert queue.counts() == {"pending": 2}
+    queue.close()
+
+
+def test_queue_claims_in_order_and_stores_the_outcome(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    queue.add({"video": "a.mp4"})
+    queue.add({"video": "b.mp4"})
+    job_id, job = queue.claim()
+    assert job == {"video": "a.mp4"}
+    queue.finish(job_id, True, "a.csv")
+    job_id, job = queue.claim()
+    queue.finish(job_id, False, "error")
+    assert queue.claim() is None
+    assert queue.counts() == {"done": 1, "failed": 1}
+
+    assert queue.retry_failed() == 1
+    assert queue.claim()[1] == {"video": "b.mp4"}
+    queue.close()
+
+
+def test_queue_resumes_the_jobs_of_a_crashed_run(tmp_path):
+    filename = str(tmp_path / "queue.db")
+    queue = JobQueue(filename)
+    queue.add({"video": "a.mp4"})
+    queue.claim()
+    queue.close()
+
+    # the running job was interrupted
+    queue = JobQueue(filename)
+    assert queue.counts() == {"running": 1}
+    assert queue.resume() == 1
+    assert queue.claim()[1] == {"video": "a.mp4"}
+    queue.close()
+
+
+def test_job_cost_counts_the_tracker_threads(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    engine = Scheduler(queue, cpus=8, memory=1000, workers=3, processes=2)
+    assert engine.cost({"video": "missing.mp4"})[0] == 6
+
+    # the threads of a job are limited to the CPU budget
+    engine = Scheduler(queue, cpus=4, memory=1000, workers=16, processes=2)
+    assert engine.job_workers() == 2
+    assert engine.cost({"video": "missing.mp4"})[0] == 4
+    queue.close()
+
+
+def crash_or_save(job, *args):
+    """Stands in for a job, the worker process dies on the crash job"""
+    if job["video"] == "crash.mp4":
+        os._exit(1)
+    return True, job["video"]
+
+
+def test_dead_worker_fails_only_its_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, "run_queued_job", crash_or_save)
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    for video in ("a.mp4", "crash.mp4", "b.mp4", "c.mp4"):
+        queue.add({"video": video})
+    messages = []
+    engine = Scheduler(queue, cpus=4, memory=1000, message=messages.append)
+    assert engine.run() == 1
+    assert queue.counts() == {"done": 3, "failed": 1}
+    assert any(text.startswith("Failed crash.mp4") for text in messages)
+    queue.close()
@@ -0,0 +1,401 @@
+# Copyright 2022 Kristof Floch
+ 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import threading
+import time
+import numpy as np
+import cv2
+import pytest
+from MotionTrackerBeta.classes.classes import Trajectory
+from MotionTrackerBeta.classes.reader import CachedCapture, IndexedCapture, KeyframeIndex
+from MotionTrackerBeta.functions.tracking import (
+    ArucoTracker,
+    BlobTracker,
+    CoarseToFine,
+    FlowTracker,
+    SectionTracker,
+    diverged_chunks,
+    split_section,
+    stitch_chunks,
+    track_objects,
+)
+from tests.conftest import moving_patches, write_video
+
+
+def patch_objects(positions, patch=32):
+    """(point, rectangle) of the patches on the first frame, the point is the center of the patch"""
+    return [
+        ((round(x) + patch / 2, round(y) + patch / 2), (round(x), round(y), patch, patch))
+        for x, y in positions[0]
+    ]
+
+
+def path_error(paths, positions, patch=32):
+    """Largest distance of the tracked points from the centers of the patches"""
+    truth = np.round(positions) + patch / 2
+    return max(
+        np.abs(point_path.array - truth[: len(point_path), i]).max()
+        for i, (rectangle_path, point_path, size_change) in enumerate(paths)
+    )
+
+
+def test_split_section_covers_the_section():
+    chunks = split_section(1, 101, 4, 10)
+    assert chunks[0] == (1, 1, 26)
+    assert [boundary for first, boundary, last in chunks] == [1, 26, 51, 76]
+    assert chunks[-1][2] == 101
+    for (_, _, last), (first, boundary, _) in zip(chunks, chunks[1:]):
+        assert boundary == last
+        assert first == boundary - 10
+
+
+def chunk_paths(chunks, path):
+    """Paths of the chunks cut from a single path of one object"""
+    results = []
+    for first, boundary, last in chunks:
+        part = Trajectory(2)
+        part.extend(path[first - 1 : last])
+        results.append([(Trajectory(4), part, Trajectory())])
+    return results
+
+
+def test_stitched_chunks_equal_the_whole_path():
+    path = np.column_stack((np.arange(101.0), np.arange(101.0) * 2))
+    chunks = split_section(1, 101, 3, 5)
+    results = chunk_paths(chunks, path)
+    assert diverged_chunks(chunks, results, 0.5) == []
+
+    (rectangle_path, point_path, size_change), = stitch_chunks(chunks, results)
+    np.testing.assert_array_equal(point_path.array, path)
+
+
+def test_diverged_chunk_is_found():
+    path = np.column_stack((np.arange(101.0), np.zeros(101)))
+    chunks = split_section(1, 101, 3, 5)
+    results = chunk_paths(chunks, path)
+    results[2][0][1].data[: len(results[2][0][1])] += 10
+    assert diverged_chunks(chunks, results, 5.0) == [2]
+
+
+@pytest.mark.parametrize("tracker_type", ["KCF", "CSRT", "LK-FLOW"])
+def test_track_objects_follows_the_patches(patch_video, tracker_type):
+    filename, positions = patch_video
+    camera = cv2.VideoCapture(filename)
+    ret, paths = track_objects(camera, patch_objects(positions), 1, 90, tracker_type, False, (0, 0))
+    camera.release()
+    assert ret, paths
+    assert all(len(point_path) == 90 for rectangle_path, point_path, size_change in paths)
+    assert path_error(paths, positions) <= 3
+
+
+def test_roi_keeps_full_frame_coordinates(patch_video):
+    filename, positions = patch_video
+    camera = cv2.VideoCapture(filename)
+    ret, paths = track_objects(
+        camera, patch_objects(positions), 1, 90, "LK-FLOW", False, (10, 20, 310, 235)
+    )
+    camera.release()
+    assert ret, paths
+    assert path_error(paths, positions) <= 1
+
+
+def test_section_tracker_in_processes_matches_single_process(patch_video):
+    filename, positions = patch_video
+    camera = cv2.VideoCapture(filename)
+    objects = patch_objects(positions)
+    ret, single = SectionTracker(camera, 1, 60, "KCF", False, None).track(objects)
+    ret2, shared = SectionTracker(
+        camera, 1, 60, "KCF", False, None, processes=2, filename=filename
+    ).track(objects)
+    camera.release()
+    assert ret and ret2
+    for a, b in zip(single, shared):
+        np.testing.assert_allclose(a[1].array, b[1].array)
+
+
+def test_processes_ignore_the_locks_held_by_other_threads(patch_video):
+    filename, positions = patch_video
+    camera = cv2.VideoCapture(filename)
+
+    # the prefetcher of the playback is building the keyframe index
+    with KeyframeIndex.guard:
+        lock = KeyframeIndex.locks.setdefault(os.path.abspath(filename), threading.Lock())
+    with lock:
+        ret, paths = SectionTracker(
+            camera, 1, 30, "KCF", False, None, processes=2, filename=filename
+        ).track(patch_objects(positions))
+    camera.release()
+    assert ret, paths
+
+
+def test_coarse_to_fine_refines_to_full_resolution(patch_video):
+    filename, positions = patch_video
+    camera = cv2.VideoCapture(filename)
+    ret, paths = track_objects(
+        camera, patch_objects(positions), 1, 90, "KCF", False, (0, 0), downscale=2
+    )
+    camera.release()
+    assert ret, paths
+    assert path_error(paths, positions) <= 1
+
+
+def test_coarse_to_fine_keeps_boxes_at_the_edge():
+    frame = np.zeros((100, 100, 3), np.uint8)
+    pyramid = CoarseToFine(2)
+    assert pyramid.init(frame, [(0, 0, 20, 20), (40, 50, 1, 1)]) == [(0, 0, 10, 10), (20, 25, 1, 1)]
+
+
+class CountingCapture:
+    """cv2.VideoCapture that counts the decoded frames"""
+
+    def __init__(self, filename):
+        self.camera = cv2.VideoCapture(filename)
+        self.reads = 0
+
+    def set(self, prop, value):
+        return self.camera.set(prop, value)
+
+    def get(self, prop):
+        return self.camera.get(prop)
+
+    def grab(self):
+        return self.camera.grab()
+
+    def read(self):
+        self.reads += 1
+        return self.camera.read()
+
+
+@pytest.mark.parametrize("tracker_type", ["KCF", "LK-FLOW"])
+def test_stride_is_as_accurate_as_every_frame(patch_video, tracker_type):
+    filename, positions = patch_video
+    errors = []
+    for stride in (1, 4):
+        camera = cv2.VideoCapture(filename)
+        ret, paths = track_objects(
+            camera, patch_objects(positions), 1, 90, tracker_type, False, (0, 0), stride=stride
+        )
+        camera.release()
+        assert ret, paths
+        assert all(len(point_path) == 90 for rectangle_path, point_path, size_change in paths)
+        errors.append(path_error(paths, positions))
+    assert errors[1] <= errors[0] + 1
+
+
+@pytest.mark.parametrize("tracker_type", ["KCF", "LK-FLOW"])
+def test_stride_skips_the_frames_of_slow_objects(tmp_path, tracker_type):
+    t = np.arange(120)
+    positions = np.stack(
+        (
+            np.column_stack((60 + 40 * np.sin(t / 40), 150 + 30 * np.cos(t / 50))),
+            np.column_stack((220 + 25 * np.cos(t / 45), 100 + 40 * np.sin(t / 35))),
+        ),
+        axis=1,
+    )
+    filename = write_video(str(tmp_path / "slow.avi"), moving_patches(positions))
+    errors = []
+    for stride in (1, 4):
+        camera = CountingCapture(filename)
+        ret, paths = track_objects(
+            camera, patch_objects(positions), 1, 120, tracker_type, False, (0, 0), stride=stride
+        )
+        assert ret, paths
+        errors.append(path_error(paths, positions))
+    # only a part of the frames was decoded
+    assert camera.reads < 90
+    assert errors[1] <= errors[0] + 1
+
+
+def test_stride_retrieves_only_the_tracked_frames_of_the_cached_capture(tmp_path, monkeypatch):
+    t = np.arange(300)
+    positions = np.stack(
+        (
+            np.column_stack((60 + 40 * np.sin(t / 80), 150 + 30 * np.cos(t / 90))),
+            np.column_stack((220 + 25 * np.cos(t / 85), 100 + 40 * np.sin(t / 75))),
+        ),
+        axis=1,
+    )
+    filename = write_video(str(tmp_path / "slow.avi"), moving_patches(positions))
+
+    # retrieves of the playhead and of the prefetcher
+    retrieves = []
+    retrieve = IndexedCapture.retrieve
+    monkeypatch.setattr(IndexedCapture, "retrieve", lambda self: retrieves.append(1) or retrieve(self))
+
+    camera = CachedCapture(filename)
+    try:
+        deadline = time.time() + 5
+        while camera.missing(camera.num_of_frames) is not None and time.time() < deadline:
+            time.sleep(0.01)
+        retrieves.clear()
+        ret, paths = track_objects(
+            camera, patch_objects(positions), 1, 300, "LK-FLOW", False, (0, 0), stride=8
+        )
+    finally:
+        camera.release()
+    assert ret, paths
+    assert path_error(paths, positions) < 3
+    # the skipped frames are neither converted nor prefetched
+    assert len(retrieves) < 200
+
+
+def test_flow_tracker_moves_the_boxes():
+    rng = np.random.default_rng(1)
+    frame = cv2.GaussianBlur(rng.integers(0, 255, (120, 160, 3), dtype=np.uint8), (0, 0), 2)
+    shifted = np.roll(frame, (3, 5), axis=(0, 1))
+    tracker = FlowTracker()
+    assert tracker.init(frame, [(50, 40, 20, 20)], [(60, 50)]) == (True, None)
+    (ok, box), = tracker.update(shifted)
+    assert ok
+    np.testing.assert_allclose(box[:2], (55, 43), atol=0.2)
+
+
+def dot_frame(centers, size=(200, 200)):
+    """Dark frame with bright round dots"""
+    frame = np.zeros(size + (3,), np.uint8)
+    for x, y in centers:
+        cv2.circle(frame, (int(round(x)), int(round(y))), 5, (255, 255, 255), -1)
+    return frame
+
+
+def test_blob_tracker_keeps_the_identity_of_identical_dots():
+    centers = np.array([(40.0, 40.0), (100.0, 40.0), (40.0, 120.0), (150.0, 150.0)])
+    velocity = np.array([(2.0, 0.0), (-2.0, 1.0), (1.0, -2.0), (-1.0, -1.0)])
+    tracker = BlobTracker()
+    boxes = [(x - 8, y - 8, 16, 16) for x, y in centers]
+    assert tracker.init(dot_frame(centers), boxes, centers) == (True, None)
+    for k in range(1, 15):
+        results = tracker.update(dot_frame(centers + k * velocity))
+        assert all(ok for ok, box in results)
+    final = np.array([box[:2] for ok, box in results]) + 8
+    np.testing.assert_allclose(final, centers + 14 * velocity, atol=1)
+
+
+def test_blob_tracker_needs_a_blob_for_every_object():
+    tracker = BlobTracker()
+    boxes = [(30, 30, 16, 16), (32, 32, 16, 16)]
+    ret, message = tracker.init(dot_frame([(40, 40)]), boxes, [(39, 40), (41, 40)])
+    assert not ret and message
+
+
+def marker_frame(corners, ids, size=(240, 320)):
+    """White frame with ArUco markers of the given ids at the given top left corners"""
+    frame = np.full(size + (3,), 255, np.uint8)
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_5X5_1000)
+    for (x, y), marker in zip(corners, ids):
+        image = cv2.aruco.generateImageMarker(dictionary, marker, 50)
+        frame[y : y + 50, x : x + 50] = image[:, :, None]
+    return frame
+
+
+def test_aruco_tracker_follows_the_markers():
+    corners = [(30, 30), (200, 100)]
+    tracker = ArucoTracker()
+    boxes = [(x, y, 50, 50) for x, y in corners]
+    points = [(x + 25, y + 25) for x, y in corners]
+    assert tracker.init(marker_frame(corners, [7, 42]), boxes, points) == (True, None)
+    moved = [(40, 35), (190, 110)]
+    results = tracker.update(marker_frame(moved, [7, 42]))
+    for (ok, box), (x, y) in zip(results, moved):
+        assert ok
+        np.testing.assert_allclose(box[:2], (x, y), atol=1)
+
+
+def test_failing_process_group_reports_its_error(patch_video):
+    filename, positions = patch_video
+    camera = cv2.VideoCapture(filename)
+    objects = patch_objects(positions)
+    objects[1] = (objects[1][0], (0, 0, 0, 0))
+    ret, result = SectionTracker(camera, 1, 90, "KCF", False, None).track(objects)
+    assert (ret, result) == (False, "Unable to initialize the tracker!")
+    ret, result = SectionTracker(
+        camera, 1, 90, "KCF", False, None, processes=2, filename=filename
+    ).track(objects)
+    camera.release()
+    assert (ret, result) == (False, "Unable to initialize the tracker!")
+
+
+def test_time_chunks_match_single_process_tracking(patch_video):
+    filename, positions = patch_video
+    camera = cv2.VideoCapture(filename)
+    ret, single = SectionTracker(camera, 1, 90, "KCF", False, None).track(patch_objects(positions))
+    ret2, chunked = SectionTracker(
+        camera,
+        1,
+        90,
+        "KCF",
+        False,
+        None,
+        filename=filename,
+        chunks=3,
+        chunk_overlap=5,
+        seed_tracker_type="KCF",
+    ).track(patch_objects(positions))
+    camera.release()
+    assert ret and ret2, chunked
+    assert all(len(point_path) == 90 for rectangle_path, point_path, size_change in chunked)
+    assert path_error(chunked, positions) <= path_error(single, positions) + 1
+    for a, b in zip(single, chunked):
+        np.testing.assert_allclose(a[1].array, b[1].array, atol=3)
+
+
+def test_failing_time_chunk_reports_its_error(tmp_path):
+    # static texture, the marker next to the point disappears on frame 140
+    rng = np.random.default_rng(3)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (240, 320, 3), dtype=np.uint8), (0, 0), 2)
+    with_marker = background.copy()
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_5X5_1000)
+    with_marker[60:140, 160:240] = 255
+    with_marker[70:130, 170:230] = cv2.aruco.generateImageMarker(dictionary, 3, 60)[:, :, None]
+    frames = [with_marker if k < 140 else background for k in range(300)]
+    filename = write_video(str(tmp_path / "marker.avi"), frames)
+
+    # the second chunk starts without the marker, the first one tolerates the missing frames
+    objects = [((130, 100), (110, 50, 40, 100))]
+    camera = cv2.VideoCapture(filename)
+    ret, result = SectionTracker(
+        camera,
+        1,
+        300,
+        "ARUCO",
+        False,
+        None,
+        filename=filename,
+        chunks=2,
+        chunk_overlap=5,
+        seed_tracker_type="KCF",
+    ).track(objects)
+    camera.release()
+    assert not ret
+    assert result is not None and "ArUco" in result
+
+
+def test_session_timestamps_use_a_new_file_every_run(patch_video, tmp_path):
+    filename, positions = patch_video
+    camera = cv2.VideoCapture(filename)
+    engine = SectionTracker(camera, 1, 30, "KCF", False, None, session_dir=str(tmp_path))
+    ret, paths = engine.track(patch_objects(positions))
+    assert ret
+    timestamp = engine.timestamps(30)
+    first = timestamp.filename
+    np.testing.assert_allclose(timestamp.array, np.arange(30) / 30)
+
+    # the next run doesn't reuse the mapped file of the previous one
+    timestamp = engine.timestamps(60, timestamp)
+    camera.release()
+    assert timestamp.filename != first
+    assert not os.path.exists(first)
+    np.testing.assert_allclose(timestamp.array, np.arange(30) / 60)